@@ -0,0 +1,55 @@
+"""add corpus reuse options
+
+Revision ID: 7b2e4f1a9c3d
+Revises: f038cf0c5393
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7b2e4f1a9c3d'
+down_revision: Union[str, Sequence[str], None] = 'f038cf0c5393'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _columns(table: str):
+    """Columnas actuales de la tabla, o None si no existe (BD nueva: la crea `create_all` al arrancar la app)."""
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table(table):
+        return None
+    return {column['name'] for column in inspector.get_columns(table)}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    room_columns = _columns('rooms')
+    if room_columns is not None:
+        with op.batch_alter_table('rooms') as batch_op:
+            if 'reuse_existing_cards' not in room_columns:
+                batch_op.add_column(sa.Column('reuse_existing_cards', sa.Boolean(), nullable=True))
+            if 'reuse_same_personality' not in room_columns:
+                batch_op.add_column(sa.Column('reuse_same_personality', sa.Boolean(), nullable=False, server_default=sa.false()))
+
+    card_columns = _columns('cards')
+    if card_columns is not None and 'personality_id' not in card_columns:
+        with op.batch_alter_table('cards') as batch_op:
+            batch_op.add_column(sa.Column('personality_id', sa.Integer(), nullable=True))
+            batch_op.create_index(batch_op.f('ix_cards_personality_id'), ['personality_id'], unique=False)
+            batch_op.create_foreign_key('fk_cards_personality_id', 'personalities', ['personality_id'], ['id'], ondelete='SET NULL')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('cards') as batch_op:
+        batch_op.drop_constraint('fk_cards_personality_id', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_cards_personality_id'))
+        batch_op.drop_column('personality_id')
+    with op.batch_alter_table('rooms') as batch_op:
+        batch_op.drop_column('reuse_same_personality')
+        batch_op.drop_column('reuse_existing_cards')
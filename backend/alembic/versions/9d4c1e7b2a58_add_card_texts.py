@@ -0,0 +1,106 @@
+"""add card texts
+
+Revision ID: 9d4c1e7b2a58
+Revises: 7b2e4f1a9c3d
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+import hashlib
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d4c1e7b2a58'
+down_revision: Union[str, Sequence[str], None] = '7b2e4f1a9c3d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Textos por tanda al rellenar card_texts (por debajo del límite de parámetros de SQLite)
+BACKFILL_BATCH_SIZE = 900
+
+
+def _text_hash(text: str) -> str:
+    # Debe coincidir con crud.card_text_hash (sha256 del texto en UTF-8, en hexadecimal)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _text_ids(bind, card_texts, hashes) -> dict:
+    return dict(bind.execute(sa.select(card_texts.c.hash, card_texts.c.id).where(card_texts.c.hash.in_(list(hashes)))).all())
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    # BD nueva: las tablas las crea `create_all` al arrancar la app, ya con el esquema nuevo
+    if not inspector.has_table('cards'):
+        return
+    if 'text_id' in {column['name'] for column in inspector.get_columns('cards')}:
+        return
+
+    if not inspector.has_table('card_texts'):
+        op.create_table(
+            'card_texts',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('hash', sa.String(length=64), nullable=False),
+            sa.Column('text', sa.Text(), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('hash'),
+        )
+        op.create_index(op.f('ix_card_texts_id'), 'card_texts', ['id'], unique=False)
+    with op.batch_alter_table('cards') as batch_op:
+        batch_op.add_column(sa.Column('text_id', sa.Integer(), nullable=True))
+
+    # Cada texto distinto se guarda una sola vez (sin espacios alrededor, como en crud.make_cards)
+    # y las cartas pasan a apuntar a él. El hash se calcula aquí y no en SQL para que la migración
+    # funcione igual en PostgreSQL y en SQLite. La correspondencia texto original -> card_texts.id
+    # va a una tabla temporal indexada, y con ella se rellenan todas las cartas en un solo UPDATE.
+    card_texts = sa.table('card_texts', sa.column('id', sa.Integer), sa.column('hash', sa.String), sa.column('text', sa.Text))
+    cards = sa.table('cards', sa.column('text', sa.Text), sa.column('text_id', sa.Integer))
+    backfill = op.create_table(
+        'card_text_backfill',
+        sa.Column('raw_text', sa.Text(), nullable=False),
+        sa.Column('text_id', sa.Integer(), nullable=False),
+    )
+    op.create_index('ix_card_text_backfill_raw_text', 'card_text_backfill', ['raw_text'], unique=False)
+
+    raw_texts = [text for text in bind.execute(sa.select(cards.c.text).distinct()).scalars() if text is not None]
+    for start in range(0, len(raw_texts), BACKFILL_BATCH_SIZE):
+        hashes = {raw: _text_hash(raw.strip()) for raw in raw_texts[start:start + BACKFILL_BATCH_SIZE]}
+        ids_by_hash = _text_ids(bind, card_texts, hashes.values())
+        new_rows = {text_hash: raw.strip() for raw, text_hash in hashes.items() if text_hash not in ids_by_hash}
+        if new_rows:
+            op.bulk_insert(card_texts, [{"hash": text_hash, "text": text} for text_hash, text in new_rows.items()])
+            ids_by_hash.update(_text_ids(bind, card_texts, new_rows))
+        op.bulk_insert(backfill, [{"raw_text": raw, "text_id": ids_by_hash[text_hash]} for raw, text_hash in hashes.items()])
+
+    op.execute(
+        "UPDATE cards SET text_id = (SELECT card_text_backfill.text_id FROM card_text_backfill "
+        "WHERE card_text_backfill.raw_text = cards.text)"
+    )
+    op.drop_index('ix_card_text_backfill_raw_text', table_name='card_text_backfill')
+    op.drop_table('card_text_backfill')
+
+    with op.batch_alter_table('cards') as batch_op:
+        batch_op.alter_column('text_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.create_index(batch_op.f('ix_cards_text_id'), ['text_id'], unique=False)
+        batch_op.create_foreign_key('fk_cards_text_id', 'card_texts', ['text_id'], ['id'])
+        batch_op.drop_column('text')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('cards') as batch_op:
+        batch_op.add_column(sa.Column('text', sa.Text(), nullable=True))
+    op.execute("UPDATE cards SET text = (SELECT card_texts.text FROM card_texts WHERE card_texts.id = cards.text_id)")
+    with op.batch_alter_table('cards') as batch_op:
+        batch_op.alter_column('text', existing_type=sa.Text(), nullable=False)
+        batch_op.drop_constraint('fk_cards_text_id', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_cards_text_id'))
+        batch_op.drop_column('text_id')
+    op.drop_index(op.f('ix_card_texts_id'), table_name='card_texts')
+    op.drop_table('card_texts')
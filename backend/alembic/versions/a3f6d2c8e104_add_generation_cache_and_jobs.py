@@ -0,0 +1,70 @@
+"""add generation cache and jobs
+
+Revision ID: a3f6d2c8e104
+Revises: 9d4c1e7b2a58
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3f6d2c8e104'
+down_revision: Union[str, Sequence[str], None] = '9d4c1e7b2a58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    inspector = sa.inspect(op.get_bind())
+
+    # Caché persistente de lotes generados (puede existir ya si la creó `create_all` al arrancar)
+    if not inspector.has_table('generation_cache'):
+        op.create_table(
+            'generation_cache',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('key', sa.String(length=64), nullable=False),
+            sa.Column('topic_key', sa.String(length=64), nullable=False),
+            sa.Column('card_type', sa.String(), nullable=False),
+            sa.Column('payload', sa.JSON(), nullable=False),
+            sa.Column('hit_count', sa.Integer(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=False),
+            sa.Column('last_accessed_at', sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index(op.f('ix_generation_cache_id'), 'generation_cache', ['id'], unique=False)
+        op.create_index(op.f('ix_generation_cache_key'), 'generation_cache', ['key'], unique=True)
+        op.create_index(op.f('ix_generation_cache_topic_key'), 'generation_cache', ['topic_key'], unique=False)
+        op.create_index(op.f('ix_generation_cache_last_accessed_at'), 'generation_cache', ['last_accessed_at'], unique=False)
+
+    # Trabajos de la cola de generación pendientes o en curso
+    if not inspector.has_table('generation_jobs'):
+        op.create_table(
+            'generation_jobs',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('kind', sa.String(), nullable=False),
+            sa.Column('priority', sa.Integer(), nullable=False),
+            sa.Column('topic_id', sa.Integer(), nullable=False),
+            sa.Column('payload', sa.JSON(), nullable=False),
+            sa.Column('room_code', sa.String(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index(op.f('ix_generation_jobs_id'), 'generation_jobs', ['id'], unique=False)
+        op.create_index(op.f('ix_generation_jobs_topic_id'), 'generation_jobs', ['topic_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_generation_jobs_topic_id'), table_name='generation_jobs')
+    op.drop_index(op.f('ix_generation_jobs_id'), table_name='generation_jobs')
+    op.drop_table('generation_jobs')
+    op.drop_index(op.f('ix_generation_cache_last_accessed_at'), table_name='generation_cache')
+    op.drop_index(op.f('ix_generation_cache_topic_key'), table_name='generation_cache')
+    op.drop_index(op.f('ix_generation_cache_key'), table_name='generation_cache')
+    op.drop_index(op.f('ix_generation_cache_id'), table_name='generation_cache')
+    op.drop_table('generation_cache')
@@ -0,0 +1,37 @@
+"""add card text minhash
+
+Revision ID: c4b8e1f7d2a9
+Revises: a3f6d2c8e104
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4b8e1f7d2a9'
+down_revision: Union[str, Sequence[str], None] = 'a3f6d2c8e104'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    inspector = sa.inspect(op.get_bind())
+    # BD nueva: la tabla la crea `create_all` al arrancar la app, ya con la columna
+    if not inspector.has_table('card_texts'):
+        return
+    if 'minhash' in {column['name'] for column in inspector.get_columns('card_texts')}:
+        return
+    # Las firmas se calculan y guardan la primera vez que se indexa cada tema
+    with op.batch_alter_table('card_texts') as batch_op:
+        batch_op.add_column(sa.Column('minhash', sa.LargeBinary(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('card_texts') as batch_op:
+        batch_op.drop_column('minhash')
@@ -0,0 +1,45 @@
+"""key generation cache by topic id
+
+Revision ID: e5a9c3f1b7d6
+Revises: c4b8e1f7d2a9
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5a9c3f1b7d6'
+down_revision: Union[str, Sequence[str], None] = 'c4b8e1f7d2a9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    inspector = sa.inspect(op.get_bind())
+    # BD nueva: la tabla la crea `create_all` al arrancar la app, ya con la columna
+    if not inspector.has_table('generation_cache'):
+        return
+    if 'topic_key' not in {column['name'] for column in inspector.get_columns('generation_cache')}:
+        return
+    # Es una caché: las entradas viejas (por hash del prompt, sin tema) no se pueden asignar a un tema y se descartan
+    op.execute(sa.text("DELETE FROM generation_cache"))
+    with op.batch_alter_table('generation_cache') as batch_op:
+        batch_op.drop_index('ix_generation_cache_topic_key')
+        batch_op.drop_column('topic_key')
+        batch_op.add_column(sa.Column('topic_id', sa.Integer(), nullable=False))
+        batch_op.create_index(batch_op.f('ix_generation_cache_topic_id'), ['topic_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(sa.text("DELETE FROM generation_cache"))
+    with op.batch_alter_table('generation_cache') as batch_op:
+        batch_op.drop_index(batch_op.f('ix_generation_cache_topic_id'))
+        batch_op.drop_column('topic_id')
+        batch_op.add_column(sa.Column('topic_key', sa.String(length=64), nullable=False))
+        batch_op.create_index('ix_generation_cache_topic_key', ['topic_key'], unique=False)
@@ -10,6 +10,104 @@ class Settings(BaseSettings):
     ROOM_EXPIRATION_MINUTES: int = 60
     VERCEL_FRONTEND_URL: str
 
+    # Envío por WebSocket: cola de salida por conexión
+    WS_SEND_QUEUE_MAX_FRAMES: int = 64 # Mensajes pendientes por conexión antes de desconectar a un cliente lento
+    WS_SEND_TIMEOUT_SECONDS: float = 10 # Tiempo máximo de un envío a un socket
+    WS_RECONNECT_GRACE_SECONDS: float = 30 # Tiempo que conserva su sitio un jugador desconectado por ir lento antes de sacarlo de la sala
+    WS_MSGPACK_ENABLED: bool = True # Acepta el subprotocolo "msgpack.v1" si el cliente lo pide (requiere msgpack)
+    WS_BROADCAST_WINDOW_SECONDS: float = 0.05 # Las acciones de una sala dentro de esta ventana salen en un solo envío (0 = sin agrupar)
+
+    # Generación de cartas con IA
+    GENERATION_PROVIDER: str = "gemini" # "gemini" o "fake" (local y determinista, para pruebas de carga)
+    GEMINI_MODEL_NAME: str = "gemini-flash-latest" # Modelo por defecto si un nivel no tiene lista propia
+    GENERATION_INTERACTIVE_MODELS: str = "gemini-flash-latest,gemini-flash-lite-latest" # Por preferencia, separados por comas
+    GENERATION_BACKGROUND_MODELS: str = "gemini-flash-lite-latest,gemini-flash-latest" # Reposiciones y recargas sin jugadores esperando
+    GEMINI_CONTEXT_CACHE_ENABLED: bool = True # Cachea la instrucción de sistema de cada (tema, personalidad)
+    GEMINI_CONTEXT_CACHE_TTL_SECONDS: int = 3600
+    GEMINI_CONTEXT_CACHE_MAX_ENTRIES: int = 100
+    GEMINI_MAX_CONCURRENT_GENERATIONS: int = 4 # Llamadas simultáneas a la IA por proceso
+    GEMINI_INTERACTIVE_RESERVED_GENERATIONS: int = 1 # De ellas, las que recargas y reposiciones no pueden ocupar
+    GENERATION_CHUNK_SIZE: int = 25 # Cartas por sub-petición al dividir lotes grandes
+    GENERATION_FANOUT: int = 4 # Sub-peticiones simultáneas por lote
+    GENERATION_CHUNK_RETRIES: int = 1 # Reintentos de cada sub-petición fallida
+    GENERATION_QUEUE_WORKERS: int = 4 # Trabajos de generación (arranques, recargas, reposiciones) a la vez
+    GENERATION_QUEUE_INTERACTIVE_RESERVED_WORKERS: int = 1 # De ellos, los que recargas y reposiciones no pueden ocupar
+
+    # Caché de respuestas de la IA
+    GENERATION_CACHE_ENABLED: bool = True
+    GENERATION_CACHE_MAX_ENTRIES: int = 2000 # Al superarlo se expulsan las menos usadas recientemente
+    GENERATION_CACHE_TTL_MINUTES: int = 1440 # 24 horas
+    GENERATION_OUTPUT_FORMAT: str = "lines" # "lines" (una carta por línea, menos tokens) o "json" (esquema estructurado)
+    GENERATION_CALL_TIMEOUT_SECONDS: float = 90 # Tiempo máximo de una llamada a la IA
+
+    # Resiliencia frente a degradaciones de la IA
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD: int = 5 # Fallos seguidos que abren el circuito
+    CIRCUIT_BREAKER_SLOW_CALL_SECONDS: float = 45 # Llamadas más lentas cuentan como fallo
+    CIRCUIT_BREAKER_OPEN_SECONDS: float = 30 # Tiempo con el circuito abierto antes de probar de nuevo
+    HEDGE_ENABLED: bool = True
+    HEDGE_PERCENTILE: float = 0.95 # Se duplica la petición al superar este percentil de latencia
+    HEDGE_MIN_DELAY_SECONDS: float = 5
+    HEDGE_MIN_SAMPLES: int = 20 # Latencias observadas necesarias antes de duplicar peticiones
+    RETRY_BUDGET_RATIO: float = 0.2 # Reintentos que gana cada petición original
+    RETRY_BUDGET_MAX_TOKENS: float = 10
+
+    # Enrutado de modelos por latencia y errores
+    MODEL_ROUTER_WINDOW_SECONDS: float = 300 # Ventana de latencias y errores observados por modelo
+    MODEL_ROUTER_MIN_SAMPLES: int = 5 # Llamadas necesarias antes de juzgar un modelo
+    MODEL_ROUTER_SLOW_SECONDS: float = 20 # Por encima de esta latencia (en el percentil) el modelo se considera lento
+    MODEL_ROUTER_LATENCY_PERCENTILE: float = 0.9
+    MODEL_ROUTER_MAX_ERROR_RATE: float = 0.3
+
+    # Proveedor falso: latencia, fallos y ritmo del stream simulados
+    FAKE_PROVIDER_LATENCY_DISTRIBUTION: str = "lognormal" # "fixed", "uniform", "normal" o "lognormal"
+    FAKE_PROVIDER_LATENCY_MS: int = 1500
+    FAKE_PROVIDER_LATENCY_SPREAD_MS: int = 500
+    FAKE_PROVIDER_FAILURE_RATE: float = 0.0
+    FAKE_PROVIDER_STREAM_CHUNK_CHARS: int = 80
+    FAKE_PROVIDER_STREAM_DELAY_MS: int = 30
+    FAKE_PROVIDER_RANDOM_SEED: int = 42
+
+    # Pool de mazos pregenerados por (tema, personalidad)
+    DECK_POOL_ENABLED: bool = True
+    DECK_POOL_LOW_WATERMARK: int = 1 # Por debajo de este número de mazos se repone
+    DECK_POOL_HIGH_WATERMARK: int = 2 # Se repone hasta alcanzar este número
+    DECK_POOL_REFILL_CONCURRENCY: int = 2 # Reposiciones simultáneas en segundo plano
+    DECK_POOL_MAX_PAIRS: int = 8 # Pares precalentados a la vez; se registran al usarse y sale el usado hace más tiempo
+
+    # Detección de cartas casi duplicadas por tema (MinHash + LSH)
+    CARD_DEDUP_ENABLED: bool = True
+    CARD_DEDUP_THRESHOLD: float = 0.6 # Similitud de Jaccard estimada a partir de la cual dos cartas son la misma
+    CARD_DEDUP_NUM_PERM: int = 32 # Longitud de la firma MinHash
+    CARD_DEDUP_BANDS: int = 16 # Bandas del LSH (filas por banda = NUM_PERM / BANDS)
+    CARD_DEDUP_SHINGLE_SIZE: int = 4 # Caracteres por shingle
+    CARD_DEDUP_MAX_ROUNDS: int = 2 # Peticiones extra para cubrir las cartas descartadas por repetidas
+    CARD_DEDUP_MAX_INDEXED_CARDS: int = 200000 # Cartas indexadas en memoria; por encima se descarga el tema usado hace más tiempo
+
+    # Validación de las cartas generadas (las de tema llevan exactamente un hueco "______")
+    CARD_THEME_MIN_CHARS: int = 10
+    CARD_THEME_MAX_CHARS: int = 280
+    CARD_RESPONSE_MIN_CHARS: int = 2
+    CARD_RESPONSE_MAX_CHARS: int = 150
+    CARD_REPLACEMENT_MAX_ROUNDS: int = 2 # Rondas de regeneración de las cartas descartadas
+    CARD_REPLACEMENT_CHUNK_SIZE: int = 5 # Cartas por petición al regenerar descartadas
+
+    # Moderación de cartas generadas y temas personalizados
+    MODERATION_ENABLED: bool = True
+    MODERATION_BLOCKLIST: str = "" # Términos separados por comas; con "*" final bloquea también las palabras que empiezan así
+    MODERATION_BLOCKLIST_FILE: str = "" # Fichero opcional con un término por línea ("#" para comentarios)
+    MODERATION_ALLOWLIST: str = "" # Frases permitidas aunque contengan un término bloqueado
+    MODERATION_ALLOWLIST_FILE: str = ""
+
+    # Control de admisión de start_game
+    START_MAX_GENERATING_ROOMS: int = 8 # Salas generando su mazo a la vez
+    START_MAX_WAITING_ROOMS: int = 20 # Salas en la fila de espera; las siguientes se rechazan
+    START_INITIAL_ESTIMATE_SECONDS: float = 15 # Estimación inicial de lo que tarda una sala en generar
+
+    # Recarga del mazo durante la partida
+    DECK_TOPUP_ENABLED: bool = True
+    DECK_TOPUP_LOOKAHEAD_ROUNDS: int = 3 # Al recargar se piden cartas libres para estos repartos (se recarga si no llegan para el siguiente)
+    DECK_TOPUP_WAIT_SECONDS: float = 30 # Espera máxima a una recarga en curso antes de terminar la partida
+
     class Config:
         env_file = ".env.local"
         env_file_encoding = "utf-8"
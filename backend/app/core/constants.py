@@ -4,4 +4,9 @@ INITIAL_HAND_SIZE = 7 # Reducido para partidas más rápidas
 
 FIRST_PLACE_POINTS = 20
 SECOND_PLACE_POINTS = 10
-THIRD_PLACE_POINTS = 5
\ No newline at end of file
+THIRD_PLACE_POINTS = 5
+
+# Cartas que se generan al iniciar una partida
+INITIAL_RESPONSE_CARD_BUFFER = 100
+INITIAL_THEME_CARD_BUFFER = 40
+MIN_THEME_CARDS_TO_START = 3 # Cartas de tema necesarias para arrancar mientras llega el resto
@@ -2,11 +2,13 @@ from sqlalchemy.orm import Session, joinedload
 from sqlalchemy.exc import IntegrityError
 from . import models, schemas
 from ..core.security import get_password_hash, verify_password
+import hashlib
 import random
 import string
 from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
 import logging
-from typing import Optional
+from typing import Dict, Iterable, List, Optional
 
 # --- User CRUD ---
 
@@ -149,6 +151,39 @@ def delete_topic(db: Session, topic_id: int, owner_id: int) -> bool:
     return True
 
 
+# --- Card CRUD ---
+
+def card_text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def upsert_card_texts(db: Session, texts: Iterable[str]) -> Dict[str, models.CardText]:
+    """Guarda los textos que aún no existan (por hash) y devuelve texto -> fila de `card_texts`, nuevas o ya existentes."""
+    by_hash = {card_text_hash(text): text for text in texts}
+    if not by_hash:
+        return {}
+    rows = [{"hash": h, "text": text} for h, text in by_hash.items()]
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        # Un solo INSERT para todo el lote; si otra sesión guardó el mismo texto a la vez, el conflicto se ignora
+        db.execute(insert(models.CardText).values(rows).on_conflict_do_nothing(index_elements=["hash"]))
+    else:
+        existing = {h for (h,) in db.query(models.CardText.hash).filter(models.CardText.hash.in_(by_hash))}
+        db.add_all([models.CardText(**row) for row in rows if row["hash"] not in existing])
+        db.flush()
+    stored = db.query(models.CardText).filter(models.CardText.hash.in_(by_hash)).all()
+    return {entry.text: entry for entry in stored}
+
+def make_cards(db: Session, texts: List[str], card_type: str, topic_id: int, personality_id: Optional[int] = None) -> List[models.Card]:
+    """Crea (sin añadirlas a la sesión) las cartas de un lote, enlazadas a sus textos deduplicados."""
+    texts = [text.strip() for text in texts if text and text.strip()]
+    entries = upsert_card_texts(db, texts)
+    return [
+        models.Card(text_entry=entries[text], card_type=card_type, topic_id=topic_id, personality_id=personality_id)
+        for text in texts
+    ]
+
+
 # --- Monedas / Tienda ---
 def adjust_user_coins(db: Session, user_id: int, delta: int) -> int:
     """Ajusta (suma o resta) las monedas del usuario y devuelve el nuevo balance."""
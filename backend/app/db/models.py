@@ -1,5 +1,6 @@
-from sqlalchemy import Column, DateTime, Integer, String, Boolean, ForeignKey, Text, JSON, func
+from sqlalchemy import Column, DateTime, Integer, String, Boolean, ForeignKey, Text, JSON, LargeBinary, func
 from sqlalchemy.orm import relationship
+from sqlalchemy.ext.associationproxy import association_proxy
 from .database import Base
 from datetime import datetime
 
@@ -32,6 +33,10 @@ class Room(Base):
     total_rounds = Column(Integer, default=10, nullable=False)
     current_round = Column(Integer, default=0, nullable=False)
 
+    # Reparto reutilizando cartas ya guardadas del tema. None: activado solo en temas públicos
+    reuse_existing_cards = Column(Boolean, nullable=True)
+    reuse_same_personality = Column(Boolean, default=False, nullable=False) # Solo cartas de la misma personalidad
+
     created_at = Column(DateTime, server_default=func.now(), nullable=False)
 
     players = relationship(
@@ -44,6 +49,12 @@ class Room(Base):
     current_theme_card = relationship("Card", foreign_keys=[current_theme_card_id])
     theme_master = relationship("Player", foreign_keys=[theme_master_id], post_update=True)
 
+    @property
+    def reuses_existing_cards(self) -> bool:
+        if self.reuse_existing_cards is not None:
+            return self.reuse_existing_cards
+        return bool(self.topic and self.topic.is_public)
+
 class Topic(Base):
     __tablename__ = "topics"
     id = Column(Integer, primary_key=True, index=True)
@@ -72,14 +83,26 @@ class Player(Base):
     
     hand = relationship("PlayerCard", back_populates="player", cascade="all, delete-orphan")
 
+# Textos de carta sin repetir: varias cartas (de temas o partidas distintas) pueden compartir el mismo
+class CardText(Base):
+    __tablename__ = "card_texts"
+    id = Column(Integer, primary_key=True, index=True)
+    hash = Column(String(64), unique=True, nullable=False) # sha256 del texto, en hexadecimal
+    text = Column(Text, nullable=False)
+    minhash = Column(LargeBinary, nullable=True) # Firma MinHash del texto (ver card_index); se calcula al indexar el tema
+
 class Card(Base):
     __tablename__ = "cards"
     id = Column(Integer, primary_key=True, index=True)
-    text = Column(Text, nullable=False)
+    text_id = Column(Integer, ForeignKey("card_texts.id"), nullable=False, index=True)
+    text_entry = relationship("CardText", lazy="joined")
+    text = association_proxy("text_entry", "text")
     card_type = Column(String, nullable=False) # 'response' (blanca) o 'theme' (negra)
     
     topic_id = Column(Integer, ForeignKey("topics.id", ondelete="CASCADE"), nullable=False)
     topic = relationship("Topic", back_populates="response_cards")
+    # Personalidad con la que la generó la IA (None en temas escritos por jugadores y cartas antiguas)
+    personality_id = Column(Integer, ForeignKey("personalities.id", ondelete="SET NULL"), nullable=True, index=True)
 
 # TABLA INTERMEDIA: Para representar la mano de un jugador
 class PlayerCard(Base):
@@ -111,4 +134,29 @@ class Purchase(Base):
     created_at = Column(DateTime, server_default=func.now(), nullable=False)
 
     # relationship optional
-    user = relationship("User")
\ No newline at end of file
+    user = relationship("User")
+
+
+# Caché persistente de respuestas de la IA, direccionada por el hash del prompt
+class GenerationCacheEntry(Base):
+    __tablename__ = "generation_cache"
+    id = Column(Integer, primary_key=True, index=True)
+    key = Column(String(64), unique=True, index=True, nullable=False) # sha256(proveedor + tema + hueco + prompt)
+    topic_id = Column(Integer, index=True, nullable=False) # Tema al que pertenece, para purgar por tema
+    card_type = Column(String, nullable=False)
+    payload = Column(JSON, nullable=False)
+    hit_count = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    last_accessed_at = Column(DateTime, default=datetime.utcnow, index=True, nullable=False)
+
+
+# Trabajos de generación pendientes o en curso; se borran al terminar
+class GenerationJob(Base):
+    __tablename__ = "generation_jobs"
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False) # "interactive", "topup" o "refill"
+    priority = Column(Integer, nullable=False)
+    topic_id = Column(Integer, index=True, nullable=False)
+    payload = Column(JSON, nullable=False)
+    room_code = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
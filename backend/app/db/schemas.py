@@ -99,6 +99,8 @@ class RoomSchema(BaseModel):
     personality: Optional[PersonalitySchema]
     total_rounds: int
     current_round: int
+    reuse_existing_cards: bool = False
+    reuse_same_personality: bool = False
 
     class Config:
         from_attributes = True
@@ -114,7 +116,7 @@ class RoomSchema(BaseModel):
                 is_theme_master=p.is_theme_master, 
                 has_played=p.has_played,
                 is_spectating=p.is_spectating
-            ) for p in room.players
+            ) for p in sorted(room.players, key=lambda p: p.id) # Orden estable: los parches de estado van por posición
         ]
         return cls(
             code=room.code,
@@ -129,7 +131,9 @@ class RoomSchema(BaseModel):
             played_cards_info=room.played_cards_info or [],
             round_winners=room.round_winners or [],
             total_rounds=room.total_rounds,
-            current_round=room.current_round
+            current_round=room.current_round,
+            reuse_existing_cards=room.reuses_existing_cards,
+            reuse_same_personality=bool(room.reuse_same_personality)
         )
     
 class PersonalitySchema(BaseModel):
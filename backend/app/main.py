@@ -5,7 +5,7 @@ from fastapi.middleware.cors import CORSMiddleware
 import logging
 from logging.config import fileConfig
 
-from .routers import auth, rooms, topics, game_ws, personalities, store
+from .routers import auth, rooms, topics, game_ws, personalities, store, stats
 from .start_routines import lifespan
 from .core.config import settings
 
@@ -39,6 +39,7 @@ app.include_router(topics.router)
 app.include_router(game_ws.router)
 app.include_router(personalities.router)
 app.include_router(store.router)
+app.include_router(stats.router)
 
 @app.get("/api/v1")
 def read_root():
@@ -1,9 +1,13 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, status, Query
 from sqlalchemy.orm import Session
+import asyncio
 import logging
 from ..services.websocket_manager import manager
+from ..services.broadcast_scheduler import room_broadcasts
+from ..services.frames import receive_message
 from ..db.database import SessionLocal
 from ..db import crud
+from ..core.config import settings
 from .auth import get_user_from_token_ws
 from ..services import game_logic
 
@@ -38,16 +42,16 @@ async def websocket_endpoint(
         db_temp.close()
     
     logging.info(f"WS-CONNECT: Jugador '{user.username}' (PlayerID: {player_id}) validado. Conectando a la sala {room_code}.")
-    await manager.connect(room_code, player_id, websocket)
+    connection = await manager.connect(room_code, player_id, websocket)
 
-    # Broadcast inicial y envío de mano con una nueva sesión
+    # Estado completo y mano para el que se conecta (el resto recibe solo el cambio) con una nueva sesión
     with SessionLocal() as db:
-        await game_logic.broadcast_game_state(db, room_code)
+        await game_logic.send_game_state(db, room_code, player_id)
         await game_logic.send_player_hand(db, room_code, player_id)
 
     try:
         while True:
-            data = await websocket.receive_json()
+            data = await receive_message(websocket, connection.protocol)
             action = data.get("action")
             payload = data.get("payload", {})
             
@@ -61,13 +65,17 @@ async def websocket_endpoint(
                 "play_card": game_logic.play_card,
                 "select_winners": game_logic.select_winners,
                 "start_next_round": game_logic.start_next_round,
+                "sync_state": game_logic.sync_state,
             }
 
             if action in action_map:
                 # Se crea una nueva sesión de BD para cada acción, garantizando datos frescos
                 with SessionLocal() as db_action:
                     await action_map[action](db_action, room_code, player_id, payload)
-                    await game_logic.broadcast_game_state(db_action, room_code)
+                # El estado no se envía tras cada acción: se agrupan las de la sala y los cambios de fase salen al momento.
+                # `sync_state` no cambia nada: ya se contestó solo a quien lo pidió
+                if action != "sync_state":
+                    await room_broadcasts.mark_dirty(room_code)
             else:
                 logging.warning(f"WS-ACTION: Acción desconocida '{action}' recibida del jugador {player_id}.")
 
@@ -75,13 +83,42 @@ async def websocket_endpoint(
     except WebSocketDisconnect:
         logging.info(f"WS-DISCONNECT: WebSocket desconectado para el jugador '{user.username}' en la sala {room_code}.")
         manager.disconnect(room_code, websocket)
-        # Se crea una nueva sesión para manejar la desconexión con datos actualizados
-        with SessionLocal() as db_disconnect:
-            player_to_disconnect = crud.get_player(db_disconnect, player_id)
-            if player_to_disconnect:
-                await game_logic.handle_player_disconnect(db_disconnect, room_code, player_to_disconnect.id)
-                await game_logic.broadcast_game_state(db_disconnect, room_code)
+        if connection.evicted_for:
+            # Lo cerró el servidor por ir lento, no el jugador: conserva su sitio un rato para reconectar
+            _keep_seat(room_code, player_id, connection.evicted_for)
+            return
+        await _remove_player(room_code, player_id)
             
     except Exception as e:
         logging.error(f"WS-ERROR: Ocurrió un error inesperado en el WebSocket de la sala {room_code} para el usuario {user.username}: {e}", exc_info=True)
-        manager.disconnect(room_code, websocket)
\ No newline at end of file
+        manager.disconnect(room_code, websocket)
+        if connection.evicted_for:
+            _keep_seat(room_code, player_id, connection.evicted_for)
+
+
+async def _remove_player(room_code: str, player_id: int):
+    # Se crea una nueva sesión para manejar la desconexión con datos actualizados
+    with SessionLocal() as db_disconnect:
+        player_to_disconnect = crud.get_player(db_disconnect, player_id)
+        if player_to_disconnect:
+            await game_logic.handle_player_disconnect(db_disconnect, room_code, player_to_disconnect.id)
+        # Si era el último jugador la sala ya no existe y su cierre ya se ha avisado
+        if crud.get_room_by_code(db_disconnect, room_code):
+            await room_broadcasts.mark_dirty(room_code)
+
+
+def _keep_seat(room_code: str, player_id: int, reason: str):
+    """Al reconectar recibe el estado completo; si no vuelve a tiempo, se le saca como a cualquier desconexión."""
+    logging.info(f"WS-DISCONNECT: El PlayerID {player_id} conserva su sitio en la sala {room_code} durante {settings.WS_RECONNECT_GRACE_SECONDS}s ({reason}).")
+    asyncio.create_task(_remove_after_grace(room_code, player_id))
+
+
+async def _remove_after_grace(room_code: str, player_id: int):
+    await asyncio.sleep(settings.WS_RECONNECT_GRACE_SECONDS)
+    if manager.is_connected(room_code, player_id):
+        return
+    logging.info(f"WS-DISCONNECT: El PlayerID {player_id} no ha vuelto a la sala {room_code}. Sacándolo de la partida.")
+    try:
+        await _remove_player(room_code, player_id)
+    except Exception as e:
+        logging.error(f"WS-DISCONNECT: Error al sacar al PlayerID {player_id} de la sala {room_code}: {e}", exc_info=True)
\ No newline at end of file
@@ -0,0 +1,125 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+import logging
+
+from ..services.deck_pool import deck_pool
+from ..services.deck_forecast import deck_topup
+from ..services.generation_queue import generation_queue
+from ..services.admission import start_admission
+from ..services.card_index import card_index
+from ..services.moderation import content_filter
+from ..services.card_validation import card_validator
+from ..services.websocket_manager import manager
+from ..services.broadcast_scheduler import room_broadcasts
+from ..services.generation_cache import generation_cache
+from ..services.gemini import generation_flights, generation_slots
+from ..services.resilience import resilience_stats
+from ..services.model_router import model_router
+from ..services.metrics import registry
+
+router = APIRouter(prefix="/api/v1/stats", tags=["Stats"])
+
+@router.get("/deck-pool")
+def get_deck_pool_stats():
+    """Devuelve los contadores del pool de mazos pregenerados (aciertos, fallos, reposiciones)."""
+    logging.info("Solicitud de estadísticas del pool de mazos.")
+    return deck_pool.stats()
+
+
+@router.get("/deck-topup")
+def get_deck_topup_stats():
+    """Devuelve las recargas de mazo lanzadas durante las partidas y cuántas salas tuvieron que esperarlas."""
+    logging.info("Solicitud de estadísticas de recargas de mazo.")
+    return deck_topup.stats()
+
+
+@router.get("/generation-queue")
+def get_generation_queue_stats():
+    """
+    Devuelve los trabajos de generación en cola por prioridad, los que están en curso y los terminados,
+    y cuántas llamadas al proveedor están en curso o esperando hueco por clase.
+    """
+    logging.info("Solicitud de estadísticas de la cola de generación.")
+    return {**generation_queue.stats(), "provider_slots": generation_slots.stats()}
+
+
+@router.get("/start-admission")
+def get_start_admission_stats():
+    """Devuelve las salas generando, las que esperan turno y los arranques rechazados por carga."""
+    logging.info("Solicitud de estadísticas de admisión de partidas.")
+    return start_admission.stats()
+
+
+@router.get("/card-index")
+def get_card_index_stats():
+    """Devuelve cuántas cartas generadas se descartaron por parecerse a otras del mismo tema."""
+    logging.info("Solicitud de estadísticas del índice de casi-duplicados.")
+    return card_index.stats()
+
+
+@router.get("/moderation")
+def get_moderation_stats():
+    """Devuelve cuántas cartas ha rechazado el filtro de contenido, por origen (los textos solo van al log)."""
+    logging.info("Solicitud de estadísticas de moderación.")
+    return content_filter.stats()
+
+
+@router.get("/card-validation")
+def get_card_validation_stats():
+    """Devuelve, por personalidad, cuántas cartas generadas se descartaron y por qué (huecos, longitud, repetidas, moderación)."""
+    logging.info("Solicitud de estadísticas de validación de cartas.")
+    return card_validator.stats()
+
+
+@router.get("/websockets")
+def get_websocket_stats():
+    """Devuelve los totales de conexiones abiertas, frames en cola, enviados y descartados, sin identificar salas ni jugadores."""
+    logging.info("Solicitud de estadísticas de WebSockets.")
+    return manager.stats()
+
+
+@router.get("/broadcasts")
+def get_broadcast_stats():
+    """Devuelve cuántas acciones han marcado una sala como sucia, cuántos envíos de estado se hicieron y cuántos se agruparon."""
+    logging.info("Solicitud de estadísticas de envíos agrupados.")
+    return room_broadcasts.stats()
+
+
+@router.get("/generation-cache")
+def get_generation_cache_stats():
+    """Devuelve los aciertos, fallos y expulsiones de la caché de generación."""
+    logging.info("Solicitud de estadísticas de la caché de generación.")
+    return generation_cache.stats()
+
+
+@router.get("/generation-coalescing")
+def get_generation_coalescing_stats():
+    """Devuelve cuántas peticiones de generación se resolvieron compartiendo una llamada en curso."""
+    logging.info("Solicitud de estadísticas de agrupación de peticiones de generación.")
+    return generation_flights.stats()
+
+
+@router.get("/resilience")
+def get_resilience_stats():
+    """Devuelve el estado del circuit breaker, el presupuesto de reintentos y las peticiones duplicadas."""
+    logging.info("Solicitud de estadísticas de resiliencia de la IA.")
+    return resilience_stats()
+
+
+@router.get("/model-routing")
+def get_model_routing_stats():
+    """Devuelve el modelo actual de cada nivel y la latencia y tasa de error observadas de cada modelo."""
+    logging.info("Solicitud de estadísticas del enrutado de modelos.")
+    return model_router.stats()
+
+
+@router.get("/metrics")
+def get_metrics():
+    """Devuelve todas las métricas del proceso (latencias, tokens, cartas, fallos) etiquetadas."""
+    return registry.snapshot()
+
+
+@router.get("/metrics/prometheus", response_class=PlainTextResponse)
+def get_metrics_prometheus():
+    """Las mismas métricas en formato de exposición de Prometheus."""
+    return registry.prometheus()
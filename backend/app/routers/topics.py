@@ -6,6 +6,8 @@ import logging
 from ..db import crud, schemas, models
 from ..db.database import get_db
 from .auth import get_current_user
+from ..services.generation_cache import generation_cache
+from ..services.card_index import card_index
 from fastapi import HTTPException
 
 router = APIRouter(prefix="/api/v1/topics", tags=["Topics"])
@@ -49,4 +51,21 @@ def delete_topic(
     success = crud.delete_topic(db=db, topic_id=topic_id, owner_id=current_user.id)
     if not success:
         raise HTTPException(status_code=403, detail="No autorizado para eliminar este tema o no existe.")
-    return None
\ No newline at end of file
+    generation_cache.purge_topic(topic_id)
+    card_index.purge_topic(topic_id)
+    return None
+
+
+@router.delete("/{topic_id}/generation-cache")
+def purge_topic_generation_cache(
+    topic_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """Purga las respuestas de IA cacheadas para un tema del usuario autenticado."""
+    topic = crud.get_topic(db, topic_id)
+    if not topic or topic.owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="No autorizado para purgar este tema o no existe.")
+    deleted = generation_cache.purge_topic(topic_id)
+    logging.info(f"Usuario '{current_user.username}' purgó {deleted} respuestas cacheadas del tema ID {topic_id}.")
+    return {"deleted": deleted}
\ No newline at end of file
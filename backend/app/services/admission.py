@@ -0,0 +1,122 @@
+import logging
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Tuple
+
+from ..core.config import settings
+from .websocket_manager import manager
+from . import metrics
+
+
+class AdmissionRejected(Exception):
+    """La fila de espera para empezar partida está llena."""
+
+
+class StartAdmission:
+    """
+    Control de admisión de `start_game`: como mucho `max_generating` salas generando su mazo a la vez.
+    Las demás esperan en una fila FIFO y reciben su posición y una espera estimada; si la fila también
+    está llena, se rechaza el arranque para no alargar la espera de todas.
+    """
+
+    def __init__(self, max_generating: int, max_waiting: int, initial_estimate_seconds: float):
+        self.max_generating = max(1, max_generating)
+        self.max_waiting = max_waiting
+        self.generating = 0
+        self._waiting: Deque[Tuple[str, asyncio.Future]] = deque()
+        # Media móvil de lo que tarda una sala en salir de "Generating"
+        self._avg_seconds = initial_estimate_seconds
+        self.admitted = 0
+        self.queued = 0
+        self.shed = 0
+
+    def estimated_wait(self, position: int) -> float:
+        """Segundos estimados hasta que entre la sala en esa posición de la fila (empezando en 1)."""
+        return math.ceil(position / self.max_generating) * self._avg_seconds
+
+    @asynccontextmanager
+    async def slot(self, room_code: str) -> AsyncIterator[None]:
+        await self._acquire(room_code)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * (time.monotonic() - started)
+            self._release()
+
+    async def _acquire(self, room_code: str):
+        if self.generating < self.max_generating and not self._waiting:
+            self.generating += 1
+            self.admitted += 1
+            metrics.start_admission_events.inc(event="admitted")
+            return
+
+        if len(self._waiting) >= self.max_waiting:
+            self.shed += 1
+            metrics.start_admission_events.inc(event="shed")
+            logging.warning(f"ADMISSION: Fila de arranque llena ({len(self._waiting)} salas). Rechazando la sala {room_code}.")
+            raise AdmissionRejected()
+
+        turn = asyncio.get_running_loop().create_future()
+        entry = (room_code, turn)
+        self._waiting.append(entry)
+        self.queued += 1
+        metrics.start_admission_events.inc(event="queued")
+        logging.info(f"ADMISSION: La sala {room_code} espera turno para generar (posición {len(self._waiting)}).")
+        self._broadcast_positions()
+
+        queued_at = time.monotonic()
+        try:
+            # El hueco nos lo cede `_release` al resolver el future
+            await turn
+        except asyncio.CancelledError:
+            if entry in self._waiting:
+                self._waiting.remove(entry)
+                self._broadcast_positions()
+            elif turn.done() and not turn.cancelled():
+                # Nos cedieron el hueco justo antes de cancelar: lo devolvemos
+                self._release()
+            raise
+        # Posición 0: la sala ya ha salido de la fila
+        asyncio.create_task(manager.broadcast(room_code, {"type": "start_queue_update", "data": {"position": 0, "estimated_wait_seconds": 0}}))
+        metrics.start_admission_wait.observe(time.monotonic() - queued_at)
+        metrics.start_admission_events.inc(event="admitted")
+        self.admitted += 1
+
+    def _release(self):
+        if self._waiting:
+            # El hueco pasa directamente a la siguiente sala de la fila
+            _, turn = self._waiting.popleft()
+            turn.set_result(None)
+            self._broadcast_positions()
+        else:
+            self.generating -= 1
+
+    def _broadcast_positions(self):
+        for position, (room_code, _) in enumerate(self._waiting, start=1):
+            asyncio.create_task(manager.broadcast(room_code, {
+                "type": "start_queue_update",
+                "data": {"position": position, "estimated_wait_seconds": round(self.estimated_wait(position))}
+            }))
+
+    def stats(self) -> dict:
+        return {
+            "max_generating": self.max_generating,
+            "generating": self.generating,
+            "waiting": len(self._waiting),
+            "max_waiting": self.max_waiting,
+            "avg_generation_seconds": round(self._avg_seconds, 2),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "shed": self.shed,
+        }
+
+
+start_admission = StartAdmission(
+    max_generating=settings.START_MAX_GENERATING_ROOMS,
+    max_waiting=settings.START_MAX_WAITING_ROOMS,
+    initial_estimate_seconds=settings.START_INITIAL_ESTIMATE_SECONDS,
+)
@@ -0,0 +1,83 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+from ..core.config import settings
+from . import metrics
+
+# Recibe el código de la sala y envía su estado (y las manos que hayan cambiado)
+FlushHandler = Callable[[str], Awaitable[None]]
+
+
+class BroadcastScheduler:
+    """
+    Agrupa los envíos de estado de cada sala. Cada acción marca la sala como sucia y, en lugar de
+    recargar y enviar el estado tras cada una, se hace un solo envío por ventana con todo lo acumulado.
+    Los cambios de fase no esperan: la acción que los provoca lo indica y su envío sale en el momento.
+    """
+
+    def __init__(self):
+        self._handler: Optional[FlushHandler] = None
+        self._pending: Dict[str, asyncio.Task] = {}
+        self._urgent: Set[str] = set()
+        self.marked = 0
+        self.coalesced = 0
+        self.flushed = 0
+
+    def register(self, handler: FlushHandler):
+        self._handler = handler
+
+    def transition(self, room_code: str):
+        """La acción en curso cambia la fase de la sala: su envío sale sin esperar a la ventana."""
+        self._urgent.add(room_code)
+
+    async def mark_dirty(self, room_code: str):
+        self.marked += 1
+        if room_code in self._urgent or settings.WS_BROADCAST_WINDOW_SECONDS <= 0:
+            await self.flush(room_code, "transition" if room_code in self._urgent else "immediate")
+        elif room_code in self._pending:
+            # Ya hay un envío programado para la sala: este cambio sale con él
+            self.coalesced += 1
+            metrics.broadcasts_coalesced.inc()
+        else:
+            self._pending[room_code] = asyncio.create_task(self._flush_later(room_code))
+
+    async def _flush_later(self, room_code: str):
+        await asyncio.sleep(settings.WS_BROADCAST_WINDOW_SECONDS)
+        # Fuera de la lista antes de enviar: lo que llegue mientras tanto abre otra ventana
+        self._pending.pop(room_code, None)
+        await self._run(room_code, "window")
+
+    async def flush(self, room_code: str, reason: str = "immediate"):
+        """Envía ya el estado de la sala, y con él lo que estuviera esperando a la ventana."""
+        pending = self._pending.pop(room_code, None)
+        if pending:
+            pending.cancel()
+        self._urgent.discard(room_code)
+        await self._run(room_code, reason)
+
+    async def _run(self, room_code: str, reason: str):
+        self.flushed += 1
+        metrics.broadcast_flushes.inc(reason=reason)
+        try:
+            await self._handler(room_code)
+        except Exception as e:
+            logging.error(f"BROADCAST: Error al enviar el estado de la sala {room_code}: {e}", exc_info=True)
+
+    def forget(self, room_code: str):
+        pending = self._pending.pop(room_code, None)
+        if pending and pending is not asyncio.current_task():
+            pending.cancel()
+        self._urgent.discard(room_code)
+
+    def stats(self) -> dict:
+        return {
+            "window_seconds": settings.WS_BROADCAST_WINDOW_SECONDS,
+            "pending_rooms": len(self._pending),
+            "marked": self.marked,
+            "flushed": self.flushed,
+            "coalesced": self.coalesced,
+        }
+
+
+room_broadcasts = BroadcastScheduler()
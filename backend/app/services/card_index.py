@@ -0,0 +1,277 @@
+import logging
+import asyncio
+import hashlib
+import random
+import re
+import struct
+import unicodedata
+from collections import OrderedDict, defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import exc
+
+from ..core.config import settings
+from ..db import models
+from ..db.database import SessionLocal
+
+_MASK_64 = (1 << 64) - 1
+_NON_ALPHANUMERIC = re.compile(r"[^0-9a-zñ ]+")
+
+# ((tema, tipo de carta), id de la carta, firma MinHash): lo que `CardIndex.add` necesita de cada carta nueva
+IndexedCard = Tuple[Tuple[int, str], int, Tuple[int, ...]]
+
+
+class _FoldTable(dict):
+    """Tabla para str.translate que calcula y recuerda cómo se normaliza cada carácter la primera vez que aparece."""
+
+    def __missing__(self, codepoint: int) -> str:
+        char = unicodedata.normalize("NFKD", chr(codepoint).casefold())
+        # Quitamos los acentos pero conservamos la ñ (n + virgulilla)
+        char = "".join(c for c in char if not unicodedata.combining(c) or c == "\u0303")
+        folded = _NON_ALPHANUMERIC.sub(" ", unicodedata.normalize("NFC", char))
+        self[codepoint] = folded
+        return folded
+
+
+_FOLD_TABLE = _FoldTable()
+
+
+def normalize_for_similarity(text: str) -> str:
+    """Minúsculas, sin tildes, sin signos de puntuación y con los espacios colapsados."""
+    if not text.isascii():
+        text = unicodedata.normalize("NFC", text)
+    return " ".join(text.translate(_FOLD_TABLE).split())
+
+
+class MinHasher:
+    """
+    Firma MinHash de un texto sobre sus shingles de caracteres.
+    Las permutaciones son hashes multiply-shift de 64 bits: sin módulo, bastante más rápidos en Python puro.
+    """
+
+    def __init__(self, num_perm: int, shingle_size: int, seed: int = 1):
+        self.shingle_size = shingle_size
+        rng = random.Random(seed)
+        self._perms = [(rng.getrandbits(64) | 1, rng.getrandbits(64)) for _ in range(num_perm)]
+        # Las firmas guardadas en la BD llevan delante estos parámetros: si cambian, se recalculan
+        self._format = struct.Struct(f">{num_perm}I")
+        self._prefix = hashlib.blake2b(f"{num_perm}:{shingle_size}:{seed}".encode(), digest_size=4).digest()
+
+    def shingles(self, text: str) -> Set[int]:
+        normalized = normalize_for_similarity(text)
+        if len(normalized) <= self.shingle_size:
+            pieces = {normalized}
+        else:
+            pieces = {normalized[i:i + self.shingle_size] for i in range(len(normalized) - self.shingle_size + 1)}
+        return {int.from_bytes(hashlib.blake2b(p.encode("utf-8"), digest_size=8).digest(), "big") for p in pieces}
+
+    def signature(self, text: str) -> Tuple[int, ...]:
+        shingles = self.shingles(text)
+        return tuple(min([((a * s + b) & _MASK_64) >> 32 for s in shingles]) for a, b in self._perms)
+
+    def encode(self, signature: Tuple[int, ...]) -> bytes:
+        return self._prefix + self._format.pack(*signature)
+
+    def decode(self, stored: Optional[bytes]) -> Optional[Tuple[int, ...]]:
+        """La firma guardada, o None si no hay o se calculó con otros parámetros."""
+        if not stored or len(stored) != len(self._prefix) + self._format.size or not stored.startswith(self._prefix):
+            return None
+        return self._format.unpack(stored[len(self._prefix):])
+
+
+class LSHIndex:
+    """
+    Índice LSH por bandas sobre firmas MinHash: cada firma se parte en `bands` trozos y dos textos son
+    candidatos si coinciden en alguno. Los candidatos se confirman con la similitud estimada por la firma.
+    """
+
+    def __init__(self, bands: int, threshold: float):
+        self.bands = bands
+        self.threshold = threshold
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], Set[int]] = defaultdict(set)
+        self._signatures: Dict[int, Tuple[int, ...]] = {}
+
+    def _band_keys(self, signature: Tuple[int, ...]):
+        rows = max(1, len(signature) // self.bands)
+        for band in range(self.bands):
+            yield band, signature[band * rows:(band + 1) * rows]
+
+    def add(self, item_id: int, signature: Tuple[int, ...]):
+        self._signatures[item_id] = signature
+        for key in self._band_keys(signature):
+            self._buckets[key].add(item_id)
+
+    def query(self, signature: Tuple[int, ...]) -> Optional[int]:
+        """Devuelve el elemento más parecido por encima del umbral, o None."""
+        candidates = set()
+        for key in self._band_keys(signature):
+            candidates |= self._buckets.get(key, set())
+
+        best, best_similarity = None, self.threshold
+        for item_id in candidates:
+            other = self._signatures[item_id]
+            similarity = sum(1 for x, y in zip(signature, other) if x == y) / len(signature)
+            if similarity >= best_similarity:
+                best, best_similarity = item_id, similarity
+        return best
+
+    def __len__(self):
+        return len(self._signatures)
+
+
+class CardIndex:
+    """
+    Índice de casi-duplicados por (tema, tipo de carta). Se carga de la BD en el primer uso de cada
+    tema, en un hilo para no parar el event loop, y después se mantiene al insertar cartas, así comprobar
+    un lote nuevo no recorre todo el corpus. Las firmas se guardan en `card_texts` la primera vez que se
+    calculan, y en memoria solo se quedan los temas usados más recientemente (hasta `max_cards` cartas).
+    """
+
+    def __init__(self, num_perm: int, bands: int, shingle_size: int, threshold: float, max_cards: int):
+        self.hasher = MinHasher(num_perm, shingle_size)
+        self.bands = bands
+        self.threshold = threshold
+        self.max_cards = max_cards
+        # Ordenado del índice usado hace más tiempo al más reciente
+        self._indexes: "OrderedDict[Tuple[int, str], LSHIndex]" = OrderedDict()
+        self._loading: Dict[Tuple[int, str], asyncio.Future] = {}
+        # Cartas insertadas mientras su índice se cargaba, para añadirlas al terminar
+        self._late_adds: Dict[Tuple[int, str], List[Tuple[int, Tuple[int, ...]]]] = defaultdict(list)
+        self.checked = 0
+        self.duplicates = 0
+        self.evictions = 0
+
+    async def _index(self, topic_id: int, card_type: str) -> LSHIndex:
+        key = (topic_id, card_type)
+        index = self._indexes.get(key)
+        if index is not None:
+            self._indexes.move_to_end(key)
+            return index
+        # Si otra petición ya lo está cargando, se espera a esa carga
+        loading = self._loading.get(key)
+        if loading is None:
+            loading = self._loading[key] = asyncio.ensure_future(self._load(key))
+        return await asyncio.shield(loading)
+
+    async def _load(self, key: Tuple[int, str]) -> LSHIndex:
+        try:
+            index, loaded, computed = await asyncio.to_thread(self._read_index, *key)
+            for card_id, signature in self._late_adds.pop(key, []):
+                index.add(card_id, signature)
+            self._indexes[key] = index
+            self._evict(keep=key)
+            logging.info(f"CARD-INDEX: Índice del tema {key[0]} ('{key[1]}') cargado con {loaded} cartas ({computed} firmas calculadas).")
+            return index
+        finally:
+            self._loading.pop(key, None)
+            self._late_adds.pop(key, None)
+
+    def _read_index(self, topic_id: int, card_type: str) -> Tuple[LSHIndex, int, int]:
+        """Se ejecuta en un hilo: lee las firmas guardadas y calcula (y guarda) las que falten."""
+        index = LSHIndex(self.bands, self.threshold)
+        computed: Dict[int, bytes] = {}
+        with SessionLocal() as db:
+            rows = db.query(models.Card.id, models.CardText.id, models.CardText.text, models.CardText.minhash) \
+                .join(models.Card.text_entry).filter(models.Card.topic_id == topic_id, models.Card.card_type == card_type).all()
+            for card_id, text_id, text, stored in rows:
+                signature = self.hasher.decode(stored)
+                if signature is None:
+                    signature = self.hasher.signature(text)
+                    computed[text_id] = self.hasher.encode(signature)
+                index.add(card_id, signature)
+            if computed:
+                try:
+                    db.bulk_update_mappings(models.CardText, [{"id": text_id, "minhash": minhash} for text_id, minhash in computed.items()])
+                    db.commit()
+                except exc.SQLAlchemyError as e:
+                    # Sin guardar las firmas el índice sirve igual; la próxima carga las volverá a calcular
+                    logging.warning(f"CARD-INDEX: No se pudieron guardar las firmas del tema {topic_id}: {e}")
+                    db.rollback()
+        return index, len(rows), len(computed)
+
+    def _evict(self, keep: Tuple[int, str]):
+        total = sum(len(index) for index in self._indexes.values())
+        while total > self.max_cards and len(self._indexes) > 1:
+            oldest = next(iter(self._indexes))
+            if oldest == keep:
+                self._indexes.move_to_end(keep)
+                continue
+            total -= len(self._indexes.pop(oldest))
+            self.evictions += 1
+
+    async def deduplicate(self, topic_id: int, card_type: str, texts: List[str]) -> Tuple[List[str], List[int]]:
+        """
+        Separa un lote en cartas realmente nuevas y cartas ya existentes en el tema.
+        Devuelve (textos nuevos, ids de las cartas existentes a las que se parecen los demás);
+        los casi-duplicados dentro del propio lote se descartan.
+        """
+        if not settings.CARD_DEDUP_ENABLED or not texts:
+            return texts, []
+        index = await self._index(topic_id, card_type)
+        batch = LSHIndex(self.bands, self.threshold)
+        new_texts, existing_ids = [], []
+        for position, text in enumerate(texts):
+            signature = self.hasher.signature(text)
+            self.checked += 1
+            match = index.query(signature)
+            if match is not None:
+                self.duplicates += 1
+                if match not in existing_ids:
+                    existing_ids.append(match)
+            elif batch.query(signature) is not None:
+                self.duplicates += 1
+            else:
+                batch.add(position, signature)
+                new_texts.append(text)
+        return new_texts, existing_ids
+
+    def prepare(self, cards: Iterable[models.Card]) -> List[IndexedCard]:
+        """
+        Se llama tras `flush` y antes de `commit`: calcula la firma de cada carta con el texto que ya está
+        en memoria y la deja en su fila de `card_texts`, que se guarda con el mismo commit. Devuelve lo que
+        necesita `add`, así después del commit no hay que volver a leer las cartas.
+        """
+        prepared: List[IndexedCard] = []
+        signatures: Dict[int, Tuple[int, ...]] = {}
+        for card in cards:
+            entry = card.text_entry
+            signature = signatures.get(id(entry)) or self.hasher.decode(entry.minhash)
+            if signature is None:
+                signature = self.hasher.signature(entry.text)
+                entry.minhash = self.hasher.encode(signature)
+            signatures[id(entry)] = signature
+            prepared.append(((card.topic_id, card.card_type), card.id, signature))
+        return prepared
+
+    def add(self, prepared: Iterable[IndexedCard]):
+        """Añade al índice cartas ya guardadas (ver `prepare`). Los temas aún no cargados se leerán de la BD en su momento."""
+        for key, card_id, signature in prepared:
+            index = self._indexes.get(key)
+            if index is not None:
+                index.add(card_id, signature)
+            elif key in self._loading:
+                self._late_adds[key].append((card_id, signature))
+
+    def purge_topic(self, topic_id: int):
+        for key in [key for key in self._indexes if key[0] == topic_id]:
+            del self._indexes[key]
+
+    def stats(self) -> dict:
+        return {
+            "indexed_topics": len({topic_id for topic_id, _ in self._indexes}),
+            "indexed_cards": sum(len(index) for index in self._indexes.values()),
+            "max_cards": self.max_cards,
+            "evicted_indexes": self.evictions,
+            "checked": self.checked,
+            "duplicates": self.duplicates,
+            "duplicate_ratio": self.duplicates / self.checked if self.checked else 0.0,
+        }
+
+
+card_index = CardIndex(
+    num_perm=settings.CARD_DEDUP_NUM_PERM,
+    bands=settings.CARD_DEDUP_BANDS,
+    shingle_size=settings.CARD_DEDUP_SHINGLE_SIZE,
+    threshold=settings.CARD_DEDUP_THRESHOLD,
+    max_cards=settings.CARD_DEDUP_MAX_INDEXED_CARDS,
+)
@@ -0,0 +1,100 @@
+import logging
+import re
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from ..core.config import settings
+from .moderation import content_filter
+from . import metrics
+
+BLANK = "______"
+# Los modelos a veces escriben el hueco con más o menos guiones bajos: cualquier tramo de 3 o más cuenta como uno
+_BLANK_RUN = re.compile(r"_{3,}")
+
+# Motivos de rechazo
+BLANKS, LENGTH, DUPLICATE, MODERATION = "blanks", "length", "duplicate", "moderation"
+
+
+def normalize_card_key(text: str) -> str:
+    """Clave para detectar cartas repetidas: sin mayúsculas ni espacios sobrantes."""
+    return " ".join(text.casefold().split())
+
+
+def check_structure(text: str, card_type: str) -> Tuple[str, Optional[str]]:
+    """
+    Devuelve (texto con el hueco normalizado, motivo de rechazo o None).
+    Las cartas de tema llevan exactamente un hueco; las de respuesta, ninguno.
+    """
+    text, blanks = _BLANK_RUN.subn(BLANK, text.strip())
+    if blanks != (1 if card_type == 'theme' else 0):
+        return text, BLANKS
+    if card_type == 'theme':
+        min_chars, max_chars = settings.CARD_THEME_MIN_CHARS, settings.CARD_THEME_MAX_CHARS
+    else:
+        min_chars, max_chars = settings.CARD_RESPONSE_MIN_CHARS, settings.CARD_RESPONSE_MAX_CHARS
+    if not (min_chars <= len(text) <= max_chars):
+        return text, LENGTH
+    return text, None
+
+
+class CardBatch:
+    """Validación de un lote: estructura, longitud, repetidas dentro del lote y moderación."""
+
+    def __init__(self, validator: "CardValidator", card_type: str, labels: dict):
+        self.validator = validator
+        self.card_type = card_type
+        self.labels = labels
+        self._seen = set()
+        self.rejected = 0
+
+    def check(self, text: str) -> Optional[str]:
+        """Devuelve la carta lista para usar, o None si se descarta."""
+        text, reason = check_structure(text, self.card_type)
+        if reason is None and normalize_card_key(text) in self._seen:
+            reason = DUPLICATE
+        if reason is None and not content_filter.allows(text, "generated", self.labels):
+            reason = MODERATION
+        self.validator.record(self.labels, reason)
+        if reason is not None:
+            self.rejected += 1
+            return None
+        self._seen.add(normalize_card_key(text))
+        return text
+
+    def accept(self, texts: List[str]) -> List[str]:
+        accepted = [text for text in map(self.check, texts) if text is not None]
+        if len(accepted) < len(texts):
+            logging.warning(f"VALIDATION: {len(texts) - len(accepted)}/{len(texts)} cartas '{self.card_type}' descartadas ({self.labels['personality']}).")
+        return accepted
+
+
+class CardValidator:
+    """Lleva la cuenta de cartas revisadas y rechazadas por personalidad, para ver qué plantillas fallan más."""
+
+    def __init__(self):
+        # (personalidad, tipo de carta) -> motivo (o "accepted") -> cartas
+        self._counts: Dict[Tuple[str, str], Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    def batch(self, card_type: str, labels: dict) -> CardBatch:
+        return CardBatch(self, card_type, labels)
+
+    def record(self, labels: dict, reason: Optional[str]):
+        self._counts[(labels["personality"], labels["card_type"])][reason or "accepted"] += 1
+        if reason is not None:
+            metrics.generation_cards_rejected.inc(reason=reason, **labels)
+
+    def stats(self) -> dict:
+        personalities = defaultdict(dict)
+        for (personality, card_type), counts in self._counts.items():
+            checked = sum(counts.values())
+            rejected = checked - counts.get("accepted", 0)
+            personalities[personality][card_type] = {
+                "checked": checked,
+                "rejected": rejected,
+                "rejection_rate": rejected / checked if checked else 0.0,
+                "by_reason": {reason: n for reason, n in counts.items() if reason != "accepted"},
+            }
+        return {"personalities": personalities}
+
+
+card_validator = CardValidator()
@@ -0,0 +1,179 @@
+import logging
+import asyncio
+from dataclasses import dataclass
+from typing import Dict, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import exc
+
+from . import gemini
+from .model_router import BACKGROUND
+from .generation_queue import generation_queue, TOPUP
+from .card_index import card_index
+from ..core import constants
+from ..core.config import settings
+from ..db import models, crud
+from ..db.database import SessionLocal
+
+
+@dataclass
+class DeckForecast:
+    """
+    Cartas libres que necesita una sala en el próximo reparto.
+    Las cartas jugadas se borran de la mano y vuelven a estar libres, y de tema solo se aparta la de la ronda,
+    así que el mazo libre no baja ronda a ronda: lo que hay que cubrir es cada reparto.
+    """
+    remaining_rounds: int
+    # Una carta para cada jugador que juega en la ronda y una mano completa para cada espectador que entra
+    response_per_deal: int
+    theme_per_deal: int
+
+    def response_needed(self, deals: int) -> int:
+        return self.response_per_deal * deals if self.remaining_rounds else 0
+
+    def theme_needed(self, deals: int) -> int:
+        return self.theme_per_deal * deals if self.remaining_rounds else 0
+
+
+def forecast_consumption(active_players: int, spectators: int, total_rounds: int, current_round: int) -> DeckForecast:
+    """
+    En cada reparto todos menos el Theme Master roban una carta, los espectadores reciben una mano completa
+    y se elige una carta de tema.
+    """
+    return DeckForecast(
+        # La ronda actual cuenta: su carta de tema puede no haberse elegido aún
+        remaining_rounds=max(0, total_rounds - current_round + 1),
+        response_per_deal=max(0, active_players - 1) + spectators * constants.INITIAL_HAND_SIZE,
+        theme_per_deal=1,
+    )
+
+
+def cards_to_top_up(needed_next: int, target: int, available: int, cap: int) -> int:
+    """
+    Cuántas cartas pedir: nada mientras las cartas libres cubran el próximo reparto; si no, las que falten
+    para cubrir `target` sin repetir (con el tamaño de un mazo inicial como máximo por recarga).
+    """
+    if available >= needed_next:
+        return 0
+    return min(cap, max(target, needed_next) - available)
+
+
+class DeckTopUp:
+    """
+    Recargas en segundo plano del mazo de un tema durante la partida.
+    Como mucho hay una recarga en curso por (tema, tipo de carta); las salas que la necesiten la comparten.
+    """
+
+    def __init__(self, lookahead_rounds: int):
+        self.lookahead_rounds = lookahead_rounds
+        self._tasks: Dict[Tuple[int, str], asyncio.Future] = {}
+        self.triggered = 0
+        self.cards_added = 0
+        self.failures = 0
+        self.waits = 0
+
+    def check(self, room: models.Room, available_response: int, available_theme: int):
+        """
+        Pide una recarga si las cartas libres (fuera de las manos de la sala, o distintas del tema actual)
+        no cubren el próximo reparto. Se pide para cubrir `lookahead_rounds` repartos sin repetir.
+        """
+        if not settings.DECK_TOPUP_ENABLED or not room.topic_id or not room.personality_id:
+            return
+        active_players = len([p for p in room.players if not p.is_spectating])
+        spectators = len(room.players) - active_players
+        forecast = forecast_consumption(active_players, spectators, room.total_rounds, room.current_round)
+
+        for card_type, available, needed, cap in (
+            ('response', available_response, forecast.response_needed, constants.INITIAL_RESPONSE_CARD_BUFFER),
+            ('theme', available_theme, forecast.theme_needed, constants.INITIAL_THEME_CARD_BUFFER),
+        ):
+            lookahead = min(self.lookahead_rounds, forecast.remaining_rounds)
+            count = cards_to_top_up(needed(1), needed(lookahead), available, cap)
+            if count:
+                logging.info(f"TOP-UP: Sala {room.code}: quedan {available} cartas '{card_type}' libres y el próximo reparto necesita {needed(1)}.")
+                self.request(room.topic_id, room.personality_id, card_type, count)
+
+    def request(self, topic_id: int, personality_id: int, card_type: str, count: int) -> asyncio.Future:
+        key = (topic_id, card_type)
+        task = self._tasks.get(key)
+        if task and not task.done():
+            return task
+
+        self.triggered += 1
+        task = generation_queue.submit(TOPUP, topic_id, {
+            "topic_id": topic_id, "personality_id": personality_id, "card_type": card_type, "count": count
+        })
+        self._tasks[key] = task
+        return task
+
+    async def wait(self, topic_id: int, card_type: str, timeout: float) -> bool:
+        """Espera a la recarga en curso de ese mazo. Devuelve False si no la había o no llegó a tiempo."""
+        task = self._tasks.get((topic_id, card_type))
+        if not task or task.done():
+            return False
+        self.waits += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(task), timeout)
+            return True
+        except (asyncio.TimeoutError, HTTPException):
+            return False
+
+    async def run_job(self, payload: dict):
+        """
+        Trabajo de la cola: genera las cartas del payload y añade al tema las que no se parecen a ninguna existente.
+        Si se descartan repetidas, se piden solo las que faltan (hasta CARD_DEDUP_MAX_ROUNDS veces más).
+        """
+        topic_id, card_type, count = payload["topic_id"], payload["card_type"], payload["count"]
+        with SessionLocal() as db:
+            topic = db.query(models.Topic).filter(models.Topic.id == topic_id).first()
+            personality = db.query(models.Personality).filter(models.Personality.id == payload["personality_id"]).first()
+            if not topic or not personality:
+                return
+            topic_prompt, topic_title = topic.prompt, topic.title
+            personality_template, personality_title = personality.template_prompt, personality.title
+
+        missing = count
+        for _ in range(1 + settings.CARD_DEDUP_MAX_ROUNDS):
+            try:
+                card_texts = await gemini.generate_cards_for_topic(
+                    topic_prompt, personality_template, card_type, missing,
+                    fallback=False, topic_title=topic_title, personality_title=personality_title, tier=BACKGROUND
+                )
+            except HTTPException:
+                self.failures += 1
+                logging.warning(f"TOP-UP: Falló la recarga de cartas '{card_type}' del tema {topic_id}.")
+                raise
+
+            new_texts, _ = await card_index.deduplicate(topic_id, card_type, card_texts)
+            with SessionLocal() as db:
+                try:
+                    new_cards = crud.make_cards(db, new_texts, card_type, topic_id, payload["personality_id"])
+                    db.add_all(new_cards)
+                    db.flush()
+                    indexed = card_index.prepare(new_cards)
+                    db.commit()
+                    card_index.add(indexed)
+                    self.cards_added += len(new_cards)
+                    logging.info(f"TOP-UP: {len(new_cards)} cartas '{card_type}' nuevas añadidas al tema {topic_id} ({len(card_texts) - len(new_cards)} repetidas).")
+                except exc.SQLAlchemyError as e:
+                    self.failures += 1
+                    logging.error(f"TOP-UP: Error de BD al guardar la recarga del tema {topic_id}: {e}")
+                    db.rollback()
+                    return
+
+            missing -= len(new_texts)
+            if missing <= 0:
+                return
+
+    def stats(self) -> dict:
+        return {
+            "triggered": self.triggered,
+            "cards_added": self.cards_added,
+            "failures": self.failures,
+            "waits": self.waits,
+            "in_flight": sum(1 for task in self._tasks.values() if not task.done()),
+        }
+
+
+deck_topup = DeckTopUp(lookahead_rounds=settings.DECK_TOPUP_LOOKAHEAD_ROUNDS)
+generation_queue.register(TOPUP, deck_topup.run_job, dedupe_fields=("topic_id", "card_type"))
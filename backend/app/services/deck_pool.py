@@ -0,0 +1,175 @@
+import logging
+import asyncio
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from . import gemini
+from .model_router import BACKGROUND
+from .generation_queue import generation_queue, REFILL
+from ..core import constants
+from ..core.config import settings
+from ..db import models
+from ..db.database import SessionLocal
+
+PoolKey = Tuple[int, int] # (topic_id, personality_id)
+
+
+@dataclass
+class PooledDeck:
+    response_texts: List[str]
+    theme_texts: List[str]
+
+
+class DeckPool:
+    """
+    Mantiene mazos ya generados para los pares (tema, personalidad) que se usan.
+    Un par se registra la primera vez que una sala lo pide y solo se precalientan los `max_pairs`
+    usados más recientemente. Cuando un par baja de la marca mínima se repone en segundo plano hasta la máxima.
+    """
+
+    def __init__(self, low_watermark: int, high_watermark: int, refill_concurrency: int, max_pairs: int):
+        self.low_watermark = low_watermark
+        self.high_watermark = max(high_watermark, low_watermark)
+        self.max_pairs = max_pairs
+        # Ordenado del par usado hace más tiempo al más reciente
+        self._decks: "OrderedDict[PoolKey, Deque[PooledDeck]]" = OrderedDict()
+        # Prompts necesarios para reponer cada par: (topic_prompt, personality_template)
+        self._prompts: Dict[PoolKey, Tuple[str, str]] = {}
+        # Títulos de cada par, para etiquetar las métricas: (topic_title, personality_title)
+        self._titles: Dict[PoolKey, Tuple[str, str]] = {}
+        self._refilling: set[PoolKey] = set()
+        self._refill_semaphore = asyncio.Semaphore(refill_concurrency)
+        self._wakeup = asyncio.Event()
+        self.hits = 0
+        self.misses = 0
+        self.refills = 0
+        self.refill_failures = 0
+        self.evictions = 0
+
+    def register(self, topic_id: int, personality_id: int, topic_prompt: str, personality_template: str,
+                 topic_title: str = "desconocido", personality_title: str = "desconocido"):
+        key = (topic_id, personality_id)
+        self._prompts[key] = (topic_prompt, personality_template)
+        self._titles[key] = (topic_title, personality_title)
+        self._decks.setdefault(key, deque())
+        self._decks.move_to_end(key)
+        while len(self._decks) > self.max_pairs:
+            # Se deja de precalentar el par usado hace más tiempo; sus mazos listos se descartan
+            evicted, _ = self._decks.popitem(last=False)
+            self._prompts.pop(evicted, None)
+            self._titles.pop(evicted, None)
+            self.evictions += 1
+            logging.info(f"DECK-POOL: El par {evicted} deja de precalentarse (límite de {self.max_pairs} pares).")
+        self._wakeup.set()
+
+    def claim(self, topic: models.Topic, personality: models.Personality) -> Optional[PooledDeck]:
+        """
+        Entrega un mazo listo si lo hay. Nunca espera a la IA.
+        El par queda registrado (o pasa a ser el más reciente) para tener mazos listos la próxima vez.
+        """
+        key = (topic.id, personality.id)
+        decks = self._decks.get(key)
+        self.register(topic.id, personality.id, topic.prompt, personality.template_prompt, topic.title, personality.title)
+        if not decks:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        deck = decks.popleft()
+        if len(decks) < self.low_watermark:
+            self._wakeup.set()
+        return deck
+
+    async def run(self):
+        """Bucle en segundo plano que repone los pares por debajo de la marca mínima."""
+        while True:
+            for key, decks in list(self._decks.items()):
+                if len(decks) < self.low_watermark and key not in self._refilling:
+                    self._refilling.add(key)
+                    asyncio.create_task(self._refill(key))
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=60)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _refill(self, key: PoolKey):
+        topic_id, personality_id = key
+        try:
+            # El par puede dejar de precalentarse mientras se repone
+            while key in self._decks and len(self._decks[key]) < self.high_watermark:
+                # Cada mazo es un trabajo de la cola de generación, con la prioridad más baja
+                async with self._refill_semaphore:
+                    await generation_queue.submit(REFILL, topic_id, {"topic_id": topic_id, "personality_id": personality_id})
+        except HTTPException:
+            self.refill_failures += 1
+            logging.warning(f"DECK-POOL: Falló la reposición del par {key}. Se reintentará en el próximo ciclo.")
+        finally:
+            self._refilling.discard(key)
+
+    async def build_deck(self, payload: dict):
+        """Trabajo de la cola: genera un mazo para el par del payload y lo añade al pool."""
+        key = (payload["topic_id"], payload["personality_id"])
+        if key not in self._prompts and not self._register_from_db(key):
+            return
+        topic_prompt, personality_template = self._prompts[key]
+        topic_title, personality_title = self._titles[key]
+        response_texts, theme_texts = await asyncio.gather(
+            gemini.generate_cards_for_topic(
+                topic_prompt, personality_template, 'response', constants.INITIAL_RESPONSE_CARD_BUFFER,
+                fallback=False, topic_title=topic_title, personality_title=personality_title, tier=BACKGROUND
+            ),
+            gemini.generate_cards_for_topic(
+                topic_prompt, personality_template, 'theme', constants.INITIAL_THEME_CARD_BUFFER,
+                fallback=False, topic_title=topic_title, personality_title=personality_title, tier=BACKGROUND
+            )
+        )
+        decks = self._decks.get(key)
+        if decks is None:
+            return
+        decks.append(PooledDeck(response_texts=response_texts, theme_texts=theme_texts))
+        self.refills += 1
+        logging.info(f"DECK-POOL: Mazo repuesto para el par {key} ({len(self._decks[key])}/{self.high_watermark}).")
+
+    def _register_from_db(self, key: PoolKey) -> bool:
+        """
+        Un trabajo recuperado tras un reinicio llega antes de que ninguna sala haya pedido el par:
+        se registra con el tema y la personalidad de la BD. Devuelve False si ya no existen.
+        """
+        topic_id, personality_id = key
+        with SessionLocal() as db:
+            topic = db.query(models.Topic).filter(models.Topic.id == topic_id).first()
+            personality = db.query(models.Personality).filter(models.Personality.id == personality_id).first()
+            if not topic or not personality:
+                logging.info(f"DECK-POOL: Descartado un trabajo recuperado para el par {key}: el tema o la personalidad ya no existen.")
+                return False
+            self.register(topic.id, personality.id, topic.prompt, personality.template_prompt, topic.title, personality.title)
+        return True
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "refills": self.refills,
+            "refill_failures": self.refill_failures,
+            "registered_pairs": len(self._prompts),
+            "max_pairs": self.max_pairs,
+            "evicted_pairs": self.evictions,
+            "ready_decks": sum(len(d) for d in self._decks.values()),
+            "refilling_pairs": len(self._refilling),
+        }
+
+
+deck_pool = DeckPool(
+    low_watermark=settings.DECK_POOL_LOW_WATERMARK,
+    high_watermark=settings.DECK_POOL_HIGH_WATERMARK,
+    refill_concurrency=settings.DECK_POOL_REFILL_CONCURRENCY,
+    max_pairs=settings.DECK_POOL_MAX_PAIRS,
+)
+generation_queue.register(REFILL, deck_pool.build_deck, dedupe_fields=("topic_id", "personality_id"))
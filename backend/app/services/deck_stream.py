@@ -0,0 +1,116 @@
+import logging
+import asyncio
+from typing import Dict, List, Optional
+
+from sqlalchemy import exc
+
+from . import gemini
+from .card_index import card_index
+from ..db import crud
+from ..db.database import SessionLocal
+
+
+class StreamingDeck:
+    """
+    Mazo que se va llenando a medida que la IA emite cartas.
+    Permite empezar la partida con las primeras cartas y guardar el resto en segundo plano.
+    """
+
+    def __init__(self, topic_prompt: str, personality_template: str, response_count: int, theme_count: int,
+                 topic_title: str = "desconocido", personality_title: str = "desconocido", topic_id: Optional[int] = None):
+        self._targets = {'response': response_count, 'theme': theme_count}
+        self._topic_id = topic_id
+        self._prompts = (topic_prompt, personality_template)
+        self._titles = (topic_title, personality_title)
+        self.texts: Dict[str, List[str]] = {'response': [], 'theme': []}
+        self._persisted: Dict[str, int] = {'response': 0, 'theme': 0}
+        self._changed = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        # Primer error de un stream o del guardado; con él el mazo se da por fallido
+        self.error: Optional[BaseException] = None
+
+    def start(self):
+        for card_type, count in self._targets.items():
+            if count <= 0:
+                continue
+            task = asyncio.create_task(self._consume(card_type, count))
+            task.add_done_callback(self._on_task_done)
+            self._tasks.append(task)
+
+    def _on_task_done(self, task: asyncio.Task):
+        """Recoge el error de una tarea terminada y despierta a quien espere cartas, para que no espere en vano."""
+        if not task.cancelled() and task.exception() is not None:
+            logging.error(f"STREAM: Falló una tarea del mazo en streaming: {task.exception()!r}", exc_info=task.exception())
+            if self.error is None:
+                self.error = task.exception()
+        self._changed.set()
+
+    async def _consume(self, card_type: str, count: int):
+        topic_prompt, personality_template = self._prompts
+        topic_title, personality_title = self._titles
+        cards = gemini.stream_cards_for_topic(
+            topic_prompt, personality_template, card_type, count,
+            topic_title=topic_title, personality_title=personality_title, topic_id=self._topic_id
+        )
+        async for card_text in cards:
+            self.texts[card_type].append(card_text)
+            self._changed.set()
+        self._changed.set()
+
+    @property
+    def done(self) -> bool:
+        return all(task.done() for task in self._tasks)
+
+    async def wait_until(self, min_response: int, min_theme: int):
+        """Espera a tener al menos esas cartas de cada tipo (o a que terminen los streams). Si un stream falla, lanza su error."""
+        while True:
+            if self.error is not None:
+                raise self.error
+            if self.done or (len(self.texts['response']) >= min_response and len(self.texts['theme']) >= min_theme):
+                return
+            self._changed.clear()
+            await self._changed.wait()
+
+    def take_unpersisted(self) -> Dict[str, List[str]]:
+        """Devuelve las cartas recibidas desde la última llamada y las marca como guardadas."""
+        pending = {}
+        for card_type, texts in self.texts.items():
+            pending[card_type] = texts[self._persisted[card_type]:]
+            self._persisted[card_type] = len(texts)
+        return pending
+
+    def cancel(self):
+        for task in self._tasks:
+            task.cancel()
+
+    def persist_in_background(self, topic_id: int, personality_id: int):
+        task = asyncio.create_task(self.persist_remaining(topic_id, personality_id))
+        task.add_done_callback(self._on_task_done)
+
+    async def persist_remaining(self, topic_id: int, personality_id: int):
+        """Tarea en segundo plano: añade al tema las cartas que sigan llegando del stream."""
+        while True:
+            finished = self.done
+            pending = self.take_unpersisted()
+            # Solo se guardan las cartas que no se parecen a ninguna del tema
+            new_texts = {card_type: (await card_index.deduplicate(topic_id, card_type, texts))[0] for card_type, texts in pending.items()}
+            if any(new_texts.values()):
+                with SessionLocal() as db:
+                    try:
+                        new_cards = [
+                            card for card_type, texts in new_texts.items()
+                            for card in crud.make_cards(db, texts, card_type, topic_id, personality_id)
+                        ]
+                        db.add_all(new_cards)
+                        db.flush()
+                        indexed = card_index.prepare(new_cards)
+                        db.commit()
+                        card_index.add(indexed)
+                        logging.info(f"STREAM: {len(new_cards)} cartas más añadidas al tema {topic_id}.")
+                    except exc.SQLAlchemyError as e:
+                        logging.error(f"STREAM: Error de BD al guardar cartas del tema {topic_id}: {e}")
+                        db.rollback()
+            if finished:
+                return
+            self._changed.clear()
+            await self._changed.wait()
@@ -0,0 +1,74 @@
+import json
+from typing import Dict, Iterable, Optional, Union
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+try:
+    import orjson
+except ImportError: # Opcional: sin orjson se usa el json de la librería estándar
+    orjson = None
+
+try:
+    import msgpack
+except ImportError: # Opcional: sin msgpack no se ofrece el subprotocolo binario
+    msgpack = None
+
+JSON = "json"
+# Subprotocolo que puede pedir el cliente (Sec-WebSocket-Protocol) para recibir y enviar MessagePack
+MSGPACK_SUBPROTOCOL = "msgpack.v1"
+
+
+def dumps_json(message: dict) -> str:
+    if orjson is not None:
+        return orjson.dumps(message).decode("utf-8")
+    return json.dumps(message, ensure_ascii=False, separators=(",", ":"))
+
+
+def loads_json(data: Union[str, bytes]) -> dict:
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def negotiate_subprotocol(offered: Iterable[str], msgpack_enabled: bool) -> Optional[str]:
+    """Subprotocolo a aceptar de entre los que ofrece el cliente, o None para JSON."""
+    if msgpack_enabled and msgpack is not None and MSGPACK_SUBPROTOCOL in offered:
+        return MSGPACK_SUBPROTOCOL
+    return None
+
+
+class Frame:
+    """
+    Un mensaje listo para enviar. Se codifica como mucho una vez por formato,
+    y esa codificación se comparte entre todas las conexiones que lo reciben.
+    """
+
+    __slots__ = ("type", "message", "_encoded")
+
+    def __init__(self, message: dict):
+        self.type: Optional[str] = message.get("type")
+        self.message = message
+        self._encoded: Dict[str, Union[str, bytes]] = {}
+
+    def encode(self, protocol: str) -> Union[str, bytes]:
+        encoded = self._encoded.get(protocol)
+        if encoded is None:
+            if protocol == MSGPACK_SUBPROTOCOL:
+                encoded = msgpack.packb(self.message, use_bin_type=True)
+            else:
+                encoded = dumps_json(self.message)
+            self._encoded[protocol] = encoded
+        return encoded
+
+
+async def receive_message(websocket: WebSocket, protocol: str = JSON) -> dict:
+    """
+    Como `receive_json`, pero los mensajes binarios se leen como MessagePack si la conexión negoció
+    ese subprotocolo. Una conexión JSON que manda binario sigue leyéndose como JSON.
+    """
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000))
+    if message.get("bytes") is not None:
+        if protocol == MSGPACK_SUBPROTOCOL:
+            return msgpack.unpackb(message["bytes"], raw=False)
+        return loads_json(message["bytes"])
+    return loads_json(message["text"])
@@ -1,54 +1,153 @@
 import logging
 import random
 import asyncio
-from sqlalchemy.orm import Session
+from collections import defaultdict
+from typing import List, Optional, Tuple
+from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import func, exc, select
 
 from ..db import crud, models, schemas
 from .websocket_manager import manager
 from . import gemini
+from .deck_pool import deck_pool
+from .deck_stream import StreamingDeck
+from .deck_forecast import deck_topup
+from .generation_queue import generation_queue, INTERACTIVE
+from .admission import start_admission, AdmissionRejected
+from .card_index import card_index
+from .moderation import content_filter
+from .state_sync import room_states
+from .hand_sync import hand_tracker
+from .broadcast_scheduler import room_broadcasts
+from ..db.database import SessionLocal
 from ..core import constants
+from ..core.config import settings
 
 # --- Funciones de Difusión ---
 
-INITIAL_RESPONSE_CARD_BUFFER = 100
-INITIAL_THEME_CARD_BUFFER = 40
-
-async def broadcast_game_state(db: Session, room_code: str):
-    """Obtiene el estado actual de la sala y lo envía a todos los jugadores."""
+async def _publish_game_state(db: Session, room_code: str) -> Optional[Tuple[models.Room, int, dict]]:
+    """
+    Calcula el estado actual de la sala y envía a todos solo lo que ha cambiado desde la última versión.
+    Devuelve (sala, versión, estado), o None si la sala ya no existe.
+    """
     room = crud.get_room_by_code(db, room_code)
     if not room:
         logging.warning(f"GAME-STATE: No se pudo emitir el estado, la sala {room_code} no existe (probablemente cerrada).")
+        room_states.forget(room_code)
         await manager.broadcast(room_code, {"type": "room_closed", "data": {"message": "La sala ha sido cerrada."}})
-        return
+        return None
 
     # ### CORRECCIÓN ###: Se llama al schema desde `schemas`, no desde `models`.
     game_state_data = schemas.RoomSchema.from_orm_model(room).model_dump()
-    
-    await manager.broadcast(room_code, {"type": "game_state_update", "data": game_state_data})
-    
-    if room.game_state == "InGame":
+
+    version, ops = room_states.publish(room_code, game_state_data)
+    if ops is None:
+        await manager.broadcast(room_code, {"type": "game_state_update", "version": version, "data": game_state_data})
+    elif ops:
+        # Los clientes con la versión anterior aplican el parche; los demás piden el estado completo
+        await manager.broadcast(room_code, {"type": "game_state_patch", "base_version": version - 1, "version": version, "data": ops})
+    return room, version, game_state_data
+
+
+async def broadcast_game_state(db: Session, room_code: str):
+    """Obtiene el estado actual de la sala y envía los cambios a todos los jugadores, y sus manos a quien le hayan cambiado."""
+    if await _publish_game_state(db, room_code):
         await broadcast_player_hands(db, room_code)
 
 
-async def send_player_hand(db: Session, room_code: str, player_id: int):
-    """Envía la mano de cartas actualizada a un jugador específico."""
-    player_hand_entries = db.query(models.PlayerCard).filter(models.PlayerCard.player_id == player_id).all()
+async def _flush_room(room_code: str):
+    """Envío agrupado del planificador: una sola recarga de la sala para todas las acciones de la ventana."""
+    with SessionLocal() as db:
+        await broadcast_game_state(db, room_code)
 
-    cards_data = [{"id": entry.id, "card": {"id": entry.card.id, "text": entry.card.text, "card_type": entry.card.card_type}} for entry in player_hand_entries]
-    
-    await manager.send_to_player(room_code, player_id, {
-        "type": "player_hand_update",
-        "data": cards_data
-    })
+room_broadcasts.register(_flush_room)
+
+
+async def send_game_state(db: Session, room_code: str, player_id: int):
+    """Envía el estado completo de la sala a un jugador: al conectarse o cuando ha perdido la sincronía."""
+    published = await _publish_game_state(db, room_code)
+    if published:
+        _, version, game_state_data = published
+        await manager.send_to_player(room_code, player_id, {"type": "game_state_update", "version": version, "data": game_state_data})
+
+
+async def sync_state(db: Session, room_code: str, player_id: int, payload: dict):
+    """
+    Acción del cliente cuando un parche de estado o de mano no encaja con su versión: se le reenvía todo.
+    Solo a él: recibe el último estado enviado con su versión, y los parches que sigan en la ventana encajan sobre él.
+    """
+    latest = room_states.latest(room_code)
+    if latest is None:
+        await send_game_state(db, room_code, player_id)
+    else:
+        version, game_state_data = latest
+        await manager.send_to_player(room_code, player_id, {"type": "game_state_update", "version": version, "data": game_state_data})
+    await send_player_hand(db, room_code, player_id)
+
+
+def _hand_entries(player_hand_entries) -> List[dict]:
+    return [{"id": entry.id, "card": {"id": entry.card.id, "text": entry.card.text, "card_type": entry.card.card_type}} for entry in player_hand_entries]
+
+
+async def send_player_hand(db: Session, room_code: str, player_id: int):
+    """Envía la mano de cartas completa a un jugador específico."""
+    player_hand_entries = db.query(models.PlayerCard).filter(models.PlayerCard.player_id == player_id).order_by(models.PlayerCard.id).all()
+    cards_data = _hand_entries(player_hand_entries)
+    version = hand_tracker.record_full(player_id, cards_data)
+    await manager.send_to_player(room_code, player_id, {"type": "player_hand_update", "version": version, "data": cards_data})
 
 
 async def broadcast_player_hands(db: Session, room_code: str):
-    """Envía a cada jugador en una sala su mano de cartas."""
-    room = crud.get_room_by_code(db, room_code)
-    if not room: return
-    for player in room.players:
-        await send_player_hand(db, room_code, player.id)
+    """Envía a los jugadores cuya mano ha cambiado en la última acción las cartas añadidas y quitadas."""
+    changed_player_ids = hand_tracker.take_changed(room_code)
+    if not changed_player_ids: return
+    # Una sola consulta para las manos que han cambiado, en lugar de una por jugador
+    hand_entries = db.query(models.PlayerCard).filter(models.PlayerCard.player_id.in_(changed_player_ids)) \
+        .options(joinedload(models.PlayerCard.card)).order_by(models.PlayerCard.id).all()
+    hands = defaultdict(list)
+    for entry in hand_entries:
+        hands[entry.player_id].append(entry)
+    for player_id in changed_player_ids:
+        cards_data = _hand_entries(hands[player_id])
+        delta = hand_tracker.delta(player_id, cards_data)
+        if delta is None:
+            version = hand_tracker.record_full(player_id, cards_data)
+            await manager.send_to_player(room_code, player_id, {"type": "player_hand_update", "version": version, "data": cards_data})
+        elif delta[2] or delta[3]:
+            base_version, version, added, removed = delta
+            await manager.send_to_player(room_code, player_id, {
+                "type": "player_hand_delta", "base_version": base_version, "version": version,
+                "data": {"added": added, "removed": removed}
+            })
+
+
+# --- Mazo de la sala ---
+
+def _room_cards_query(db: Session, room: models.Room, card_type: str):
+    """Cartas del tema de la sala; si la sala lo pide, solo las generadas con su personalidad."""
+    query = db.query(models.Card).filter(models.Card.topic_id == room.topic_id, models.Card.card_type == card_type)
+    if room.reuses_existing_cards and room.reuse_same_personality:
+        query = query.filter(models.Card.personality_id == room.personality_id)
+    return query
+
+
+def _available_response_cards_query(db: Session, room: models.Room):
+    """Cartas de respuesta del tema que no están en la mano de nadie en la sala."""
+    cards_in_hand_subquery = db.query(models.PlayerCard.card_id).join(models.Player).filter(models.Player.room_id == room.id).subquery()
+    return _room_cards_query(db, room, 'response').filter(models.Card.id.notin_(select(cards_in_hand_subquery)))
+
+
+def _available_theme_cards_query(db: Session, room: models.Room):
+    used_theme_cards_subquery = db.query(models.Room.current_theme_card_id).filter(
+        models.Room.id == room.id,
+        models.Room.current_theme_card_id.isnot(None)
+    ).subquery()
+    return _room_cards_query(db, room, 'theme').filter(models.Card.id.notin_(select(used_theme_cards_subquery)))
+
+
+def _check_deck_forecast(db: Session, room: models.Room):
+    """Lanza una recarga en segundo plano si el mazo no va a cubrir las próximas rondas."""
+    deck_topup.check(room, _available_response_cards_query(db, room).count(), _available_theme_cards_query(db, room).count())
 
 
 # --- Acciones del Juego ---
@@ -58,6 +157,8 @@ async def set_game_settings(db: Session, room_code: str, player_id: int, payload
     topic_id = payload.get('topic_id')
     personality_id = payload.get('personality_id')
     total_rounds = payload.get('total_rounds')
+    reuse_existing_cards = payload.get('reuse_existing_cards')
+    reuse_same_personality = payload.get('reuse_same_personality')
     
     room = crud.get_room_by_code(db, room_code)
     player = crud.get_player(db, player_id)
@@ -79,6 +180,10 @@ async def set_game_settings(db: Session, room_code: str, player_id: int, payload
         room.personality_id = personality.id
         if total_rounds and total_rounds in [1, 5, 10, 15, 20]:
             room.total_rounds = total_rounds
+        if isinstance(reuse_existing_cards, bool):
+            room.reuse_existing_cards = reuse_existing_cards
+        if isinstance(reuse_same_personality, bool):
+            room.reuse_same_personality = reuse_same_personality
         db.commit()
         logging.info(f"El host '{player.user.username}' ha establecido el tema '{topic.title}' y la personalidad '{personality.title}' para la sala {room_code}.")
     except exc.SQLAlchemyError as e:
@@ -101,21 +206,23 @@ async def submit_custom_theme(db: Session, room_code: str, player_id: int, paylo
     if not (10 < len(text) < 280):
         await manager.send_to_player(room_code, player_id, {"type": "error", "data": {"message": "El tema debe tener entre 10 y 280 caracteres."}})
         return
+    if not content_filter.allows(text, "custom_theme", {"room": room_code}):
+        await manager.send_to_player(room_code, player_id, {"type": "error", "data": {"message": "El tema contiene palabras no permitidas. Prueba con otro."}})
+        return
     
     try:
         # Creamos una nueva carta de tema, asociada al topic actual de la sala
-        new_card = models.Card(
-            text=text,
-            card_type='theme',
-            topic_id=room.topic_id
-        )
+        new_card = crud.make_cards(db, [text], 'theme', room.topic_id)[0]
         db.add(new_card)
         db.flush() # Para obtener el ID de la nueva carta
+        indexed = card_index.prepare([new_card])
 
         room.current_theme_card_id = new_card.id
         room.round_phase = "CardPlaying"
         
         db.commit()
+        room_broadcasts.transition(room_code)
+        card_index.add(indexed)
         logging.info(f"Theme Master (PlayerID {player_id}) ha enviado un tema personalizado en la sala {room_code}.")
     except exc.SQLAlchemyError as e:
         logging.error(f"Error de BD al guardar tema personalizado en sala {room_code}: {e}")
@@ -148,35 +255,85 @@ async def start_game(db: Session, room_code: str, player_id: int, payload: dict)
 
     logging.info(f"Iniciando partida en sala {room_code} con el tema '{topic.title}' y la personalidad '{personality.title}'.")
     
+    streaming_deck = None
     try:
         # CAMBIO: Establecer estado a "Generating" y notificar inmediatamente
         room.game_state = "Generating"
         db.commit()
         await broadcast_game_state(db, room_code)
 
-        response_needed = INITIAL_RESPONSE_CARD_BUFFER
-        theme_needed = INITIAL_THEME_CARD_BUFFER
-
-        logging.info(f"Generando {response_needed} cartas de respuesta y {theme_needed} de tema para la sala {room_code}.")
-        
-        response_texts, theme_texts = await asyncio.gather(
-            gemini.generate_cards_for_topic(topic.prompt, personality.template_prompt, 'response', response_needed),
-            gemini.generate_cards_for_topic(topic.prompt, personality.template_prompt, 'theme', theme_needed) 
-        )
+        active_players = len([p for p in room.players if not p.is_spectating])
+        hand_cards_needed = constants.INITIAL_HAND_SIZE * active_players
+
+        # En temas con corpus se reparte primero de las cartas ya guardadas y solo se genera lo que falte
+        existing_response_cards, existing_theme_count = [], 0
+        if room.reuses_existing_cards:
+            existing_response_cards = _available_response_cards_query(db, room).order_by(func.random()).limit(constants.INITIAL_RESPONSE_CARD_BUFFER).all()
+            existing_theme_count = _available_theme_cards_query(db, room).count()
+            logging.info(f"Reutilizando {len(existing_response_cards)} cartas de respuesta y {existing_theme_count} de tema ya guardadas en la sala {room_code}.")
+        response_needed = max(0, constants.INITIAL_RESPONSE_CARD_BUFFER - len(existing_response_cards))
+        theme_needed = max(0, constants.INITIAL_THEME_CARD_BUFFER - existing_theme_count)
+
+        # Después intentamos reclamar un mazo pregenerado; solo si no hay, se genera en vivo.
+        pooled_deck = deck_pool.claim(topic, personality) if response_needed or theme_needed else None
+        if not response_needed and not theme_needed:
+            logging.info(f"El corpus del tema cubre el mazo completo de la sala {room_code}. No se llama a la IA.")
+            response_texts, theme_texts = [], []
+        elif pooled_deck:
+            logging.info(f"Usando un mazo pregenerado del pool para la sala {room_code}.")
+            response_texts, theme_texts = pooled_deck.response_texts, pooled_deck.theme_texts
+        else:
+            logging.info(f"Generando en streaming {response_needed} cartas de respuesta y {theme_needed} de tema para la sala {room_code}.")
+
+            # Empezamos en cuanto haya cartas para las manos iniciales y algunos temas;
+            # el resto del mazo se sigue guardando en segundo plano.
+            streaming_deck = StreamingDeck(
+                topic.prompt, personality.template_prompt, response_needed, theme_needed,
+                topic_title=topic.title, personality_title=personality.title, topic_id=topic.id
+            )
+
+            async def stream_first_cards():
+                streaming_deck.start()
+                await streaming_deck.wait_until(
+                    min_response=max(0, hand_cards_needed - len(existing_response_cards)),
+                    min_theme=max(0, constants.MIN_THEME_CARDS_TO_START - existing_theme_count)
+                )
+
+            # Solo unas pocas salas generan a la vez; el resto espera turno (o se rechaza si la fila está llena).
+            # Dentro, la espera hasta tener las primeras cartas ocupa un worker de la cola con la prioridad más alta.
+            async with start_admission.slot(room_code):
+                await generation_queue.submit(
+                    INTERACTIVE, topic.id, {"topic_id": topic.id, "personality_id": personality.id},
+                    runner=stream_first_cards, room_code=room_code
+                )
+            first_cards = streaming_deck.take_unpersisted()
+            response_texts, theme_texts = first_cards['response'], first_cards['theme']
 
         # Establecer el estado final del juego antes de repartir
         room.game_state = "InGame"
         room.round_phase = "ThemeSelection"
         room.current_round = 1 # Empezamos en la ronda 1
 
+        # Las cartas casi idénticas a otras del tema no se duplican: se reparte la que ya existe
+        new_response_texts, reused_response_ids = await card_index.deduplicate(topic.id, 'response', response_texts)
+        # Las repetidas solo cuentan si esta sala puede repartirlas (p. ej. con `reuse_same_personality`)
+        reused_response_cards = _available_response_cards_query(db, room).filter(models.Card.id.in_(reused_response_ids)).all() if reused_response_ids else []
+        dealable_existing = {c.id for c in reused_response_cards + existing_response_cards}
+        if len(new_response_texts) + len(dealable_existing) < hand_cards_needed:
+            # Demasiadas repetidas dentro del propio lote: mejor cartas parecidas que manos incompletas
+            new_response_texts, reused_response_cards = response_texts, []
+        new_theme_texts, _ = await card_index.deduplicate(topic.id, 'theme', theme_texts)
+
         # Crear y añadir todas las cartas nuevas a la sesión
-        new_cards = []
-        for text in response_texts: new_cards.append(models.Card(text=text, card_type='response', topic_id=topic.id))
-        for text in theme_texts: new_cards.append(models.Card(text=text, card_type='theme', topic_id=topic.id))
+        new_cards = crud.make_cards(db, new_response_texts, 'response', topic.id, personality.id)
+        new_cards += crud.make_cards(db, new_theme_texts, 'theme', topic.id, personality.id)
         db.add_all(new_cards)
         db.flush()
+        indexed = card_index.prepare(new_cards)
 
-        all_response_cards = [c for c in new_cards if c.card_type == 'response']
+        all_response_cards = [c for c in new_cards if c.card_type == 'response'] + reused_response_cards
+        # Sin repetir las que ya salieron del corpus
+        all_response_cards = list({c.id: c for c in all_response_cards + existing_response_cards}.values())
         random.shuffle(all_response_cards)
 
         card_idx = 0
@@ -190,11 +347,29 @@ async def start_game(db: Session, room_code: str, player_id: int, payload: dict)
         db.add_all(new_player_cards)
         
         db.commit()
+        hand_tracker.mark_changed(room_code, {pc.player_id for pc in new_player_cards})
+        room_broadcasts.transition(room_code)
+        card_index.add(indexed)
         logging.info(f"Partida iniciada y cartas repartidas con éxito en la sala {room_code}.")
 
+        if streaming_deck:
+            streaming_deck.persist_in_background(topic.id, personality.id)
+
+    except AdmissionRejected:
+        # Hay demasiadas salas esperando: mejor reintentar en un rato que alargar la espera de todas
+        db.rollback()
+        await manager.send_to_player(room_code, player_id, {"type": "error", "data": {"message": "Hay demasiadas partidas empezando ahora mismo. Inténtalo de nuevo en unos segundos."}})
+        room_after_fail = crud.get_room_by_code(db, room_code)
+        if room_after_fail:
+            room_after_fail.game_state = "Lobby"
+            db.commit()
+            await broadcast_game_state(db, room_code)
+
     except Exception as e:
         logging.error(f"Error crítico al iniciar la partida en {room_code}. Revirtiendo cambios. Error: {e}", exc_info=True)
         db.rollback()
+        if streaming_deck:
+            streaming_deck.cancel()
         # Asegurarse de que la sala vuelve al estado Lobby si algo falla
         room_after_fail = crud.get_room_by_code(db, room_code)
         if room_after_fail:
@@ -208,16 +383,13 @@ async def choose_theme_card(db: Session, room_code: str, player_id: int, payload
     if not room or not player or player.id != room.theme_master_id: return
 
     try:
-        used_theme_cards_subquery = db.query(models.Room.current_theme_card_id).filter(
-            models.Room.id == room.id,
-            models.Room.current_theme_card_id.isnot(None)
-        ).subquery()
+        theme_card = _available_theme_cards_query(db, room).order_by(func.random()).first()
 
-        theme_card = db.query(models.Card).filter(
-            models.Card.topic_id == room.topic_id, 
-            models.Card.card_type == 'theme',
-            models.Card.id.notin_(select(used_theme_cards_subquery))
-        ).order_by(func.random()).first()
+        if not theme_card:
+            # Si hay (o se puede lanzar) una recarga, la esperamos antes de dar la partida por terminada
+            _check_deck_forecast(db, room)
+            if await deck_topup.wait(room.topic_id, 'theme', settings.DECK_TOPUP_WAIT_SECONDS):
+                theme_card = _available_theme_cards_query(db, room).order_by(func.random()).first()
 
         if not theme_card:
             logging.warning(f"Se acabaron las cartas de tema en la sala {room_code}. Finalizando partida.")
@@ -228,6 +400,9 @@ async def choose_theme_card(db: Session, room_code: str, player_id: int, payload
             room.round_phase = "CardPlaying"
         
         db.commit()
+        room_broadcasts.transition(room_code)
+        if room.game_state == "InGame":
+            _check_deck_forecast(db, room)
     except exc.SQLAlchemyError as e:
         logging.error(f"Error de BD al elegir carta de tema en sala {room_code}: {e}")
         db.rollback()
@@ -260,9 +435,12 @@ async def play_card(db: Session, room_code: str, player_id: int, payload: dict):
         non_tm_players = [p for p in room.players if not p.is_theme_master]
         if all(p.has_played for p in non_tm_players):
             room.round_phase = "Voting"
+            # Las jugadas sueltas pueden esperar a la ventana; el paso a votación sale con la última
+            room_broadcasts.transition(room_code)
             logging.info(f"Todos los jugadores han jugado en la sala {room_code}. Pasando a fase de votación.")
         
         db.commit()
+        hand_tracker.mark_changed(room_code, [player_id])
         logging.info(f"PlayerID {player_id} jugó la carta PlayerCardID {player_card_id} en sala {room_code}.")
     except exc.SQLAlchemyError as e:
         logging.error(f"Error de BD al jugar carta en sala {room_code} por PlayerID {player_id}: {e}")
@@ -287,6 +465,7 @@ async def select_winners(db: Session, room_code: str, player_id: int, payload: d
         room.round_phase = "RoundOver"
         room.round_winners = winner_ids
         db.commit()
+        room_broadcasts.transition(room_code)
         logging.info(f"Ganadores de la ronda seleccionados en sala {room_code}: {winner_ids}")
     except exc.SQLAlchemyError as e:
         logging.error(f"Error de BD al seleccionar ganadores en sala {room_code}: {e}")
@@ -301,6 +480,7 @@ async def start_next_round(db: Session, room_code: str, player_id: int, payload:
         logging.info(f"Ronda final completada en la sala {room_code}. Finalizando la partida.")
         room.game_state = "Finished" # Un nuevo estado para el frontend
         db.commit()
+        room_broadcasts.transition(room_code)
         return
 
     try:
@@ -310,19 +490,19 @@ async def start_next_round(db: Session, room_code: str, player_id: int, payload:
         # Obtenemos los IDs de los jugadores que jugaron en la ronda anterior.
         player_ids_who_played = {card['playerId'] for card in room.played_cards_info}
 
-        # Subconsulta para las cartas en mano de todos los jugadores (activos y espectadores)
-        cards_in_hand_subquery = db.query(models.PlayerCard.card_id).join(models.Player).filter(models.Player.room_id == room.id).subquery()
-        
-        # Buscamos cartas disponibles
-        available_cards = db.query(models.Card).filter(
-            models.Card.topic_id == room.topic_id,
-            models.Card.card_type == 'response',
-            models.Card.id.notin_(select(cards_in_hand_subquery))
-        ).all()
-        random.shuffle(available_cards)
+        # Buscamos cartas disponibles (las que no están en la mano de nadie en la sala)
+        available_cards = _available_response_cards_query(db, room).all()
 
         cards_needed = len(player_ids_who_played) + (len(spectators) * constants.INITIAL_HAND_SIZE)
 
+        if len(available_cards) < cards_needed:
+            # La previsión debería haberlo evitado; si hay una recarga en curso (o se puede lanzar), la esperamos
+            deck_topup.check(room, len(available_cards), _available_theme_cards_query(db, room).count())
+            if await deck_topup.wait(room.topic_id, 'response', settings.DECK_TOPUP_WAIT_SECONDS):
+                available_cards = _available_response_cards_query(db, room).all()
+        random.shuffle(available_cards)
+
+        dealt_player_ids = set()
         if len(available_cards) < cards_needed:
             await manager.broadcast(room_code, {"type": "error", "data": {"message": "¡No quedan suficientes cartas para los nuevos jugadores! La partida ha terminado."}})
             room.game_state = "Lobby" # O alguna otra lógica de fin de juego
@@ -358,8 +538,13 @@ async def start_next_round(db: Session, room_code: str, player_id: int, payload:
             room.played_cards_info = []
             room.round_winners = []
             for p in all_active_players: p.has_played = False
+            dealt_player_ids = player_ids_who_played | {spectator.id for spectator in spectators}
 
         db.commit()
+        hand_tracker.mark_changed(room_code, dealt_player_ids)
+        room_broadcasts.transition(room_code)
+        if room.game_state == "InGame":
+            _check_deck_forecast(db, room)
     except exc.SQLAlchemyError as e:
         logging.error(f"Error de BD al iniciar nueva ronda en sala {room_code}: {e}")
         db.rollback()
@@ -377,6 +562,9 @@ async def handle_player_disconnect(db: Session, room_code: str, player_id: int):
             logging.info(f"Último jugador desconectado de la sala {room_code}. Eliminando la sala.")
             db.delete(room)
             db.commit()
+            room_states.forget(room_code)
+            hand_tracker.forget_room(room_code, [player_id])
+            room_broadcasts.forget(room_code)
             await manager.broadcast(room_code, {"type": "room_closed", "data": {"message": "La sala ha sido cerrada."}})
             return
 
@@ -392,6 +580,7 @@ async def handle_player_disconnect(db: Session, room_code: str, player_id: int):
             
             db.delete(player_to_delete)
             db.commit() # Transacción 2: Eliminamos al jugador de forma segura.
+            hand_tracker.forget_player(player_id)
 
             current_room = crud.get_room_by_code(db, room_code)
             if not current_room: return
@@ -415,6 +604,7 @@ async def handle_player_disconnect(db: Session, room_code: str, player_id: int):
                 current_room.round_winners = []
                 for p in remaining_players:
                     p.has_played = False
+                room_broadcasts.transition(room_code)
                 logging.info(f"Ronda reiniciada. Theme Master reasignado a '{new_theme_master.user.username}'.")
             
             db.commit() # Transacción 3: Guardamos los nuevos roles.
@@ -1,54 +1,253 @@
 import logging
 import json
+import asyncio
+import random
+import re
+import time
+from typing import AsyncIterator, Optional, Tuple
 from fastapi import HTTPException
 from pydantic import BaseModel
-from google import genai
-from google.genai import types
 
 from app.db.schemas import CardGenerationResponse
+from app.core.config import settings
+from app.services.generation_cache import generation_cache, make_key
+from app.services.singleflight import SingleFlight
+from app.services.generation_providers import GenerationRequest, GenerationResult, provider
+from app.services import metrics
+from app.services.resilience import circuit_breaker, retry_budget, hedger, call_latencies
+from app.services.model_router import model_router, INTERACTIVE
+from app.services.card_validation import card_validator
+from app.services.generation_queue import PrioritySemaphore
 
-# Constantes
-MODEL_NAME = 'gemini-flash-latest'
+# Límite de generaciones en curso para todo el proceso. Las llamadas que lo superen esperan su turno
+# sin bloquear el event loop, y el turno es antes para las salas esperando que para recargas y reposiciones.
+generation_slots = PrioritySemaphore(settings.GEMINI_MAX_CONCURRENT_GENERATIONS, settings.GEMINI_INTERACTIVE_RESERVED_GENERATIONS)
 
-try:
-    client = genai.Client()
-    logging.info("[INFO] Cliente de Gemini configurado exitosamente. Modelo cargado: {MODEL_NAME}")
-except Exception as e:
-    logging.error(f"[ERROR] No se pudo configurar el modelo de Gemini: {e}")
+# En formato de líneas, por debajo de esta fracción de cartas se repite la petición con JSON
+MIN_LINES_YIELD = 0.5
 
-async def _generate_content_from_gemini(prompt: str, response_schema: BaseModel):
+# Peticiones idénticas en curso (mismo tema, personalidad y tipo) comparten una sola llamada.
+generation_flights = SingleFlight()
+
+async def _call_provider(request: GenerationRequest, response_schema: BaseModel) -> GenerationResult:
+    """Un intento contra el proveedor, con límite de concurrencia y de tiempo."""
+    async with generation_slots.slot():
+        started = time.monotonic()
+        try:
+            result = await asyncio.wait_for(provider.generate(request, response_schema), settings.GENERATION_CALL_TIMEOUT_SECONDS)
+        except asyncio.CancelledError:
+            # Perdió la carrera contra una petición duplicada: no sabemos si habría acabado bien,
+            # así que no cuenta ni como éxito ni como fallo del modelo
+            raise
+        except Exception:
+            model_router.record(request.model, time.monotonic() - started, ok=False)
+            raise
+        latency = time.monotonic() - started
+        result.latency = latency
+        model_router.record(request.model, latency, ok=True)
+        call_latencies.record(latency)
+        metrics.generation_call_latency.observe(latency, **request.labels())
+        _record_token_usage(request, result)
+        return result
+
+
+def _record_token_usage(request: GenerationRequest, result: GenerationResult):
+    metrics.generation_prompt_tokens.inc(result.prompt_tokens, **request.labels())
+    metrics.generation_cached_prompt_tokens.inc(result.cached_tokens, **request.labels())
+    metrics.generation_response_tokens.inc(result.response_tokens, **request.labels())
+
+
+async def _generate_content_from_gemini(request: GenerationRequest, response_schema: BaseModel):
     """
-    Función interna genérica para llamar a la API de Gemini y obtener una respuesta JSON estructurada.
+    Función interna genérica para llamar al proveedor de IA configurado y obtener una respuesta JSON estructurada.
+    Si el circuito está abierto falla al instante; si la llamada se alarga, se duplica (hedging).
     """
-    
-    logging.info("[INFO] Enviando petición a la API de Gemini...")
+    if not circuit_breaker.allow():
+        logging.warning("[WARN] Circuito abierto: no se contacta con la IA.")
+        raise HTTPException(status_code=503, detail="La IA no está disponible temporalmente.")
+
+    retry_budget.deposit()
+    response_text = None
     try:
-        response = client.models.generate_content(
-            model=MODEL_NAME,
-            contents = prompt,
-            config=types.GenerateContentConfig(
-                temperature=1.0,
-                top_p=0.95,
-                response_mime_type="application/json",
-                response_schema=response_schema,
-            ),
-        )
+        logging.info(f"[INFO] Enviando petición al proveedor '{provider.name}' (modelo '{request.model}')...")
+        # Llamada asíncrona: la espera no congela el resto de salas ni sus WebSockets.
+        provider_result = await hedger.run(lambda: _call_provider(request, response_schema))
+        response_text = provider_result.text
         
-        # La respuesta ya viene en JSON, la parseamos
-        result = json.loads(response.text)
-        logging.info(f"[INFO] Respuesta JSON válida recibida de Gemini: {result}")
+        # La respuesta viene en JSON o, en modo compacto, una carta por línea; en ambos casos
+        # devolvemos la forma de CardGenerationResponse
+        if request.output_format == "lines":
+            result = _cards_from_lines(response_text)
+        else:
+            result = json.loads(response_text)
+        # Solo la llamada que respondió: la espera por un hueco o por el hedging no es lentitud del proveedor
+        circuit_breaker.record_success(provider_result.latency)
+        logging.info(f"[INFO] Respuesta válida recibida de la IA: {result}")
         return result
 
     except json.JSONDecodeError:
-        logging.error(f"[ERROR] La respuesta de Gemini no era un JSON válido: {response.text}")
+        circuit_breaker.record_failure()
+        metrics.generation_json_failures.inc(**request.labels())
+        logging.error(f"[ERROR] La respuesta de la IA no era un JSON válido: {response_text}")
         raise HTTPException(status_code=500, detail="La respuesta de la IA no tuvo un formato JSON válido.")
     except Exception as e:
-        logging.error(f"[ERROR] Error al contactar con la API de Gemini: {e}")
+        circuit_breaker.record_failure()
+        logging.error(f"[ERROR] Error al contactar con el proveedor de IA: {e!r}")
         raise HTTPException(status_code=500, detail="Ocurrió un error al generar contenido con la IA.")
     
-async def generate_cards_for_topic(topic_prompt: str, personality_template: str, card_type: str, count: int) -> list[str]:
+async def _stream_content_from_gemini(request: GenerationRequest, response_schema: BaseModel) -> AsyncIterator[str]:
     """
-    Genera un lote de cartas para un tema específico, esperando una respuesta JSON estructurada.
+    Igual que `_generate_content_from_gemini`, pero devuelve el texto de la respuesta
+    a trozos según lo va emitiendo el modelo.
+    """
+    if not circuit_breaker.allow():
+        logging.warning("[WARN] Circuito abierto: no se abre el stream con la IA.")
+        raise HTTPException(status_code=503, detail="La IA no está disponible temporalmente.")
+
+    time_to_first_chunk = None
+    usage = GenerationResult(text="")
+    started = time.monotonic()
+    try:
+        async with generation_slots.slot():
+            logging.info(f"[INFO] Abriendo stream con el proveedor '{provider.name}' (modelo '{request.model}')...")
+            started = time.monotonic()
+            async for chunk in provider.stream(request, response_schema):
+                if time_to_first_chunk is None:
+                    time_to_first_chunk = time.monotonic() - started
+                if chunk.prompt_tokens or chunk.response_tokens:
+                    usage = chunk
+                if chunk.text:
+                    yield chunk.text
+            metrics.generation_call_latency.observe(time.monotonic() - started, **request.labels())
+            model_router.record(request.model, time.monotonic() - started, ok=True)
+            _record_token_usage(request, usage)
+        circuit_breaker.record_success(time_to_first_chunk or 0.0)
+    except Exception as e:
+        circuit_breaker.record_failure()
+        model_router.record(request.model, time.monotonic() - started, ok=False)
+        logging.error(f"[ERROR] Error durante el stream con el proveedor de IA: {e!r}")
+        raise HTTPException(status_code=500, detail="Ocurrió un error al generar contenido con la IA.")
+
+
+class IncrementalCardParser:
+    """
+    Parser incremental para `{"cards": [{"text": ...}, ...]}`.
+    Recibe el JSON a trozos y devuelve el texto de cada carta en cuanto su objeto se cierra.
+    """
+
+    CARD_DEPTH = 3 # raíz {  ->  lista [  ->  carta {
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._object_start: Optional[int] = None
+
+    def feed(self, chunk: str) -> list[str]:
+        self._buffer += chunk
+        cards = []
+        while self._pos < len(self._buffer):
+            char = self._buffer[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in '{[':
+                self._depth += 1
+                if char == '{' and self._depth == self.CARD_DEPTH:
+                    self._object_start = self._pos
+            elif char in '}]':
+                if char == '}' and self._depth == self.CARD_DEPTH and self._object_start is not None:
+                    card_text = self._parse_card(self._buffer[self._object_start:self._pos + 1])
+                    if card_text:
+                        cards.append(card_text)
+                    self._object_start = None
+                self._depth -= 1
+            self._pos += 1
+
+        # Descartamos lo ya procesado si no estamos dentro de una carta a medias
+        if self._object_start is None:
+            self._buffer = ""
+            self._pos = 0
+        return cards
+
+    def close(self) -> list[str]:
+        # En JSON una carta solo está completa cuando se cierra su objeto: no queda nada pendiente útil
+        return []
+
+    @staticmethod
+    def _parse_card(raw_object: str) -> Optional[str]:
+        try:
+            text = json.loads(raw_object).get("text")
+        except (json.JSONDecodeError, AttributeError):
+            logging.warning(f"[WARN] Carta con JSON inválido descartada durante el stream: {raw_object}")
+            return None
+        return text.strip() if isinstance(text, str) and text.strip() else None
+
+
+class IncrementalLineParser:
+    """
+    Parser incremental y tolerante para el formato compacto: una carta por línea.
+    Limpia numeraciones, viñetas y comillas, e ignora líneas vacías o restos de JSON/markdown.
+    Un número al principio solo se quita si sigue la numeración de la lista (1, 2, 3...) y va seguido
+    de un espacio: así "2024: ..." o "1.000 euros" llegan enteras.
+    """
+
+    _NUMBER = re.compile(r'^(\d+)\s*[.)\-:]\s+')
+    _BULLET = re.compile(r'^(?:[-*•·]\s+|>\s*)')
+    _NOISE = {'{', '}', '[', ']', '```', '],', '},'}
+
+    def __init__(self):
+        self._pending = ""
+        # Siguiente número esperado si el modelo está numerando las cartas
+        self._next_number = 1
+
+    def feed(self, chunk: str) -> list[str]:
+        self._pending += chunk
+        *complete, self._pending = self._pending.split("\n")
+        return [card for card in map(self._clean, complete) if card]
+
+    def close(self) -> list[str]:
+        """La última línea puede no acabar en salto de línea."""
+        last, self._pending = self._pending, ""
+        card = self._clean(last)
+        return [card] if card else []
+
+    def _clean(self, line: str) -> Optional[str]:
+        line = line.strip()
+        if not line or line in self._NOISE or line.startswith('```'):
+            return None
+        number = self._NUMBER.match(line)
+        if number and int(number.group(1)) == self._next_number:
+            self._next_number += 1
+            line = line[number.end():]
+        else:
+            line = self._BULLET.sub('', line, count=1)
+        line = line.strip()
+        if len(line) >= 2 and line[0] == line[-1] and line[0] in '"\'':
+            line = line[1:-1].strip()
+        return line or None
+
+
+def _cards_from_lines(text: str) -> dict:
+    """Convierte una respuesta en formato de líneas a la forma de CardGenerationResponse."""
+    parser = IncrementalLineParser()
+    card_texts = parser.feed(text) + parser.close()
+    return {"cards": [{"text": card_text} for card_text in card_texts]}
+
+
+def _build_card_prompt(topic_prompt: str, personality_template: str, card_type: str, count: int, output_format: str = "json") -> Optional[Tuple[str, str]]:
+    """
+    Construye (instrucción de sistema, petición) o None si el tipo no existe.
+    La instrucción de sistema (personalidad + tema) es fija para cada par, así el proveedor puede cachearla;
+    solo la petición cambia entre llamadas.
     """
     system_instruction = personality_template.format(topic_prompt=topic_prompt)
     
@@ -57,22 +256,275 @@ async def generate_cards_for_topic(topic_prompt: str, personality_template: str,
     elif card_type == 'theme':
         user_prompt = f"Genera {count} cartas de tema (negras) sobre la temática."
     else:
-        return []
+        return None
+
+    if output_format == "lines":
+        user_prompt += " Escribe una carta por línea, sin numerar, sin viñetas, sin comillas y sin ningún otro texto."
+
+    return system_instruction, user_prompt
+
+
+def _placeholder_cards(card_type: str, count: int, start: int = 0) -> list[str]:
+    """Cartas de emergencia para cuando la IA no está disponible."""
+    if card_type == 'response':
+        return [f"Respuesta de emergencia {i+1} (IA no disponible)" for i in range(start, start + count)]
+    else:
+        return [f"Tema de emergencia ______ {i+1} (IA no disponible)" for i in range(start, start + count)]
 
-    full_prompt = system_instruction + "\n" + user_prompt
     
+def _split_into_chunks(count: int, chunk_size: int) -> list[int]:
+    chunk_size = max(1, chunk_size)
+    return [min(chunk_size, count - start) for start in range(0, count, chunk_size)]
+
+
+async def _generate_chunk(topic_prompt: str, personality_template: str, card_type: str, size: int, slot: int,
+                          fanout: asyncio.Semaphore, labels: dict, tier: str, cache_topic_id: Optional[int] = None) -> list[str]:
+    """
+    Genera una sub-petición con una semilla distinta para que los trozos no se repitan.
+    Con `cache_topic_id`, si la caché de ese tema tiene una respuesta para el mismo prompt y hueco, se reutiliza (barajada) sin llamar a la IA.
+    En formato de líneas, si la respuesta trae muy pocas cartas se repite el trozo con el esquema JSON.
+    """
+    output_format = settings.GENERATION_OUTPUT_FORMAT
+    validated_response = await _request_chunk(topic_prompt, personality_template, card_type, size, slot, fanout, labels, tier, output_format, cache_topic_id)
+    if output_format == "lines" and len(validated_response.cards) < size * MIN_LINES_YIELD:
+        logging.warning(f"El formato de líneas devolvió solo {len(validated_response.cards)}/{size} cartas. Repitiendo con JSON.")
+        validated_response = await _request_chunk(topic_prompt, personality_template, card_type, size, slot, fanout, labels, tier, "json", cache_topic_id)
+
+    card_texts = [card.text for card in validated_response.cards]
+    random.shuffle(card_texts)
+    return card_texts[:size]
+
+
+async def _request_chunk(topic_prompt: str, personality_template: str, card_type: str, size: int, slot: int,
+                         fanout: asyncio.Semaphore, labels: dict, tier: str, output_format: str, cache_topic_id: Optional[int]) -> CardGenerationResponse:
+    system_instruction, user_prompt = _build_card_prompt(topic_prompt, personality_template, card_type, size, output_format)
+    # La clave no incluye el modelo: las cartas de cualquier nivel sirven para cualquier mazo
+    use_cache = cache_topic_id is not None and settings.GENERATION_CACHE_ENABLED
+    cache_key = make_key(provider.name, cache_topic_id, system_instruction + "\n" + user_prompt, slot) if use_cache else None
+    response_data = generation_cache.get(cache_key) if use_cache else None
+    if response_data is not None:
+        return CardGenerationResponse.model_validate(response_data)
+
+    async with fanout:
+        request = GenerationRequest(
+            prompt=user_prompt, system_instruction=system_instruction, output_format=output_format,
+            model=model_router.choose(tier), card_type=card_type, count=size, seed=random.randrange(2**31),
+            topic_title=labels["topic"], personality_title=labels["personality"]
+        )
+        response_data = await _generate_content_from_gemini(request, CardGenerationResponse)
+    validated_response = CardGenerationResponse.model_validate(response_data)
+    if use_cache and validated_response.cards:
+        generation_cache.put(cache_key, cache_topic_id, card_type, validated_response.model_dump())
+    return validated_response
+
+    
+def _labels(topic_title: str, personality_title: str, card_type: str) -> dict:
+    return {"topic": topic_title, "personality": personality_title, "card_type": card_type}
+
+
+async def generate_cards_for_topic(topic_prompt: str, personality_template: str, card_type: str, count: int, fallback: bool = True,
+                                   topic_title: str = "desconocido", personality_title: str = "desconocido",
+                                   tier: str = INTERACTIVE, topic_id: Optional[int] = None) -> list[str]:
+    """
+    Genera un lote de cartas. Si ya hay una petición idéntica en curso, se comparte su resultado.
+    `topic_title` y `personality_title` solo se usan para etiquetar las métricas.
+    `tier` ("interactive" o "background") decide qué modelos puede usar el enrutador.
+    Solo las peticiones interactivas con `topic_id` usan la caché de lotes: las de fondo (pool, recargas) existen
+    precisamente para tener cartas nuevas, y una respuesta cacheada les devolvería las que ya hay.
+    """
+    labels = _labels(topic_title, personality_title, card_type)
+    key = ('batch', topic_prompt, personality_template, card_type, fallback, tier)
+    started = time.monotonic()
+    card_texts = await generation_flights.do(
+        key, count,
+        lambda: _generate_cards_for_topic(topic_prompt, personality_template, card_type, count, fallback, labels, tier,
+                                          cache_topic_id=topic_id if tier == INTERACTIVE else None)
+    )
+    elapsed = time.monotonic() - started
+    metrics.generation_batch_latency.observe(elapsed, **labels)
+    if elapsed > 0:
+        metrics.generation_cards_per_second.observe(len(card_texts) / elapsed, **labels)
+    return card_texts
+
+
+async def _generate_cards_for_topic(topic_prompt: str, personality_template: str, card_type: str, count: int, fallback: bool,
+                                    labels: dict, tier: str, cache_topic_id: Optional[int] = None) -> list[str]:
+    """
+    Genera un lote de cartas para un tema específico, esperando una respuesta JSON estructurada.
+    Los lotes grandes se dividen en sub-peticiones concurrentes; solo se reintentan las que fallan
+    y, si aun así fallan, solo su parte se cubre con placeholders.
+    Con `fallback=False` los errores se propagan en lugar de devolver cartas de emergencia.
+    """
+    if card_type not in ('response', 'theme'):
+        return []
+
+    fanout = asyncio.Semaphore(settings.GENERATION_FANOUT)
+    chunks: dict[int, list[str]] = {}
+    pending = list(enumerate(_split_into_chunks(count, settings.GENERATION_CHUNK_SIZE)))
+
+    for attempt in range(1 + settings.GENERATION_CHUNK_RETRIES):
+        if not pending:
+            break
+        failed = []
+        if attempt > 0:
+            # Solo reintentamos lo que permita el presupuesto global de reintentos
+            granted = retry_budget.try_spend(len(pending))
+            pending, failed = pending[:granted], pending[granted:]
+            if not pending:
+                logging.warning(f"Sin presupuesto de reintentos para las sub-peticiones fallidas de cartas '{card_type}'.")
+                pending = failed
+                break
+            logging.warning(f"Reintentando {len(pending)} sub-peticiones fallidas de cartas '{card_type}' (intento {attempt + 1}).")
+        outcomes = await asyncio.gather(
+            *(_generate_chunk(topic_prompt, personality_template, card_type, size, index, fanout, labels, tier, cache_topic_id) for index, size in pending),
+            return_exceptions=True
+        )
+        for (index, size), outcome in zip(pending, outcomes):
+            if isinstance(outcome, Exception):
+                failed.append((index, size))
+            else:
+                chunks[index] = outcome
+        pending = failed
+
+    # Unimos los trozos en orden y validamos el lote: huecos, longitud, repetidas y moderación
+    batch = card_validator.batch(card_type, labels)
+    card_texts = batch.accept([text for index in sorted(chunks) for text in chunks[index]])
+
+    # Solo se regeneran los huecos descartados (o que faltaron), en peticiones pequeñas y sin caché:
+    # una respuesta cacheada traería otra vez las mismas cartas
+    to_replace = count - sum(size for _, size in pending) - len(card_texts)
+    next_slot = count
+    for replacement_round in range(settings.CARD_REPLACEMENT_MAX_ROUNDS):
+        if to_replace <= 0:
+            break
+        sizes = _split_into_chunks(to_replace, settings.CARD_REPLACEMENT_CHUNK_SIZE)
+        logging.info(f"Regenerando {to_replace} cartas '{card_type}' descartadas en {len(sizes)} peticiones (ronda {replacement_round + 1}).")
+        outcomes = await asyncio.gather(
+            *(_generate_chunk(topic_prompt, personality_template, card_type, size, next_slot + i, fanout, labels, tier) for i, size in enumerate(sizes)),
+            return_exceptions=True
+        )
+        next_slot += len(sizes)
+        if all(isinstance(outcome, Exception) for outcome in outcomes):
+            logging.warning(f"No se pudieron regenerar las cartas '{card_type}' descartadas: {outcomes[0]!r}")
+            break
+        accepted = batch.accept([text for outcome in outcomes if not isinstance(outcome, Exception) for text in outcome])[:to_replace]
+        card_texts += accepted
+        to_replace -= len(accepted)
+
+    metrics.generation_cards_requested.inc(count, **labels)
+    metrics.generation_cards_returned.inc(len(card_texts), **labels)
+
+    if pending:
+        missing = sum(size for _, size in pending)
+        if not fallback:
+            raise HTTPException(status_code=500, detail="Ocurrió un error al generar contenido con la IA.")
+        logging.warning(f"La generación con IA falló en {len(pending)} sub-peticiones. Devolviendo {missing} placeholders.")
+        metrics.generation_placeholder_cards.inc(missing, **labels)
+        card_texts += _placeholder_cards(card_type, missing)
+
+    logging.info(f"Se generaron y validaron {len(card_texts)} cartas de tipo '{card_type}'.")
+    return card_texts
+
+
+def stream_cards_for_topic(topic_prompt: str, personality_template: str, card_type: str, count: int, fallback: bool = True,
+                           topic_title: str = "desconocido", personality_title: str = "desconocido",
+                           tier: str = INTERACTIVE, topic_id: Optional[int] = None) -> AsyncIterator[str]:
+    """
+    Versión en streaming de `generate_cards_for_topic`. Las salas que arrancan a la vez con el mismo
+    tema y personalidad leen del mismo stream. Igual que el lote, las interactivas con `topic_id` usan la caché.
+    """
+    labels = _labels(topic_title, personality_title, card_type)
+    key = ('stream', topic_prompt, personality_template, card_type, fallback, topic_id)
+    cache_topic_id = topic_id if tier == INTERACTIVE else None
+    return generation_flights.stream(
+        key, count,
+        lambda: _stream_cards_for_topic(topic_prompt, personality_template, card_type, count, fallback, labels, tier, cache_topic_id)
+    )
+
+
+def _cached_stream(cache_key: str, card_type: str, labels: dict, count: int) -> Optional[list[str]]:
+    """Cartas de un stream anterior con el mismo prompt, o None si no hay (o ya no llegan a `count` válidas)."""
+    response_data = generation_cache.get(cache_key)
+    if response_data is None:
+        return None
+    # Se vuelven a validar: la lista de términos bloqueados puede haber cambiado desde que se guardaron
+    card_texts = card_validator.batch(card_type, labels).accept([card["text"] for card in response_data["cards"]])
+    if len(card_texts) < count:
+        return None
+    random.shuffle(card_texts)
+    return card_texts[:count]
+
+
+async def _stream_cards_for_topic(topic_prompt: str, personality_template: str, card_type: str, count: int, fallback: bool,
+                                  labels: dict, tier: str, cache_topic_id: Optional[int] = None) -> AsyncIterator[str]:
+    """
+    Versión en streaming de `generate_cards_for_topic`: emite cada carta en cuanto llega.
+    Con `cache_topic_id`, un arranque con el mismo prompt que uno anterior se sirve de la caché sin llamar a la IA,
+    y un stream completo se guarda para los siguientes.
+    Si el stream falla, completa con placeholders solo las cartas que faltan.
+    """
+    output_format = settings.GENERATION_OUTPUT_FORMAT
+    prompts = _build_card_prompt(topic_prompt, personality_template, card_type, count, output_format)
+    if prompts is None:
+        return
+    system_instruction, user_prompt = prompts
+
+    metrics.generation_cards_requested.inc(count, **labels)
+    cache_key = None
+    if cache_topic_id is not None and settings.GENERATION_CACHE_ENABLED:
+        cache_key = make_key(provider.name, cache_topic_id, system_instruction + "\n" + user_prompt)
+        cached_texts = _cached_stream(cache_key, card_type, labels, count)
+        if cached_texts is not None:
+            logging.info(f"Stream servido desde la caché: {len(cached_texts)} cartas de tipo '{card_type}'.")
+            metrics.generation_cards_returned.inc(len(cached_texts), **labels)
+            for card_text in cached_texts:
+                yield card_text
+            return
+
+    parser = IncrementalLineParser() if output_format == "lines" else IncrementalCardParser()
+    emitted_texts = []
+    emitted = 0
+    batch = card_validator.batch(card_type, labels)
     try:
-        response_data = await _generate_content_from_gemini(full_prompt, CardGenerationResponse)
-        
-        validated_response = CardGenerationResponse.model_validate(response_data)
-        card_texts = [card.text for card in validated_response.cards]
-        
-        logging.info(f"Se generaron y validaron {len(card_texts)} cartas de tipo '{card_type}'.")
-        return card_texts
+        request = GenerationRequest(
+            prompt=user_prompt, system_instruction=system_instruction, output_format=output_format,
+            model=model_router.choose(tier), card_type=card_type, count=count,
+            topic_title=labels["topic"], personality_title=labels["personality"]
+        )
+        async for chunk in _stream_content_from_gemini(request, CardGenerationResponse):
+            for card_text in map(batch.check, parser.feed(chunk)):
+                if emitted >= count:
+                    break
+                if card_text is None:
+                    continue
+                emitted += 1
+                emitted_texts.append(card_text)
+                metrics.generation_cards_returned.inc(**labels)
+                yield card_text
+        for card_text in batch.accept(parser.close())[:count - emitted]:
+            emitted += 1
+            emitted_texts.append(card_text)
+            metrics.generation_cards_returned.inc(**labels)
+            yield card_text
+        logging.info(f"Stream completado: {emitted} cartas de tipo '{card_type}'.")
+
+        if batch.rejected and emitted < count:
+            # Las descartadas se reponen con un lote normal (también validado) del tamaño justo
+            logging.warning(f"VALIDATION: {batch.rejected} cartas del stream descartadas. Pidiendo {min(batch.rejected, count - emitted)} de reemplazo.")
+            for card_text in await _generate_cards_for_topic(topic_prompt, personality_template, card_type,
+                                                             min(batch.rejected, count - emitted), False, labels, tier):
+                emitted += 1
+                emitted_texts.append(card_text)
+                yield card_text
+
+        # Solo se guarda un mazo completo; uno a medias (o con placeholders) haría fallar el siguiente arranque
+        if cache_key and emitted >= count:
+            generation_cache.put(cache_key, cache_topic_id, card_type, {"cards": [{"text": card_text} for card_text in emitted_texts]})
 
     except HTTPException:
-        logging.warning(f"La generación con IA falló. Devolviendo {count} placeholders.")
-        if card_type == 'response':
-            return [f"Respuesta de emergencia {i+1} (IA no disponible)" for i in range(count)]
-        else:
-            return [f"Tema de emergencia ______ {i+1} (IA no disponible)" for i in range(count)]
\ No newline at end of file
+        if not fallback:
+            raise
+        logging.warning(f"El stream de IA falló tras {emitted} cartas. Devolviendo {count - emitted} placeholders.")
+        metrics.generation_placeholder_cards.inc(count - emitted, **labels)
+        for card_text in _placeholder_cards(card_type, count - emitted, start=emitted):
+            yield card_text
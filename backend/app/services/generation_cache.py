@@ -0,0 +1,131 @@
+import logging
+import hashlib
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import exc
+
+from ..core.config import settings
+from ..db import models
+from ..db.database import SessionLocal
+
+
+def _sha256(value: str) -> str:
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+
+def make_key(provider_name: str, topic_id: int, full_prompt: str, slot: int = 0) -> str:
+    """
+    Clave de caché a partir del prompt ya formateado (personalidad + tema + tipo + número de cartas) y el proveedor.
+    Incluye el tema para que dos temas con el mismo prompt no compartan (ni se purguen) entradas.
+    `slot` distingue las sub-peticiones de un mismo lote, que comparten prompt.
+    """
+    return _sha256(f"{provider_name}\n{topic_id}\n{slot}\n{full_prompt}")
+
+
+class GenerationCache:
+    """Caché en BD de respuestas de generación, con TTL y expulsión LRU por número de entradas."""
+
+    def __init__(self, max_entries: int, ttl_minutes: int):
+        self.max_entries = max_entries
+        self.ttl = timedelta(minutes=ttl_minutes)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Entradas en la tabla; se cuenta una vez y luego se lleva la cuenta en cada alta y baja
+        self._size: Optional[int] = None
+
+    def get(self, key: str) -> Optional[dict]:
+        with SessionLocal() as db:
+            try:
+                entry = db.query(models.GenerationCacheEntry).filter(models.GenerationCacheEntry.key == key).first()
+                if entry and entry.created_at < datetime.utcnow() - self.ttl:
+                    db.delete(entry)
+                    db.commit()
+                    self._resize(-1)
+                    entry = None
+
+                if not entry:
+                    self.misses += 1
+                    return None
+
+                entry.hit_count += 1
+                entry.last_accessed_at = datetime.utcnow()
+                db.commit()
+                self.hits += 1
+                return entry.payload
+            except exc.SQLAlchemyError as e:
+                logging.error(f"GEN-CACHE: Error de BD al leer la caché: {e}")
+                db.rollback()
+                self.misses += 1
+                return None
+
+    def put(self, key: str, topic_id: int, card_type: str, payload: dict):
+        with SessionLocal() as db:
+            try:
+                if self._size is None:
+                    self._size = db.query(models.GenerationCacheEntry).count()
+                entry = db.query(models.GenerationCacheEntry).filter(models.GenerationCacheEntry.key == key).first()
+                added = entry is None
+                if entry:
+                    entry.payload = payload
+                    entry.created_at = entry.last_accessed_at = datetime.utcnow()
+                else:
+                    db.add(models.GenerationCacheEntry(key=key, topic_id=topic_id, card_type=card_type, payload=payload))
+                db.flush()
+                evicted = self._evict(db, self._size + added)
+                db.commit()
+                self._resize(added - evicted)
+                self.evictions += evicted
+            except exc.SQLAlchemyError as e:
+                logging.error(f"GEN-CACHE: Error de BD al guardar en la caché: {e}")
+                db.rollback()
+
+    def _evict(self, db, size: int) -> int:
+        """Elimina las entradas menos usadas recientemente hasta volver al límite. Devuelve cuántas se eliminaron."""
+        overflow = size - self.max_entries
+        if overflow <= 0:
+            return 0
+        oldest_ids = [
+            row.id for row in db.query(models.GenerationCacheEntry.id)
+            .order_by(models.GenerationCacheEntry.last_accessed_at.asc())
+            .limit(overflow)
+        ]
+        db.query(models.GenerationCacheEntry).filter(models.GenerationCacheEntry.id.in_(oldest_ids)).delete(synchronize_session=False)
+        return len(oldest_ids)
+
+    def _resize(self, delta: int):
+        if self._size is not None:
+            self._size = max(0, self._size + delta)
+
+    def purge_topic(self, topic_id: int) -> int:
+        """Borra todas las respuestas cacheadas de un tema. Devuelve cuántas se eliminaron."""
+        with SessionLocal() as db:
+            try:
+                deleted = db.query(models.GenerationCacheEntry).filter(
+                    models.GenerationCacheEntry.topic_id == topic_id
+                ).delete(synchronize_session=False)
+                db.commit()
+                self._resize(-deleted)
+                logging.info(f"GEN-CACHE: {deleted} entradas purgadas de la caché.")
+                return deleted
+            except exc.SQLAlchemyError as e:
+                logging.error(f"GEN-CACHE: Error de BD al purgar la caché: {e}")
+                db.rollback()
+                return 0
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "enabled": settings.GENERATION_CACHE_ENABLED,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+generation_cache = GenerationCache(
+    max_entries=settings.GENERATION_CACHE_MAX_ENTRIES,
+    ttl_minutes=settings.GENERATION_CACHE_TTL_MINUTES,
+)
@@ -0,0 +1,363 @@
+import logging
+import json
+import asyncio
+import random
+import hashlib
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, Optional
+
+from pydantic import BaseModel
+
+from ..core.config import settings
+from . import metrics
+
+
+@dataclass
+class GenerationRequest:
+    """Lo que un proveedor necesita para generar un lote de cartas."""
+    prompt: str
+    card_type: str
+    count: int
+    seed: Optional[int] = None
+    # Prefijo estático (personalidad + tema): igual en todas las llamadas del mismo par
+    system_instruction: str = ""
+    # "json" (CardGenerationResponse) o "lines" (una carta por línea, texto plano)
+    output_format: str = "json"
+    # Modelo elegido por el enrutador; None usa el modelo por defecto del proveedor
+    model: Optional[str] = None
+    # Solo para métricas
+    topic_title: str = "desconocido"
+    personality_title: str = "desconocido"
+
+    def labels(self) -> dict:
+        return {"topic": self.topic_title, "personality": self.personality_title, "card_type": self.card_type}
+
+
+@dataclass
+class GenerationResult:
+    """Texto devuelto por el proveedor y, si los informa, los tokens consumidos."""
+    text: str
+    prompt_tokens: int = 0
+    response_tokens: int = 0
+    cached_tokens: int = 0
+    latency: float = 0.0 # Duración de la llamada al proveedor, sin esperas de cola ni de hedging (la rellena gemini._call_provider)
+
+
+class GenerationProvider(ABC):
+    """
+    Backend de generación de cartas. Devuelve el texto crudo de la respuesta: JSON de CardGenerationResponse
+    o, con `output_format="lines"`, una carta por línea.
+    En streaming, los tokens son acumulados: el último trozo que los informa lleva el total.
+    """
+
+    name: str
+    model_name: str
+
+    @abstractmethod
+    async def generate(self, request: GenerationRequest, response_schema: type[BaseModel]) -> GenerationResult:
+        ...
+
+    @abstractmethod
+    def stream(self, request: GenerationRequest, response_schema: type[BaseModel]) -> AsyncIterator[GenerationResult]:
+        ...
+
+
+class _ContextCacheEntry:
+    def __init__(self, name: Optional[str], expires_at: float):
+        self.name = name # None: el proveedor rechazó cachear este prefijo (p. ej. demasiado corto)
+        self.expires_at = expires_at
+
+
+class GeminiContextCache:
+    """
+    Gestiona las cachés de contexto de Gemini: una por instrucción de sistema (es decir, por par tema/personalidad).
+    Se crean en el primer uso, se renuevan antes de caducar y se expulsan por LRU al superar el máximo.
+    """
+
+    REFRESH_MARGIN_SECONDS = 60
+
+    def __init__(self, provider: "GeminiProvider", ttl_seconds: int, max_entries: int):
+        self._provider = provider
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, _ContextCacheEntry]" = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    @staticmethod
+    def _key(model: str, system_instruction: str) -> str:
+        # Una caché de contexto solo sirve para el modelo con el que se creó
+        return hashlib.sha256(f"{model}\n{system_instruction}".encode("utf-8")).hexdigest()
+
+    async def get(self, model: str, system_instruction: str) -> Optional[str]:
+        """Nombre de la caché para esta instrucción de sistema y modelo, o None si no se puede usar."""
+        key = self._key(model, system_instruction)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            entry = self._entries.get(key)
+            if entry and entry.expires_at - time.monotonic() > self.REFRESH_MARGIN_SECONDS:
+                self._entries.move_to_end(key)
+                if entry.name:
+                    metrics.generation_context_cache_events.inc(event="reused")
+                return entry.name
+
+            entry = await self._create(model, system_instruction)
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            await self._evict()
+            return entry.name
+
+    async def _create(self, model: str, system_instruction: str) -> _ContextCacheEntry:
+        from google.genai import types
+        try:
+            cache = await self._provider.client.aio.caches.create(
+                model=model,
+                config=types.CreateCachedContentConfig(
+                    system_instruction=system_instruction,
+                    ttl=f"{self.ttl_seconds}s",
+                ),
+            )
+            metrics.generation_context_cache_events.inc(event="created")
+            logging.info(f"[INFO] Caché de contexto creada en Gemini: {cache.name}")
+            return _ContextCacheEntry(cache.name, time.monotonic() + self.ttl_seconds)
+        except Exception as e:
+            # Típicamente el prefijo no llega al mínimo de tokens cacheables. Recordamos el rechazo
+            # durante un TTL para no reintentarlo en cada llamada; se usará la instrucción de sistema sin caché.
+            metrics.generation_context_cache_events.inc(event="failed")
+            logging.warning(f"[WARN] No se pudo crear la caché de contexto en Gemini: {e!r}")
+            return _ContextCacheEntry(None, time.monotonic() + self.ttl_seconds)
+
+    async def _evict(self):
+        while len(self._entries) > self.max_entries:
+            key, entry = self._entries.popitem(last=False)
+            self._locks.pop(key, None)
+            metrics.generation_context_cache_events.inc(event="evicted")
+            await self._delete_remote(entry)
+
+    def invalidate(self, model: str, system_instruction: str):
+        """Olvida una caché que el proveedor ya no reconoce (caducada o borrada)."""
+        if self._entries.pop(self._key(model, system_instruction), None):
+            metrics.generation_context_cache_events.inc(event="invalidated")
+
+    async def _delete_remote(self, entry: _ContextCacheEntry):
+        if not entry.name:
+            return
+        try:
+            await self._provider.client.aio.caches.delete(name=entry.name)
+        except Exception as e:
+            logging.warning(f"[WARN] No se pudo borrar la caché de contexto {entry.name}: {e!r}")
+
+
+class GeminiProvider(GenerationProvider):
+    """Proveedor real: la API de Google Gemini. El cliente se crea en el primer uso, no al importar."""
+
+    name = "gemini"
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self._client = None
+        self.context_cache = GeminiContextCache(
+            self, ttl_seconds=settings.GEMINI_CONTEXT_CACHE_TTL_SECONDS, max_entries=settings.GEMINI_CONTEXT_CACHE_MAX_ENTRIES
+        ) if settings.GEMINI_CONTEXT_CACHE_ENABLED else None
+
+    @property
+    def client(self):
+        if self._client is None:
+            from google import genai
+            self._client = genai.Client()
+            logging.info(f"[INFO] Cliente de Gemini configurado exitosamente. Modelo cargado: {self.model_name}")
+        return self._client
+
+    async def _cached_content(self, request: GenerationRequest) -> Optional[str]:
+        if not self.context_cache or not request.system_instruction:
+            return None
+        return await self.context_cache.get(self._model(request), request.system_instruction)
+
+    def _model(self, request: GenerationRequest) -> str:
+        return request.model or self.model_name
+
+    def _config(self, request: GenerationRequest, response_schema: type[BaseModel], cached_content: Optional[str]):
+        from google.genai import types
+        lines = request.output_format == "lines"
+        return types.GenerateContentConfig(
+            temperature=1.0,
+            top_p=0.95,
+            response_mime_type="text/plain" if lines else "application/json",
+            response_schema=None if lines else response_schema,
+            seed=request.seed,
+            # Con caché de contexto la instrucción de sistema ya va dentro de ella
+            cached_content=cached_content,
+            system_instruction=None if cached_content else (request.system_instruction or None),
+        )
+
+    @staticmethod
+    def _is_stale_cache_error(error: Exception) -> bool:
+        """
+        Si el error es que la caché de contexto ya no existe en el servidor (caducada o borrada).
+        Cualquier otro (429, 5xx, timeouts...) se propaga para que lo gestionen los reintentos y el circuito.
+        """
+        from google.genai import errors
+        if not isinstance(error, errors.ClientError) or error.code not in (400, 403, 404):
+            return False
+        message = f"{error.message or ''} {error.status or ''}".lower()
+        return "cachedcontent" in message.replace(" ", "") or ("cache" in message and "not found" in message)
+
+    @staticmethod
+    def _result(response) -> GenerationResult:
+        usage = response.usage_metadata
+        return GenerationResult(
+            text=response.text or "",
+            prompt_tokens=(usage.prompt_token_count or 0) if usage else 0,
+            response_tokens=(usage.candidates_token_count or 0) if usage else 0,
+            cached_tokens=(usage.cached_content_token_count or 0) if usage else 0,
+        )
+
+    async def generate(self, request: GenerationRequest, response_schema: type[BaseModel]) -> GenerationResult:
+        cached_content = await self._cached_content(request)
+        try:
+            response = await self.client.aio.models.generate_content(
+                model=self._model(request),
+                contents=request.prompt,
+                config=self._config(request, response_schema, cached_content),
+            )
+        except Exception as e:
+            if not cached_content or not self._is_stale_cache_error(e):
+                raise
+            # La caché caducó en el servidor: la olvidamos y repetimos sin ella
+            self.context_cache.invalidate(self._model(request), request.system_instruction)
+            response = await self.client.aio.models.generate_content(
+                model=self._model(request),
+                contents=request.prompt,
+                config=self._config(request, response_schema, None),
+            )
+        return self._result(response)
+
+    async def stream(self, request: GenerationRequest, response_schema: type[BaseModel]) -> AsyncIterator[GenerationResult]:
+        cached_content = await self._cached_content(request)
+        try:
+            stream = await self.client.aio.models.generate_content_stream(
+                model=self._model(request),
+                contents=request.prompt,
+                config=self._config(request, response_schema, cached_content),
+            )
+        except Exception as e:
+            if not cached_content or not self._is_stale_cache_error(e):
+                raise
+            self.context_cache.invalidate(self._model(request), request.system_instruction)
+            stream = await self.client.aio.models.generate_content_stream(
+                model=self._model(request),
+                contents=request.prompt,
+                config=self._config(request, response_schema, None),
+            )
+        async for chunk in stream:
+            yield self._result(chunk)
+
+
+class FakeProviderError(Exception):
+    pass
+
+
+class FakeProvider(GenerationProvider):
+    """
+    Proveedor local para pruebas de carga sin red ni cuota.
+    Las cartas son deterministas para un mismo prompt y semilla; la latencia, los fallos
+    y el ritmo del stream se configuran desde `Settings`.
+    """
+
+    name = "fake"
+    model_name = "fake-deterministic"
+
+    # Cada carta es una combinación aleatoria de estas palabras: así las cartas no se parecen entre sí
+    # y pasan por el detector de casi-duplicados como lo harían las de la IA
+    WORDS = [
+        "cuñado", "tupper", "hipoteca", "reunión", "abuela", "gato", "Excel", "resaca", "influencer", "paella",
+        "siesta", "jefe", "vecino", "lunes", "bicicleta", "suegra", "karaoke", "dentista", "gimnasio", "croqueta",
+        "horóscopo", "impresora", "boda", "ascensor", "piscina", "becario", "tortilla", "calcetín", "podcast", "autobús",
+        "microondas", "contraseña", "sobremesa", "veterinario", "patinete", "churro", "funcionario", "cumpleaños", "wifi", "chancla",
+        "fontanero", "madrugada", "pelucón", "aspiradora", "bocadillo", "alcalde", "verbena", "pandereta", "selfie", "camarero",
+    ]
+    CONNECTORS = ["con", "sin", "de", "contra", "para", "y", "entre", "sobre"]
+
+    def __init__(self):
+        # Solo la latencia y los fallos son aleatorios; las cartas no dependen de este generador.
+        self._rng = random.Random(settings.FAKE_PROVIDER_RANDOM_SEED)
+
+    def _latency_seconds(self) -> float:
+        mean = settings.FAKE_PROVIDER_LATENCY_MS
+        spread = settings.FAKE_PROVIDER_LATENCY_SPREAD_MS
+        distribution = settings.FAKE_PROVIDER_LATENCY_DISTRIBUTION
+        if distribution == "uniform":
+            latency = self._rng.uniform(mean - spread, mean + spread)
+        elif distribution == "normal":
+            latency = self._rng.gauss(mean, spread)
+        elif distribution == "lognormal":
+            # Cola larga, como una API real: la mediana es `mean`
+            latency = mean * self._rng.lognormvariate(0, spread / mean if mean else 0)
+        else:
+            latency = mean
+        return max(latency, 0) / 1000
+
+    def _maybe_fail(self):
+        if self._rng.random() < settings.FAKE_PROVIDER_FAILURE_RATE:
+            raise FakeProviderError("Fallo simulado del proveedor falso.")
+
+    def _payload(self, request: GenerationRequest) -> str:
+        digest = hashlib.sha256(f"{request.system_instruction}|{request.prompt}|{request.seed}".encode("utf-8")).hexdigest()
+        rng = random.Random(digest)
+        cards = []
+        for _ in range(request.count):
+            first, second, third, fourth = rng.sample(self.WORDS, 4)
+            connector, other = rng.sample(self.CONNECTORS, 2)
+            if request.card_type == 'theme':
+                text = f"Mi {first} {connector} {second} acabó en ______ {other} {third} y {fourth}."
+            else:
+                text = f"{first[0].upper()}{first[1:]} {connector} {second} {other} {third}"
+            cards.append({"text": text})
+        if request.output_format == "lines":
+            return "\n".join(card["text"] for card in cards) + "\n"
+        return json.dumps({"cards": cards}, ensure_ascii=False)
+
+    @staticmethod
+    def _estimate_tokens(text: str) -> int:
+        # Aproximación habitual: unos 4 caracteres por token
+        return max(1, len(text) // 4)
+
+    async def generate(self, request: GenerationRequest, response_schema: type[BaseModel]) -> GenerationResult:
+        await asyncio.sleep(self._latency_seconds())
+        self._maybe_fail()
+        payload = self._payload(request)
+        return GenerationResult(payload, self._estimate_tokens(request.system_instruction + request.prompt), self._estimate_tokens(payload))
+
+    async def stream(self, request: GenerationRequest, response_schema: type[BaseModel]) -> AsyncIterator[GenerationResult]:
+        # La latencia inicial simula el tiempo hasta el primer token
+        await asyncio.sleep(self._latency_seconds())
+        self._maybe_fail()
+        payload = self._payload(request)
+        chunk_size = max(1, settings.FAKE_PROVIDER_STREAM_CHUNK_CHARS)
+        for start in range(0, len(payload), chunk_size):
+            if start:
+                await asyncio.sleep(settings.FAKE_PROVIDER_STREAM_DELAY_MS / 1000)
+            end = start + chunk_size
+            yield GenerationResult(
+                payload[start:end],
+                self._estimate_tokens(request.system_instruction + request.prompt),
+                self._estimate_tokens(payload[:end]),
+            )
+
+
+_PROVIDERS = {
+    "gemini": lambda: GeminiProvider(model_name=settings.GEMINI_MODEL_NAME),
+    "fake": FakeProvider,
+}
+
+
+def create_provider(name: str) -> GenerationProvider:
+    if name not in _PROVIDERS:
+        raise ValueError(f"Proveedor de generación desconocido: '{name}'. Opciones: {', '.join(_PROVIDERS)}")
+    logging.info(f"Usando el proveedor de generación de cartas '{name}'.")
+    return _PROVIDERS[name]()
+
+
+provider = create_provider(settings.GENERATION_PROVIDER)
@@ -0,0 +1,326 @@
+import logging
+import asyncio
+import heapq
+import itertools
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from sqlalchemy import exc
+
+from ..core.config import settings
+from ..db import models
+from ..db.database import SessionLocal
+from .websocket_manager import manager
+from . import metrics
+
+# Clases de prioridad: menor número, antes se atiende
+INTERACTIVE = "interactive" # Una sala bloqueada en "Generating"
+TOPUP = "topup"             # Recarga del mazo a mitad de partida
+REFILL = "refill"           # Reposición del pool de mazos en segundo plano
+PRIORITIES = {INTERACTIVE: 0, TOPUP: 1, REFILL: 2}
+
+# Clase del trabajo que se está ejecutando; las llamadas hechas fuera de la cola cuentan como interactivas
+current_kind: ContextVar[str] = ContextVar("generation_kind", default=INTERACTIVE)
+
+# Trabajos que se pueden reconstruir tras un reinicio a partir de su payload
+JobHandler = Callable[[dict], Awaitable]
+
+
+@dataclass
+class GenerationJob:
+    id: int
+    kind: str
+    topic_id: int
+    payload: dict
+    runner: Callable[[], Awaitable]
+    future: asyncio.Future
+    room_code: Optional[str] = None
+    dedupe_key: Optional[tuple] = None
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class PrioritySemaphore:
+    """
+    Límite de llamadas simultáneas al proveedor que, al quedar un hueco, se lo da a la clase más prioritaria.
+    Además `reserved` huecos son solo para INTERACTIVE: una reposición que se reparte en muchas
+    sub-peticiones no puede ocuparlos todos y dejar esperando a una sala.
+    """
+
+    def __init__(self, limit: int, reserved: int):
+        self.limit = max(1, limit)
+        self.reserved = max(0, min(reserved, self.limit - 1))
+        self._in_use = 0
+        # (prioridad, orden de llegada, clase, future)
+        self._waiters: List[Tuple[int, int, str, asyncio.Future]] = []
+        self._order = itertools.count()
+
+    def _can_take(self, kind: str) -> bool:
+        free = self.limit - self._in_use
+        return free > (0 if kind == INTERACTIVE else self.reserved)
+
+    def _drop_abandoned(self):
+        while self._waiters and self._waiters[0][3].done():
+            heapq.heappop(self._waiters)
+
+    @asynccontextmanager
+    async def slot(self, kind: Optional[str] = None):
+        kind = kind or current_kind.get()
+        priority = PRIORITIES.get(kind, PRIORITIES[INTERACTIVE])
+        self._drop_abandoned()
+        if self._can_take(kind) and (not self._waiters or self._waiters[0][0] > priority):
+            self._in_use += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (priority, next(self._order), kind, future))
+            metrics.generation_slot_waits.inc(kind=kind)
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # Se le dio el hueco justo cuando lo cancelaban: lo devolvemos
+                    self._release()
+                raise
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _release(self):
+        self._in_use -= 1
+        self._drop_abandoned()
+        while self._waiters and self._can_take(self._waiters[0][2]):
+            _, _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self._in_use += 1
+                future.set_result(None)
+            self._drop_abandoned()
+
+    def stats(self) -> dict:
+        waiting: Dict[str, int] = {}
+        for _, _, kind, future in self._waiters:
+            if not future.done():
+                waiting[kind] = waiting.get(kind, 0) + 1
+        return {"limit": self.limit, "reserved_interactive": self.reserved, "in_use": self._in_use, "waiting": waiting}
+
+
+class GenerationQueue:
+    """
+    Cola de trabajos de generación con un número fijo de workers y tres clases de prioridad.
+    `reserved` workers son solo para INTERACTIVE: recargas y reposiciones largas no pueden ocuparlos todos
+    mientras una sala espera para arrancar.
+    Dentro de cada clase los temas se atienden por turnos, para que uno con muchos trabajos no acapare la cola.
+    Los trabajos se guardan en la BD mientras están pendientes: tras un reinicio se recuperan las
+    reposiciones y recargas, y se descartan los interactivos (su sala ya no los espera).
+    """
+
+    def __init__(self, workers: int, reserved: int):
+        self.workers = max(1, workers)
+        self.reserved = max(0, min(reserved, self.workers - 1))
+        # Por prioridad: tema -> trabajos de ese tema en orden de llegada
+        self._queues: Dict[str, "OrderedDict[int, Deque[GenerationJob]]"] = {kind: OrderedDict() for kind in PRIORITIES}
+        self._handlers: Dict[str, JobHandler] = {}
+        self._dedupe_fields: Dict[str, Tuple[str, ...]] = {}
+        self._by_dedupe_key: Dict[tuple, GenerationJob] = {}
+        self._positions: Dict[int, int] = {}
+        self._wakeup = asyncio.Condition()
+        self._worker_tasks: List[asyncio.Task] = []
+        self.running = 0
+        self._background_running = 0
+        self.completed = 0
+        self.failed = 0
+        self.restored = 0
+
+    def register(self, kind: str, handler: JobHandler, dedupe_fields: Tuple[str, ...] = ()):
+        """
+        Registra cómo ejecutar un tipo de trabajo a partir de su payload.
+        Dos trabajos del mismo tipo con los mismos `dedupe_fields` en el payload se consideran el mismo.
+        """
+        self._handlers[kind] = handler
+        self._dedupe_fields[kind] = dedupe_fields
+
+    def _dedupe_key(self, kind: str, payload: dict) -> Optional[tuple]:
+        fields = self._dedupe_fields.get(kind)
+        return (kind,) + tuple(payload.get(name) for name in fields) if fields else None
+
+    def submit(self, kind: str, topic_id: int, payload: dict, runner: Optional[Callable[[], Awaitable]] = None,
+               room_code: Optional[str] = None) -> asyncio.Future:
+        """
+        Encola un trabajo y devuelve un future con su resultado.
+        Sin `runner` se usa el handler registrado para `kind`; si ya hay un trabajo igual pendiente
+        o en curso, se devuelve su future.
+        """
+        dedupe_key = self._dedupe_key(kind, payload) if runner is None else None
+        if dedupe_key is not None and dedupe_key in self._by_dedupe_key:
+            return self._by_dedupe_key[dedupe_key].future
+
+        job_id = self._persist(kind, topic_id, payload, room_code)
+        if runner is None:
+            handler = self._handlers[kind]
+            runner = lambda: handler(payload)
+        job = GenerationJob(
+            id=job_id, kind=kind, topic_id=topic_id, payload=payload, runner=runner,
+            future=asyncio.get_running_loop().create_future(), room_code=room_code, dedupe_key=dedupe_key
+        )
+        self._enqueue(job)
+        return job.future
+
+    def _enqueue(self, job: GenerationJob):
+        if job.dedupe_key is not None:
+            self._by_dedupe_key[job.dedupe_key] = job
+        self._queues[job.kind].setdefault(job.topic_id, deque()).append(job)
+        metrics.generation_queue_jobs.inc(kind=job.kind, event="queued")
+        self._ensure_workers()
+        asyncio.create_task(self._notify())
+        self._notify_positions()
+
+    async def _notify(self):
+        async with self._wakeup:
+            self._wakeup.notify()
+
+    def _next_job(self) -> Optional[GenerationJob]:
+        background_full = self._background_running >= self.workers - self.reserved
+        for kind in sorted(PRIORITIES, key=PRIORITIES.get):
+            topics = self._queues[kind]
+            if not topics or (kind != INTERACTIVE and background_full):
+                continue
+            if kind != INTERACTIVE:
+                self._background_running += 1
+            # Turno rotatorio: se atiende el primer tema y pasa al final de la fila
+            topic_id, jobs = next(iter(topics.items()))
+            job = jobs.popleft()
+            if jobs:
+                topics.move_to_end(topic_id)
+            else:
+                del topics[topic_id]
+            return job
+        return None
+
+    def _ensure_workers(self):
+        self._worker_tasks = [task for task in self._worker_tasks if not task.done()]
+        while len(self._worker_tasks) < self.workers:
+            self._worker_tasks.append(asyncio.create_task(self._worker()))
+
+    async def _worker(self):
+        while True:
+            async with self._wakeup:
+                job = self._next_job()
+                while job is None:
+                    await self._wakeup.wait()
+                    job = self._next_job()
+            self._notify_positions()
+            await self._run(job)
+
+    async def _run(self, job: GenerationJob):
+        self.running += 1
+        metrics.generation_queue_wait.observe(time.monotonic() - job.enqueued_at, kind=job.kind)
+        # Las llamadas al proveedor que haga el trabajo heredan su clase de prioridad
+        kind_token = current_kind.set(job.kind)
+        try:
+            result = await job.runner()
+            self.completed += 1
+            metrics.generation_queue_jobs.inc(kind=job.kind, event="completed")
+            if not job.future.done():
+                job.future.set_result(result)
+        except asyncio.CancelledError:
+            if not job.future.done():
+                job.future.cancel()
+            raise
+        except Exception as e:
+            self.failed += 1
+            metrics.generation_queue_jobs.inc(kind=job.kind, event="failed")
+            logging.warning(f"GEN-QUEUE: Falló el trabajo {job.id} ({job.kind}, tema {job.topic_id}): {e!r}")
+            if not job.future.done():
+                job.future.set_exception(e)
+            # Si nadie espera el resultado, evitamos el aviso de excepción no recuperada
+            job.future.exception()
+        finally:
+            current_kind.reset(kind_token)
+            self.running -= 1
+            if job.kind != INTERACTIVE:
+                self._background_running -= 1
+                # Queda sitio para un trabajo de fondo: despierta a un worker libre si hay alguno esperando
+                asyncio.create_task(self._notify())
+            if job.dedupe_key is not None:
+                self._by_dedupe_key.pop(job.dedupe_key, None)
+            self._delete(job.id)
+
+    def _notify_positions(self):
+        """Envía a cada sala que espera un trabajo interactivo su posición en la cola, si ha cambiado."""
+        position = 0
+        waiting = set()
+        for kind in sorted(PRIORITIES, key=PRIORITIES.get):
+            for jobs in self._queues[kind].values():
+                for job in jobs:
+                    position += 1
+                    if job.kind != INTERACTIVE or not job.room_code:
+                        continue
+                    waiting.add(job.id)
+                    if self._positions.get(job.id) != position:
+                        self._positions[job.id] = position
+                        asyncio.create_task(manager.broadcast(job.room_code, {
+                            "type": "generation_queue_update",
+                            "data": {"position": position, "running": self.running}
+                        }))
+        for job_id in set(self._positions) - waiting:
+            del self._positions[job_id]
+
+    # --- Persistencia ---
+
+    def _persist(self, kind: str, topic_id: int, payload: dict, room_code: Optional[str]) -> int:
+        with SessionLocal() as db:
+            job = models.GenerationJob(kind=kind, priority=PRIORITIES[kind], topic_id=topic_id, payload=payload, room_code=room_code)
+            db.add(job)
+            db.commit()
+            return job.id
+
+    def _delete(self, job_id: int):
+        with SessionLocal() as db:
+            try:
+                db.query(models.GenerationJob).filter(models.GenerationJob.id == job_id).delete()
+                db.commit()
+            except exc.SQLAlchemyError as e:
+                logging.error(f"GEN-QUEUE: Error de BD al borrar el trabajo {job_id}: {e}")
+                db.rollback()
+
+    def restore(self):
+        """Reencola los trabajos pendientes que quedaron en la BD al cerrarse la aplicación."""
+        with SessionLocal() as db:
+            pending = db.query(models.GenerationJob).order_by(models.GenerationJob.id).all()
+            for row in pending:
+                handler = self._handlers.get(row.kind)
+                if row.kind == INTERACTIVE or handler is None:
+                    db.delete(row)
+                    continue
+                job = GenerationJob(
+                    id=row.id, kind=row.kind, topic_id=row.topic_id, payload=row.payload,
+                    runner=(lambda h, p: lambda: h(p))(handler, row.payload),
+                    future=asyncio.get_running_loop().create_future(),
+                    dedupe_key=self._dedupe_key(row.kind, row.payload),
+                )
+                if job.dedupe_key is not None and job.dedupe_key in self._by_dedupe_key:
+                    db.delete(row)
+                    continue
+                self._enqueue(job)
+                self.restored += 1
+            db.commit()
+        if self.restored:
+            logging.info(f"GEN-QUEUE: {self.restored} trabajos pendientes recuperados de la BD.")
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "reserved_interactive": self.reserved,
+            "running": self.running,
+            "running_background": self._background_running,
+            "queued": {kind: sum(len(jobs) for jobs in topics.values()) for kind, topics in self._queues.items()},
+            "completed": self.completed,
+            "failed": self.failed,
+            "restored": self.restored,
+        }
+
+
+generation_queue = GenerationQueue(workers=settings.GENERATION_QUEUE_WORKERS, reserved=settings.GENERATION_QUEUE_INTERACTIVE_RESERVED_WORKERS)
@@ -0,0 +1,54 @@
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+
+class HandTracker:
+    """
+    Última mano enviada a cada jugador, con su versión, y qué manos han cambiado desde el último envío.
+    Las acciones declaran las manos que tocan; tras la acción solo esos jugadores reciben su mano,
+    y como diferencia (cartas añadidas y quitadas) respecto a la versión anterior.
+    """
+
+    def __init__(self):
+        # player_id -> (versión, {id de la entrada en la mano: carta tal y como se envió})
+        self._hands: Dict[int, Tuple[int, Dict[int, dict]]] = {}
+        self._changed: Dict[str, Set[int]] = defaultdict(set)
+
+    def mark_changed(self, room_code: str, player_ids: Iterable[int]):
+        self._changed[room_code].update(player_ids)
+
+    def take_changed(self, room_code: str) -> Set[int]:
+        return self._changed.pop(room_code, set())
+
+    def record_full(self, player_id: int, entries: List[dict]) -> int:
+        """Registra una mano enviada completa y devuelve su versión."""
+        version = self._hands[player_id][0] + 1 if player_id in self._hands else 1
+        self._hands[player_id] = (version, {entry["id"]: entry for entry in entries})
+        return version
+
+    def delta(self, player_id: int, entries: List[dict]) -> Optional[Tuple[int, int, List[dict], List[int]]]:
+        """
+        Diferencia con la última mano enviada: (versión base, versión nueva, añadidas, ids quitados).
+        None si nunca se envió la mano (hay que mandarla completa).
+        """
+        if player_id not in self._hands:
+            return None
+        version, previous = self._hands[player_id]
+        current = {entry["id"]: entry for entry in entries}
+        added = [entry for entry_id, entry in current.items() if entry_id not in previous]
+        removed = [entry_id for entry_id in previous if entry_id not in current]
+        if added or removed:
+            self._hands[player_id] = (version + 1, current)
+            return version, version + 1, added, removed
+        return version, version, [], []
+
+    def forget_player(self, player_id: int):
+        self._hands.pop(player_id, None)
+
+    def forget_room(self, room_code: str, player_ids: Iterable[int]):
+        self._changed.pop(room_code, None)
+        for player_id in player_ids:
+            self.forget_player(player_id)
+
+
+hand_tracker = HandTracker()
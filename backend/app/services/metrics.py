@@ -0,0 +1,162 @@
+import bisect
+from typing import Dict, List, Tuple
+
+LabelValues = Tuple[str, ...]
+
+DEFAULT_LATENCY_BUCKETS = (0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+
+
+class Counter:
+    def __init__(self, name: str, description: str, label_names: Tuple[str, ...]):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self) -> List[dict]:
+        return [{"labels": dict(zip(self.label_names, key)), "value": value} for key, value in self._values.items()]
+
+    def prometheus(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        for key, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, description: str, label_names: Tuple[str, ...], buckets: Tuple[float, ...] = DEFAULT_LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.buckets = tuple(sorted(buckets))
+        # Por combinación de etiquetas: [conteos por bucket (+inf al final), suma, número de observaciones]
+        self._values: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        series = self._values.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0, 0])
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def snapshot(self) -> List[dict]:
+        result = []
+        for key, (counts, total, count) in self._values.items():
+            result.append({
+                "labels": dict(zip(self.label_names, key)),
+                "count": count,
+                "sum": round(total, 4),
+                "avg": round(total / count, 4) if count else 0.0,
+                "buckets": dict(zip([str(b) for b in self.buckets] + ["+Inf"], counts)),
+            })
+        return result
+
+    def prometheus(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip([str(b) for b in self.buckets] + ["+Inf"], counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names + ('le',), key + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {count}")
+        return lines
+
+
+def _format_labels(names: Tuple[str, ...], values: LabelValues) -> str:
+    if not names:
+        return ""
+    escaped = [value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ") for value in values]
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+
+class MetricsRegistry:
+    """Registro en memoria de las métricas del proceso."""
+
+    def __init__(self):
+        self._metrics: Dict[str, Counter | Histogram] = {}
+
+    def counter(self, name: str, description: str, label_names: Tuple[str, ...] = ()) -> Counter:
+        return self._metrics.setdefault(name, Counter(name, description, label_names))
+
+    def histogram(self, name: str, description: str, label_names: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_LATENCY_BUCKETS) -> Histogram:
+        return self._metrics.setdefault(name, Histogram(name, description, label_names, buckets))
+
+    def snapshot(self) -> dict:
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+    def prometheus(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.prometheus())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+# --- Métricas de generación de cartas ---
+GENERATION_LABELS = ("topic", "personality", "card_type")
+
+generation_call_latency = registry.histogram(
+    "generation_call_latency_seconds", "Latencia de cada llamada al proveedor de IA.", GENERATION_LABELS)
+generation_batch_latency = registry.histogram(
+    "generation_batch_latency_seconds", "Latencia de generate_cards_for_topic de principio a fin.", GENERATION_LABELS)
+generation_prompt_tokens = registry.counter(
+    "generation_prompt_tokens_total", "Tokens de entrada según los metadatos de uso.", GENERATION_LABELS)
+generation_cached_prompt_tokens = registry.counter(
+    "generation_cached_prompt_tokens_total", "Tokens de entrada servidos desde la caché de contexto del proveedor.", GENERATION_LABELS)
+generation_response_tokens = registry.counter(
+    "generation_response_tokens_total", "Tokens de salida según los metadatos de uso.", GENERATION_LABELS)
+generation_cards_requested = registry.counter(
+    "generation_cards_requested_total", "Cartas pedidas a la IA.", GENERATION_LABELS)
+generation_cards_returned = registry.counter(
+    "generation_cards_returned_total", "Cartas válidas devueltas por la IA.", GENERATION_LABELS)
+generation_json_failures = registry.counter(
+    "generation_json_decode_failures_total", "Respuestas de la IA que no eran JSON válido.", GENERATION_LABELS)
+generation_cards_rejected = registry.counter(
+    "generation_cards_rejected_total", "Cartas generadas descartadas por la validación (blanks, length, duplicate, moderation).", GENERATION_LABELS + ("reason",))
+generation_placeholder_cards = registry.counter(
+    "generation_placeholder_cards_total", "Cartas de emergencia entregadas porque la IA falló.", GENERATION_LABELS)
+generation_cards_per_second = registry.histogram(
+    "generation_cards_per_second", "Cartas por segundo de cada lote generado.", GENERATION_LABELS,
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200))
+generation_context_cache_events = registry.counter(
+    "generation_context_cache_events_total", "Uso de la caché de contexto del proveedor (created, reused, failed, invalidated, evicted).", ("event",))
+generation_routing_decisions = registry.counter(
+    "generation_routing_decisions_total", "Modelo elegido por el enrutador para cada llamada (preferred, shifted, degraded).", ("tier", "model", "reason"))
+generation_model_calls = registry.counter(
+    "generation_model_calls_total", "Llamadas a cada modelo y su resultado.", ("model", "outcome"))
+generation_queue_jobs = registry.counter(
+    "generation_queue_jobs_total", "Trabajos de la cola de generación por tipo (queued, completed, failed).", ("kind", "event"))
+generation_queue_wait = registry.histogram(
+    "generation_queue_wait_seconds", "Tiempo que espera cada trabajo en la cola antes de ejecutarse.", ("kind",))
+generation_slot_waits = registry.counter(
+    "generation_slot_waits_total", "Llamadas al proveedor que esperaron un hueco libre, por clase de prioridad.", ("kind",))
+
+# --- Métricas de admisión de partidas ---
+start_admission_events = registry.counter(
+    "start_admission_events_total", "Arranques de partida admitidos, puestos en fila o rechazados (admitted, queued, shed).", ("event",))
+start_admission_wait = registry.histogram(
+    "start_admission_wait_seconds", "Tiempo en la fila de arranque antes de empezar a generar.")
+
+# --- Métricas de moderación ---
+moderation_rejections = registry.counter(
+    "moderation_rejections_total", "Cartas rechazadas por el filtro de contenido (generated, custom_theme).", ("source",))
+
+# --- Métricas de WebSockets ---
+websocket_send_queue_depth = registry.histogram(
+    "websocket_send_queue_depth", "Mensajes en la cola de salida de una conexión al encolar uno nuevo.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+websocket_frames_dropped = registry.counter(
+    "websocket_frames_dropped_total", "Mensajes de estado descartados porque había uno más nuevo en la cola.", ("type",))
+websocket_evictions = registry.counter(
+    "websocket_evictions_total", "Conexiones cerradas por el servidor (queue_full, send_timeout, send_failed).", ("reason",))
+broadcast_flushes = registry.counter(
+    "broadcast_flushes_total", "Envíos del estado de una sala (window, transition, immediate).", ("reason",))
+broadcasts_coalesced = registry.counter(
+    "broadcasts_coalesced_total", "Acciones cuyo envío de estado se sumó a uno ya programado.", ())
@@ -0,0 +1,134 @@
+import logging
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from ..core.config import settings
+from . import metrics
+
+INTERACTIVE, BACKGROUND = "interactive", "background"
+
+
+class ModelHealth:
+    """Latencias y errores recientes de un modelo, en una ventana de tiempo deslizante."""
+
+    def __init__(self, window_seconds: float):
+        self.window_seconds = window_seconds
+        # (instante, latencia, éxito)
+        self._samples: Deque[Tuple[float, float, bool]] = deque()
+
+    def record(self, latency: float, ok: bool):
+        self._samples.append((time.monotonic(), latency, ok))
+        self._trim()
+
+    def _trim(self):
+        # Las muestras antiguas caducan: un modelo degradado vuelve a probarse cuando su ventana se vacía
+        cutoff = time.monotonic() - self.window_seconds
+        while self._samples and self._samples[0][0] < cutoff:
+            self._samples.popleft()
+
+    def __len__(self):
+        self._trim()
+        return len(self._samples)
+
+    def error_rate(self) -> float:
+        self._trim()
+        if not self._samples:
+            return 0.0
+        return sum(1 for _, _, ok in self._samples if not ok) / len(self._samples)
+
+    def latency_percentile(self, q: float) -> Optional[float]:
+        self._trim()
+        latencies = sorted(latency for _, latency, ok in self._samples if ok)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+
+class ModelRouter:
+    """
+    Elige el modelo de cada llamada según su nivel: "interactive" (hay jugadores esperando)
+    o "background" (reposiciones del pool y recargas a mitad de partida).
+    Cada nivel tiene una lista de modelos por orden de preferencia; si el preferido se vuelve lento
+    o empieza a fallar, el tráfico pasa al siguiente sano hasta que se recupere.
+    """
+
+    def __init__(self, tiers: Dict[str, List[str]], window_seconds: float, min_samples: int,
+                 slow_seconds: float, max_error_rate: float, percentile: float):
+        self.tiers = tiers
+        self.window_seconds = window_seconds
+        self.min_samples = min_samples
+        self.slow_seconds = slow_seconds
+        self.max_error_rate = max_error_rate
+        self.percentile = percentile
+        self._health: Dict[str, ModelHealth] = {}
+        self._last_choice: Dict[str, str] = {}
+
+    def _model_health(self, model: str) -> ModelHealth:
+        return self._health.setdefault(model, ModelHealth(self.window_seconds))
+
+    def is_healthy(self, model: str) -> bool:
+        health = self._model_health(model)
+        if len(health) < self.min_samples:
+            # Sin datos suficientes damos el beneficio de la duda
+            return True
+        latency = health.latency_percentile(self.percentile)
+        return health.error_rate() <= self.max_error_rate and (latency is None or latency <= self.slow_seconds)
+
+    def _score(self, model: str) -> float:
+        """Menor es mejor: latencia penalizada por la tasa de error."""
+        health = self._model_health(model)
+        latency = health.latency_percentile(self.percentile) or self.slow_seconds
+        return latency * (1 + 10 * health.error_rate())
+
+    def choose(self, tier: str) -> str:
+        candidates = self.tiers.get(tier) or self.tiers[INTERACTIVE]
+        model = next((m for m in candidates if self.is_healthy(m)), None)
+        if model is None:
+            # Todos degradados: el menos malo
+            model, reason = min(candidates, key=self._score), "degraded"
+        else:
+            reason = "preferred" if model == candidates[0] else "shifted"
+
+        if self._last_choice.get(tier) != model:
+            if tier in self._last_choice:
+                logging.warning(f"MODEL-ROUTER: El nivel '{tier}' pasa de '{self._last_choice[tier]}' a '{model}' ({reason}).")
+            self._last_choice[tier] = model
+        metrics.generation_routing_decisions.inc(tier=tier, model=model, reason=reason)
+        return model
+
+    def record(self, model: str, latency: float, ok: bool):
+        self._model_health(model).record(latency, ok)
+        metrics.generation_model_calls.inc(model=model, outcome="success" if ok else "failure")
+
+    def stats(self) -> dict:
+        return {
+            "tiers": {tier: {"models": models, "current": self._last_choice.get(tier)} for tier, models in self.tiers.items()},
+            "models": {
+                model: {
+                    "samples": len(health),
+                    "error_rate": round(health.error_rate(), 3),
+                    "latency_percentile_seconds": health.latency_percentile(self.percentile),
+                    "healthy": self.is_healthy(model),
+                }
+                for model, health in self._health.items()
+            },
+        }
+
+
+def _model_list(value: str, default: str) -> List[str]:
+    models = [model.strip() for model in value.split(",") if model.strip()]
+    return models or [default]
+
+
+model_router = ModelRouter(
+    tiers={
+        INTERACTIVE: _model_list(settings.GENERATION_INTERACTIVE_MODELS, settings.GEMINI_MODEL_NAME),
+        BACKGROUND: _model_list(settings.GENERATION_BACKGROUND_MODELS, settings.GEMINI_MODEL_NAME),
+    },
+    window_seconds=settings.MODEL_ROUTER_WINDOW_SECONDS,
+    min_samples=settings.MODEL_ROUTER_MIN_SAMPLES,
+    slow_seconds=settings.MODEL_ROUTER_SLOW_SECONDS,
+    max_error_rate=settings.MODEL_ROUTER_MAX_ERROR_RATE,
+    percentile=settings.MODEL_ROUTER_LATENCY_PERCENTILE,
+)
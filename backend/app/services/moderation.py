@@ -0,0 +1,150 @@
+import logging
+from collections import Counter, deque
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from ..core.config import settings
+from .card_index import normalize_for_similarity
+from . import metrics
+
+BLOCK, ALLOW = "block", "allow"
+
+
+class AhoCorasick:
+    """
+    Autómata de Aho-Corasick: busca todos los patrones a la vez en una sola pasada por el texto,
+    sin importar cuántos haya. Se construye una vez al arrancar.
+    """
+
+    def __init__(self, patterns: Iterable[Tuple[str, tuple]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # Por estado: (longitud del patrón, etiqueta) de los patrones que terminan en él
+        self._out: List[List[Tuple[int, tuple]]] = [[]]
+        for pattern, label in patterns:
+            self._insert(pattern, label)
+        self._build_failure_links()
+
+    def _insert(self, pattern: str, label: tuple):
+        state = 0
+        for char in pattern:
+            if char not in self._goto[state]:
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+                self._goto[state][char] = len(self._goto) - 1
+            state = self._goto[state][char]
+        self._out[state].append((len(pattern), label))
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self._goto[state].items():
+                queue.append(child)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0) if state else 0
+                # Un estado también emite los patrones que terminan en su enlace de fallo
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def search(self, text: str) -> Iterator[Tuple[int, int, tuple]]:
+        """Devuelve (inicio, fin, etiqueta) de cada aparición de un patrón en el texto."""
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for length, label in out[state]:
+                yield position + 1 - length, position + 1, label
+
+    def __len__(self):
+        return len(self._goto)
+
+
+def _compile_term(term: str) -> Optional[str]:
+    """
+    Los términos se comparan con el texto normalizado (sin tildes ni mayúsculas) y por palabras completas.
+    Un "*" final convierte el término en prefijo: "idiot*" bloquea "idiota" e "idiotez".
+    """
+    prefix = term.strip().endswith("*")
+    normalized = normalize_for_similarity(term.strip().rstrip("*"))
+    if not normalized:
+        return None
+    return f" {normalized}" if prefix else f" {normalized} "
+
+
+class ContentFilter:
+    """
+    Filtro de contenido por lista de términos bloqueados y permitidos.
+    Un término bloqueado que aparece dentro de una frase permitida no cuenta.
+    """
+
+    def __init__(self, blocklist: Iterable[str], allowlist: Iterable[str]):
+        patterns = []
+        for kind, terms in ((BLOCK, blocklist), (ALLOW, allowlist)):
+            for term in terms:
+                compiled = _compile_term(term)
+                if compiled:
+                    patterns.append((compiled, (kind, term.strip())))
+        self.blocked_terms = sum(1 for _, (kind, _) in patterns if kind == BLOCK)
+        self._automaton = AhoCorasick(patterns)
+        self.checked = 0
+        self.rejected = 0
+        # Solo contadores: los textos rechazados y la sala en la que aparecieron se quedan en el log
+        self.rejected_by_source: Counter = Counter()
+
+    def check(self, text: str) -> Optional[str]:
+        """Devuelve el término bloqueado que aparece en el texto, o None si se puede usar."""
+        if not self.blocked_terms:
+            return None
+        blocked, allowed = [], []
+        for start, end, (kind, term) in self._automaton.search(f" {normalize_for_similarity(text)} "):
+            (blocked if kind == BLOCK else allowed).append((start, end, term))
+        for start, end, term in blocked:
+            if not any(a_start <= start and end <= a_end for a_start, a_end, _ in allowed):
+                return term
+        return None
+
+    def allows(self, text: str, source: str, labels: Optional[dict] = None) -> bool:
+        """Comprueba un texto y, si se rechaza, lo registra."""
+        if not settings.MODERATION_ENABLED:
+            return True
+        self.checked += 1
+        term = self.check(text)
+        if term is None:
+            return True
+        self.rejected += 1
+        self.rejected_by_source[source] += 1
+        logging.info(f"MODERACIÓN: Texto rechazado ({source}, término '{term}', {labels or {}}): {text!r}")
+        metrics.moderation_rejections.inc(source=source)
+        return False
+
+    def stats(self) -> dict:
+        return {
+            "enabled": settings.MODERATION_ENABLED,
+            "blocked_terms": self.blocked_terms,
+            "automaton_states": len(self._automaton),
+            "checked": self.checked,
+            "rejected": self.rejected,
+            "rejected_by_source": dict(self.rejected_by_source),
+        }
+
+
+def _load_terms(inline: str, path: str) -> List[str]:
+    terms = [term for term in inline.split(",") if term.strip()]
+    if path:
+        try:
+            lines = Path(path).read_text(encoding="utf-8").splitlines()
+            terms += [line for line in lines if line.strip() and not line.lstrip().startswith("#")]
+        except OSError as e:
+            logging.error(f"MODERATION: No se pudo leer la lista de términos '{path}': {e}")
+    return terms
+
+
+content_filter = ContentFilter(
+    blocklist=_load_terms(settings.MODERATION_BLOCKLIST, settings.MODERATION_BLOCKLIST_FILE),
+    allowlist=_load_terms(settings.MODERATION_ALLOWLIST, settings.MODERATION_ALLOWLIST_FILE),
+)
@@ -0,0 +1,190 @@
+import logging
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Optional, TypeVar
+
+from ..core.config import settings
+
+T = TypeVar("T")
+
+
+class CircuitBreaker:
+    """
+    Corta las llamadas a la IA tras varios errores (o llamadas demasiado lentas) seguidos.
+    Pasado `open_seconds` deja pasar una llamada de prueba: si va bien se cierra, si no vuelve a abrirse.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int, slow_call_seconds: float, open_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self.rejected_calls = 0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.open_seconds:
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        self.rejected_calls += 1
+        return False
+
+    def record_success(self, latency: float):
+        if latency > self.slow_call_seconds:
+            # Una respuesta demasiado lenta cuenta como fallo
+            self.record_failure()
+            return
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+        if self.state != self.CLOSED:
+            logging.info("BREAKER: La IA responde de nuevo. Circuito cerrado.")
+        self.state = self.CLOSED
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.times_opened += 1
+                logging.warning(f"BREAKER: Circuito abierto tras {self.consecutive_failures} fallos seguidos de la IA.")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened,
+            "rejected_calls": self.rejected_calls,
+        }
+
+
+class RetryBudget:
+    """
+    Presupuesto global de reintentos: cada petición original aporta `ratio` fichas y cada
+    reintento o petición duplicada gasta una. Así los reintentos no multiplican una caída.
+    """
+
+    def __init__(self, ratio: float, max_tokens: float):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self.spent = 0
+        self.denied = 0
+
+    def deposit(self):
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_spend(self, amount: int = 1) -> int:
+        """Gasta hasta `amount` fichas y devuelve cuántas se concedieron."""
+        granted = min(amount, int(self.tokens))
+        self.tokens -= granted
+        self.spent += granted
+        self.denied += amount - granted
+        return granted
+
+    def stats(self) -> dict:
+        return {"tokens": round(self.tokens, 2), "spent": self.spent, "denied": self.denied}
+
+
+class LatencyTracker:
+    """Ventana deslizante de latencias para estimar percentiles."""
+
+    def __init__(self, window: int):
+        self._samples: Deque[float] = deque(maxlen=window)
+
+    def record(self, latency: float):
+        self._samples.append(latency)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def __len__(self):
+        return len(self._samples)
+
+
+class Hedger:
+    """
+    Lanza una petición duplicada si la original supera el percentil configurado de latencia
+    y se queda con la primera que termine bien.
+    """
+
+    def __init__(self, latencies: LatencyTracker, budget: RetryBudget):
+        self.latencies = latencies
+        self.budget = budget
+        self.hedges_launched = 0
+        self.hedges_won = 0
+
+    def hedge_delay(self) -> Optional[float]:
+        if not settings.HEDGE_ENABLED or len(self.latencies) < settings.HEDGE_MIN_SAMPLES:
+            return None
+        return max(self.latencies.percentile(settings.HEDGE_PERCENTILE), settings.HEDGE_MIN_DELAY_SECONDS)
+
+    async def run(self, fn: Callable[[], Awaitable[T]]) -> T:
+        delay = self.hedge_delay()
+        primary = asyncio.create_task(fn())
+        if delay is None:
+            return await primary
+
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done or not self.budget.try_spend():
+            return await primary
+
+        self.hedges_launched += 1
+        logging.info(f"HEDGE: La petición supera {delay:.1f}s. Lanzando una petición duplicada.")
+        hedge = asyncio.create_task(fn())
+        pending = {primary, hedge}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.hedges_won += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "hedges_launched": self.hedges_launched,
+            "hedges_won": self.hedges_won,
+            "hedge_delay_seconds": self.hedge_delay(),
+        }
+
+
+circuit_breaker = CircuitBreaker(
+    failure_threshold=settings.CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+    slow_call_seconds=settings.CIRCUIT_BREAKER_SLOW_CALL_SECONDS,
+    open_seconds=settings.CIRCUIT_BREAKER_OPEN_SECONDS,
+)
+retry_budget = RetryBudget(ratio=settings.RETRY_BUDGET_RATIO, max_tokens=settings.RETRY_BUDGET_MAX_TOKENS)
+call_latencies = LatencyTracker(window=200)
+hedger = Hedger(call_latencies, retry_budget)
+
+
+def resilience_stats() -> dict:
+    return {
+        "circuit_breaker": circuit_breaker.stats(),
+        "retry_budget": retry_budget.stats(),
+        "hedging": hedger.stats(),
+    }
@@ -0,0 +1,111 @@
+import asyncio
+import random
+from typing import AsyncIterator, Awaitable, Callable, Dict, Hashable, List
+
+
+class SingleFlight:
+    """
+    Agrupa las llamadas idénticas que están en curso: la primera lanza la petición real
+    y las demás esperan su resultado en lugar de repetirla.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self._sizes: Dict[Hashable, int] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def do(self, key: Hashable, size: int, fn: Callable[[], Awaitable[List[str]]]) -> List[str]:
+        """
+        Ejecuta `fn` o se une a una llamada en curso con la misma clave que pida al menos `size` cartas.
+        Cada seguidor recibe una muestra aleatoria propia del resultado compartido.
+        """
+        task = self._calls.get(key)
+        if task is not None and self._sizes[key] >= size:
+            self.followers += 1
+            result = await asyncio.shield(task)
+            return _sample(result, size)
+
+        self.leaders += 1
+        task = asyncio.create_task(fn())
+        if key not in self._calls:
+            self._calls[key] = task
+            self._sizes[key] = size
+            task.add_done_callback(lambda _: self._forget(key, task))
+        return list(await asyncio.shield(task))
+
+    def stream(self, key: Hashable, size: int, fn: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """Igual que `do`, pero comparte un stream: los seguidores reciben lo ya emitido y lo que vaya llegando."""
+        shared = self._calls.get(key)
+        if isinstance(shared, _SharedStream) and self._sizes[key] >= size:
+            self.followers += 1
+            return shared.subscribe(size)
+
+        self.leaders += 1
+        shared = _SharedStream(fn())
+        if key not in self._calls:
+            self._calls[key] = shared
+            self._sizes[key] = size
+            shared.add_done_callback(lambda: self._forget(key, shared))
+        return shared.subscribe(size)
+
+    def _forget(self, key: Hashable, call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+            del self._sizes[key]
+
+    def stats(self) -> dict:
+        total = self.leaders + self.followers
+        return {
+            "upstream_calls": self.leaders,
+            "coalesced_calls": self.followers,
+            "coalesced_ratio": self.followers / total if total else 0.0,
+            "in_flight": len(self._calls),
+        }
+
+
+def _sample(result: List[str], size: int) -> List[str]:
+    return random.sample(result, min(size, len(result)))
+
+
+class _SharedStream:
+    """Stream con varios lectores: guarda lo emitido para los que se unen tarde."""
+
+    def __init__(self, source: AsyncIterator[str]):
+        self._items: List[str] = []
+        self._done = False
+        self._error: BaseException | None = None
+        self._condition = asyncio.Condition()
+        self._callbacks: List[Callable[[], None]] = []
+        self._task = asyncio.create_task(self._pump(source))
+
+    def add_done_callback(self, callback: Callable[[], None]):
+        self._callbacks.append(callback)
+
+    async def _pump(self, source: AsyncIterator[str]):
+        try:
+            async for item in source:
+                async with self._condition:
+                    self._items.append(item)
+                    self._condition.notify_all()
+        except Exception as e:
+            self._error = e
+        finally:
+            for callback in self._callbacks:
+                callback()
+            async with self._condition:
+                self._done = True
+                self._condition.notify_all()
+
+    async def subscribe(self, size: int) -> AsyncIterator[str]:
+        index = 0
+        while index < size:
+            async with self._condition:
+                await self._condition.wait_for(lambda: index < len(self._items) or self._done)
+                if index >= len(self._items):
+                    if self._error:
+                        raise self._error
+                    return
+                item = self._items[index]
+            index += 1
+            yield item
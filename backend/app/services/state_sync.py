@@ -0,0 +1,75 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def _escape(key: str) -> str:
+    return str(key).replace("~", "~0").replace("/", "~1")
+
+
+def json_diff(old: Any, new: Any, path: str = "") -> List[dict]:
+    """
+    Operaciones estilo JSON Patch (RFC 6902: add, remove, replace) que convierten `old` en `new`.
+    Las listas se comparan posición a posición; lo que sobra o falta al final se quita o se añade.
+    """
+    if type(old) is not type(new):
+        return [{"op": "replace", "path": path, "value": new}]
+
+    if isinstance(new, dict):
+        ops = []
+        for key in old.keys() - new.keys():
+            ops.append({"op": "remove", "path": f"{path}/{_escape(key)}"})
+        for key, value in new.items():
+            child = f"{path}/{_escape(key)}"
+            if key not in old:
+                ops.append({"op": "add", "path": child, "value": value})
+            else:
+                ops.extend(json_diff(old[key], value, child))
+        return ops
+
+    if isinstance(new, list):
+        ops = []
+        for index in range(min(len(old), len(new))):
+            ops.extend(json_diff(old[index], new[index], f"{path}/{index}"))
+        # Se quita desde el final para que los índices sigan siendo válidos
+        for index in range(len(old) - 1, len(new) - 1, -1):
+            ops.append({"op": "remove", "path": f"{path}/{index}"})
+        for index in range(len(old), len(new)):
+            ops.append({"op": "add", "path": f"{path}/{index}", "value": new[index]})
+        return ops
+
+    return [] if old == new else [{"op": "replace", "path": path, "value": new}]
+
+
+class RoomStateTracker:
+    """
+    Último estado enviado de cada sala y su versión, que sube en uno con cada cambio.
+    Con él, tras una acción solo se envía lo que ha cambiado respecto a la versión anterior.
+    """
+
+    def __init__(self):
+        self._states: Dict[str, Tuple[int, dict]] = {}
+
+    def publish(self, room_code: str, state: dict) -> Tuple[int, Optional[List[dict]]]:
+        """
+        Registra el estado actual. Devuelve (versión, operaciones respecto a la anterior);
+        las operaciones son None si no había estado previo y [] si nada ha cambiado.
+        """
+        previous = self._states.get(room_code)
+        if previous is None:
+            self._states[room_code] = (1, state)
+            return 1, None
+        version, old_state = previous
+        ops = json_diff(old_state, state)
+        if ops:
+            version += 1
+            self._states[room_code] = (version, state)
+        return version, ops
+
+    def latest(self, room_code: str) -> Optional[Tuple[int, dict]]:
+        """Último estado enviado de la sala con su versión, o None si aún no se ha enviado ninguno."""
+        return self._states.get(room_code)
+
+    def forget(self, room_code: str):
+        self._states.pop(room_code, None)
+
+
+room_states = RoomStateTracker()
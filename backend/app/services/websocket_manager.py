@@ -1,39 +1,182 @@
-from fastapi import WebSocket
-from typing import Dict, List, Tuple
+from fastapi import WebSocket, status
+from collections import Counter, deque
+from typing import Deque, Dict, List, Optional
+import asyncio
 import logging
-import json
+
+from ..core.config import settings
+from .frames import Frame, JSON, negotiate_subprotocol
+from . import metrics
+
+# Mensajes que llevan el estado completo: al encolar uno, sobran los que sigan en cola de los tipos que deja obsoletos
+SUPERSEDES = {
+    "game_state_update": {"game_state_update", "game_state_patch"},
+    "player_hand_update": {"player_hand_update", "player_hand_delta"},
+    "generation_queue_update": {"generation_queue_update"},
+    "start_queue_update": {"start_queue_update"},
+}
+
+
+class Connection:
+    """
+    Un socket con su propia cola de salida y una tarea que la va vaciando.
+    Así un cliente lento solo se retrasa a sí mismo: el broadcast encola y sigue.
+    """
+
+    def __init__(self, room_code: str, player_id: int, websocket: WebSocket, protocol: str, on_evict):
+        self.room_code = room_code
+        self.player_id = player_id
+        self.websocket = websocket
+        self.protocol = protocol
+        self._on_evict = on_evict
+        self._queue: Deque[Frame] = deque()
+        self._ready = asyncio.Event()
+        self._writer = asyncio.create_task(self._write_loop())
+        self.sent = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.closed = False
+        # Motivo por el que se cerró a un cliente lento; su jugador conserva el sitio para reconectar
+        self.evicted_for: Optional[str] = None
+
+    def enqueue(self, frame: Frame):
+        if self.closed:
+            return
+        if frame.type in SUPERSEDES:
+            stale = [queued for queued in self._queue if queued.type in SUPERSEDES[frame.type]]
+            for queued in stale:
+                self._queue.remove(queued)
+            if stale:
+                self.dropped += len(stale)
+                metrics.websocket_frames_dropped.inc(len(stale), type=frame.type)
+        if len(self._queue) >= settings.WS_SEND_QUEUE_MAX_FRAMES:
+            # Ni descartando estados viejos cabe: el cliente no da abasto
+            self.evict("queue_full")
+            return
+        self._queue.append(frame)
+        self.max_depth = max(self.max_depth, len(self._queue))
+        metrics.websocket_send_queue_depth.observe(len(self._queue))
+        self._ready.set()
+
+    async def _write_loop(self):
+        try:
+            while True:
+                await self._ready.wait()
+                self._ready.clear()
+                while self._queue:
+                    frame = self._queue.popleft()
+                    try:
+                        # La codificación se hace una vez por formato y la comparten todas las conexiones
+                        data = frame.encode(self.protocol)
+                    except Exception as e:
+                        # Un mensaje que no se puede codificar es un fallo nuestro, no del socket: se salta
+                        logging.error(f"WS-SEND: No se pudo codificar el mensaje '{frame.type}' para el jugador {self.player_id}: {e!r}", exc_info=True)
+                        continue
+                    send = self.websocket.send_bytes(data) if isinstance(data, bytes) else self.websocket.send_text(data)
+                    await asyncio.wait_for(send, settings.WS_SEND_TIMEOUT_SECONDS)
+                    self.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            self.evict("send_timeout")
+        except Exception as e:
+            # Fallo del socket: se cierra (por si no estaba muerto del todo) y el bucle de recepción
+            # del endpoint se encarga de la desconexión del jugador
+            logging.info(f"WS-SEND: No se pudo enviar al jugador {self.player_id} en la sala {self.room_code}: {e!r}")
+            self.stop()
+            self._on_evict(self, "send_failed")
+            asyncio.create_task(self._close(status.WS_1011_INTERNAL_ERROR, "Send failed"))
+
+    def evict(self, reason: str):
+        """Cierra la conexión de un cliente que se ha quedado atrás."""
+        if self.closed:
+            return
+        logging.warning(f"WS-SEND: Desconectando al jugador {self.player_id} de la sala {self.room_code} por ir lento ({reason}, {len(self._queue)} mensajes en cola).")
+        self.evicted_for = reason
+        self.stop()
+        self._on_evict(self, reason)
+        asyncio.create_task(self._close(status.WS_1013_TRY_AGAIN_LATER, "Client too slow"))
+
+    async def _close(self, code: int, reason: str):
+        try:
+            await self.websocket.close(code=code, reason=reason)
+        except Exception:
+            pass
+
+    def stop(self):
+        self.closed = True
+        self._queue.clear()
+        if self._writer is not asyncio.current_task():
+            self._writer.cancel()
+
+    @property
+    def queue_depth(self) -> int:
+        # No es `__len__`: una conexión con la cola vacía seguiría siendo falsa en los `if connection`
+        return len(self._queue)
+
 
 class ConnectionManager:
     def __init__(self):
-        # Asocia un room_code a una lista de tuplas (player_id, websocket)
-        self.active_connections: Dict[str, List[Tuple[int, WebSocket]]] = {}
+        # Asocia un room_code a la lista de conexiones (una por jugador conectado)
+        self.active_connections: Dict[str, List[Connection]] = {}
+        self.evicted = 0
 
-    async def connect(self, room_code: str, player_id: int, websocket: WebSocket):
-        await websocket.accept()
+    async def connect(self, room_code: str, player_id: int, websocket: WebSocket) -> Connection:
+        # El cliente puede pedir MessagePack con Sec-WebSocket-Protocol; si no, JSON
+        subprotocol = negotiate_subprotocol(websocket.scope.get("subprotocols", []), settings.WS_MSGPACK_ENABLED)
+        await websocket.accept(subprotocol=subprotocol)
         if room_code not in self.active_connections:
             self.active_connections[room_code] = []
-        self.active_connections[room_code].append((player_id, websocket))
+        connection = Connection(room_code, player_id, websocket, subprotocol or JSON, self._evict)
+        self.active_connections[room_code].append(connection)
         logging.info(f"Player {player_id} conectado a la sala {room_code}. Conexiones totales en sala: {len(self.active_connections[room_code])}")
+        return connection
 
     def disconnect(self, room_code: str, websocket: WebSocket):
         if room_code in self.active_connections:
-            connection_to_remove = next(((pid, ws) for pid, ws in self.active_connections[room_code] if ws == websocket), None)
+            connection_to_remove = next((conn for conn in self.active_connections[room_code] if conn.websocket == websocket), None)
             if connection_to_remove:
-                self.active_connections[room_code].remove(connection_to_remove)
-                logging.info(f"Player {connection_to_remove[0]} desconectado de la sala {room_code}.")
-                if not self.active_connections[room_code]:
-                    del self.active_connections[room_code]
+                connection_to_remove.stop()
+                self._remove(connection_to_remove)
+                logging.info(f"Player {connection_to_remove.player_id} desconectado de la sala {room_code}.")
+
+    def _remove(self, connection: Connection):
+        connections = self.active_connections.get(connection.room_code)
+        if connections and connection in connections:
+            connections.remove(connection)
+            if not connections:
+                del self.active_connections[connection.room_code]
+
+    def _evict(self, connection: Connection, reason: str):
+        self.evicted += 1
+        metrics.websocket_evictions.inc(reason=reason)
+        self._remove(connection)
 
     async def broadcast(self, room_code: str, message: dict):
-        if room_code in self.active_connections:
-            message_str = json.dumps(message)
-            for _, connection in self.active_connections[room_code]:
-                await connection.send_text(message_str)
+        # Un solo frame para toda la sala, encolado en cada conexión sin esperar a ninguna
+        frame = Frame(message)
+        for connection in list(self.active_connections.get(room_code, [])):
+            connection.enqueue(frame)
 
     async def send_to_player(self, room_code: str, player_id: int, message: dict):
-        if room_code in self.active_connections:
-            connection_info = next(((pid, ws) for pid, ws in self.active_connections[room_code] if pid == player_id), None)
-            if connection_info:
-                await connection_info[1].send_json(message)
+        connection = next((conn for conn in self.active_connections.get(room_code, []) if conn.player_id == player_id), None)
+        if connection:
+            connection.enqueue(Frame(message))
+
+    def is_connected(self, room_code: str, player_id: int) -> bool:
+        return any(conn.player_id == player_id for conn in self.active_connections.get(room_code, []))
+
+    def stats(self) -> dict:
+        connections = [conn for conns in self.active_connections.values() for conn in conns]
+        return {
+            "rooms": len(self.active_connections),
+            "connections": len(connections),
+            "queued_frames": sum(conn.queue_depth for conn in connections),
+            "max_queue_depth": max((conn.max_depth for conn in connections), default=0),
+            "by_protocol": dict(Counter(conn.protocol for conn in connections)),
+            "sent": sum(conn.sent for conn in connections),
+            "dropped": sum(conn.dropped for conn in connections),
+            "evicted": self.evicted,
+        }
 
-manager = ConnectionManager()
\ No newline at end of file
+manager = ConnectionManager()
@@ -14,6 +14,12 @@ from app.core.topic import DEFAULT_TOPICS
 from .db.database import engine, Base, SessionLocal
 from .db import crud
 from .core.config import settings
+from .services.deck_pool import deck_pool
+from .services.deck_forecast import deck_topup # Registra el handler de recargas antes de recuperar la cola
+from .services.generation_queue import generation_queue
+from .services.state_sync import room_states
+from .services.hand_sync import hand_tracker
+from .services.broadcast_scheduler import room_broadcasts
 
 
 # --- Tarea de limpieza ---
@@ -35,6 +41,9 @@ async def cleanup_old_rooms_task():
             if old_rooms:
                 logging.info(f"CRON: Se encontraron {len(old_rooms)} salas caducadas para eliminar.")
                 for room in old_rooms:
+                    room_states.forget(room.code)
+                    hand_tracker.forget_room(room.code, [player.id for player in room.players])
+                    room_broadcasts.forget(room.code)
                     db.delete(room)
                 db.commit()
                 logging.info("CRON: Salas caducadas eliminadas con éxito.")
@@ -103,6 +112,14 @@ async def lifespan(app: FastAPI):
     
     logging.info("Iniciando la tarea de limpieza de salas en segundo plano...")
     asyncio.create_task(cleanup_old_rooms_task())
+
+    if settings.DECK_POOL_ENABLED:
+        # Los pares se registran al usarse por primera vez: arrancar no genera nada
+        logging.info("Iniciando el pool de mazos pregenerados en segundo plano...")
+        asyncio.create_task(deck_pool.run())
+
+    # Los trabajos de generación pendientes al cerrar se recuperan de la BD
+    generation_queue.restore()
     
     yield
     logging.info("Cerrando aplicación.")
\ No newline at end of file
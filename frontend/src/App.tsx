@@ -30,6 +30,8 @@ const App: React.FC = () => {
     type: 'info' 
   });
   const [isLoading, setIsLoading] = useState<boolean>(false);
+  const [queuePosition, setQueuePosition] = useState<number | null>(null);
+  const [startQueue, setStartQueue] = useState<{ position: number; estimatedWaitSeconds: number } | null>(null);
   
   const { user, accessToken, isLoading: isAuthLoading, logout } = useAuth();
   // DEV HOOK
@@ -64,6 +66,8 @@ const App: React.FC = () => {
       setRoom(newRoomState);
 
       if (newRoomState.game_state !== 'Generating') {
+        setQueuePosition(null);
+        setStartQueue(null);
         const isGameView = newRoomState.game_state === 'InGame' || newRoomState.game_state === 'Finished';
         const newView = isGameView ? GameState.InGame : GameState.Lobby;
 
@@ -72,6 +76,14 @@ const App: React.FC = () => {
       }
     };
 
+    websocketService.onGenerationQueueUpdate = (position) => {
+      setQueuePosition(position);
+    };
+
+    websocketService.onStartQueueUpdate = (position, estimatedWaitSeconds) => {
+      setStartQueue(position > 0 ? { position, estimatedWaitSeconds } : null);
+    };
+
     websocketService.onPlayerHandUpdate = (hand) => {
       setMyHand(hand);
     };
@@ -192,8 +204,14 @@ const App: React.FC = () => {
       </main>
 
       {room?.game_state === 'Generating' && !dev.isDevMode && (
-        <div className="fixed inset-0 bg-slate-950/70 backdrop-blur-md flex items-center justify-center z-[100] animate-fade-in">
+        <div className="fixed inset-0 bg-slate-950/70 backdrop-blur-md flex flex-col items-center justify-center z-[100] animate-fade-in">
           <AIRobotLoader />
+          {startQueue !== null && (
+            <p className="mt-4 text-slate-300">Hay muchas partidas empezando: tu sala es la número {startQueue.position} en la fila (unos {startQueue.estimatedWaitSeconds} s).</p>
+          )}
+          {startQueue === null && queuePosition !== null && (
+            <p className="mt-4 text-slate-300">Hay mucha demanda: tu partida es la número {queuePosition} en la cola.</p>
+          )}
         </div>
       )}
 
@@ -0,0 +1,41 @@
+// Aplica operaciones estilo JSON Patch (add, remove, replace) como las que envía el backend
+// en `game_state_patch`. No modifica el documento original: devuelve una copia.
+
+export interface PatchOperation {
+  op: 'add' | 'remove' | 'replace';
+  path: string;
+  value?: unknown;
+}
+
+const unescapeSegment = (segment: string) => segment.replace(/~1/g, '/').replace(/~0/g, '~');
+
+export function applyPatch<T>(document: T, ops: PatchOperation[]): T {
+  let result: any = structuredClone(document);
+
+  for (const { op, path, value } of ops) {
+    const segments = path.split('/').slice(1).map(unescapeSegment);
+    if (segments.length === 0) {
+      result = value;
+      continue;
+    }
+
+    let parent: any = result;
+    for (const segment of segments.slice(0, -1)) {
+      parent = Array.isArray(parent) ? parent[Number(segment)] : parent[segment];
+    }
+    const last = segments[segments.length - 1];
+
+    if (Array.isArray(parent)) {
+      const index = Number(last);
+      if (op === 'remove') parent.splice(index, 1);
+      else if (op === 'add') parent.splice(index, 0, value);
+      else parent[index] = value;
+    } else if (op === 'remove') {
+      delete parent[last];
+    } else {
+      parent[last] = value;
+    }
+  }
+
+  return result as T;
+}
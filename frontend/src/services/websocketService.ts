@@ -1,5 +1,6 @@
-import { Room, PlayerHandCard } from '../types';
+import { Room, PlayerHandCard, PlayerHandDeltaMessage } from '../types';
 import { VITE_WS_BASE_URL } from './apiService';
+import { applyPatch } from './jsonPatch';
 
 // Definimos los tipos de acciones y sus payloads
 type WebSocketAction = 
@@ -9,30 +10,46 @@ type WebSocketAction =
   | 'submit_custom_theme'
   | 'play_card'
   | 'select_winners'
-  | 'start_next_round';
+  | 'start_next_round'
+  | 'sync_state';
 
 interface WebSocketPayloads {
-  set_game_settings: { topic_id: number; personality_id: number, total_rounds: number };
+  set_game_settings: { topic_id: number; personality_id: number, total_rounds: number, reuse_existing_cards?: boolean, reuse_same_personality?: boolean };
   start_game: {};
   choose_theme_card: {};
   submit_custom_theme: { text: string };
   play_card: { player_card_id: number };
   select_winners: { winner_ids: number[] };
   start_next_round: {};
+  sync_state: {};
 }
 
 class WebSocketService {
   private ws: WebSocket | null = null;
+  // Último estado completo recibido y su versión, para aplicar los parches del servidor
+  private roomState: Room | null = null;
+  private stateVersion = 0;
+  private syncRequested = false;
+  // Igual con la mano: última completa recibida y su versión, para aplicar las diferencias
+  private hand: PlayerHandCard[] | null = null;
+  private handVersion = 0;
 
   public onGameStateUpdate: (data: Room) => void = () => {};
   public onPlayerHandUpdate: (hand: PlayerHandCard[]) => void = () => {};
   public onError: (message: string) => void = () => {};
   public onRoomClosed: (message: string) => void = () => {};
+  public onGenerationQueueUpdate: (position: number) => void = () => {};
+  public onStartQueueUpdate: (position: number, estimatedWaitSeconds: number) => void = () => {};
 
   connect(roomCode: string, token: string) {
     if (this.ws) {
       this.disconnect();
     }
+    this.roomState = null;
+    this.stateVersion = 0;
+    this.syncRequested = false;
+    this.hand = null;
+    this.handVersion = 0;
     
     // 1. Usamos la variable de entorno para producción.
     // 2. Si no existe (estamos en local), construimos la URL localmente.
@@ -63,14 +80,32 @@ class WebSocketService {
       const message = JSON.parse(event.data);
       switch (message.type) {
         case 'game_state_update':
+          this.roomState = message.data;
+          this.stateVersion = message.version;
+          this.syncRequested = false;
           this.onGameStateUpdate(message.data);
           break;
+        case 'game_state_patch':
+          this.handleStatePatch(message);
+          break;
         case 'player_hand_update':
+          this.hand = message.data;
+          this.handVersion = message.version;
+          this.syncRequested = false;
           this.onPlayerHandUpdate(message.data);
           break;
+        case 'player_hand_delta':
+          this.handleHandDelta(message);
+          break;
         case 'error':
           this.onError(message.data.message);
           break;
+        case 'generation_queue_update':
+          this.onGenerationQueueUpdate(message.data.position);
+          break;
+        case 'start_queue_update':
+          this.onStartQueueUpdate(message.data.position, message.data.estimated_wait_seconds);
+          break;
         case 'room_closed':
           this.onRoomClosed(message.data.message);
           this.disconnect();
@@ -90,6 +125,40 @@ class WebSocketService {
     };
   }
 
+  private handleStatePatch(message: { base_version: number; version: number; data: any[] }) {
+    // Sin estado todavía: el estado completo llega justo después de conectarse
+    if (!this.roomState) return;
+    if (message.base_version !== this.stateVersion) {
+      // Nos hemos saltado alguna versión: pedimos el estado completo
+      this.requestSync(`Estado desincronizado (tenemos v${this.stateVersion}, el parche es sobre v${message.base_version}).`);
+      return;
+    }
+    this.roomState = applyPatch(this.roomState, message.data);
+    this.stateVersion = message.version;
+    this.onGameStateUpdate(this.roomState);
+  }
+
+  private handleHandDelta(message: PlayerHandDeltaMessage) {
+    // Sin mano todavía: la mano completa llega justo después de conectarse
+    if (!this.hand) return;
+    if (message.base_version !== this.handVersion) {
+      this.requestSync(`Mano desincronizada (tenemos v${this.handVersion}, la diferencia es sobre v${message.base_version}).`);
+      return;
+    }
+    const removed = new Set(message.data.removed);
+    this.hand = [...this.hand.filter((card) => !removed.has(card.id)), ...message.data.added];
+    this.handVersion = message.version;
+    this.onPlayerHandUpdate(this.hand);
+  }
+
+  private requestSync(reason: string) {
+    // Una sola petición hasta que llegue el estado completo (que trae también la mano)
+    if (this.syncRequested) return;
+    console.warn(reason);
+    this.syncRequested = true;
+    this.sendMessage('sync_state', {});
+  }
+
   disconnect() {
     if (this.ws) {
       this.ws.onclose = null;
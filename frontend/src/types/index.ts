@@ -77,6 +77,8 @@ export interface Room {
   round_winners: number[];
   total_rounds: number;
   current_round: number;
+  reuse_existing_cards: boolean;
+  reuse_same_personality: boolean;
 }
 
 export interface Personality {
@@ -88,5 +90,13 @@ export interface Personality {
 
 // --- Tipos para WebSockets ---
 export interface PlayerHandUpdateMessage {
+    version: number;
     data: PlayerHandCard[];
+}
+
+// Cambios en la mano respecto a la versión `base_version`
+export interface PlayerHandDeltaMessage {
+    base_version: number;
+    version: number;
+    data: { added: PlayerHandCard[]; removed: number[] };
 }
\ No newline at end of file